@@ -0,0 +1,211 @@
+"""
+Предрасчитанные агрегаты по пунктам чек-листа в дневных корзинах (analytics.json)
+"""
+import os
+import logging
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from .persistence import read_json, write_json
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_FILE = "analytics.json"
+# Ключи учтённых отчётов — по строке на отчёт, только дописываются
+SEEN_FILE = "analytics_seen.txt"
+FORMAT_VERSION = 2
+
+# day, order, block_id, item_id, duration_sec, failed, critical, bypassed
+Row = Tuple[str, str, str, str, float, bool, bool, bool]
+
+# Поля дневной корзины пункта: [count, timed, sum_sec, failed, bypassed]
+N, TIMED, SUM, FAILED, BYPASSED = range(5)
+
+def block_of(item_id: str) -> str:
+    """Блок пункта по его номеру: "3.2" -> "B3"."""
+    return "B" + item_id.split(".")[0]
+
+def to_float(v) -> float:
+    """Число или NaN, если значения нет (NaN не учитывается в суммах длительностей)"""
+    return float(v) if isinstance(v, (int, float)) else float("nan")
+
+def _duration(it: Dict[str, Any]) -> float:
+    """Длительность пункта: точная duration_ns, для старых архивов — duration_sec"""
+    ns = it.get("duration_ns")
+    return ns / 1e9 if isinstance(ns, int) else to_float(it.get("duration_sec"))
+
+def report_rows(report: Dict[str, Any]) -> Iterator[Row]:
+    """Строки по отмеченным пунктам отчёта finish_and_pdf (или архива sessions/*.json)"""
+    order = report.get("order", "")
+    session_day = (report.get("completed_at") or "")[:10]
+    for b in report.get("blocks", []):
+        for it in b.get("items", []):
+            if it.get("status") is None:
+                continue
+            item_id = it.get("id", "")
+            yield ((it.get("completed_at") or session_day)[:10], order,
+                   b.get("id") or block_of(item_id), item_id,
+                   _duration(it), it.get("status") is False,
+                   bool(it.get("critical")), bool(it.get("bypassed_by_master")))
+
+class AnalyticsStore:
+    """Статистика по пунктам, обновляемая по одному отчёту.
+
+    Для каждого дня и пункта хранится [count, timed, sum_sec, failed,
+    bypassed]; запрос за любой интервал дат складывает дневные корзины
+    и не читает историю и архивы сессий. Если файла ещё нет, он один
+    раз строится по архивам sessions/ (в фоне).
+
+    Учтённые отчёты (устройство#заказ#№) держатся в памяти множеством и
+    дописываются в SEEN_FILE, поэтому analytics.json растёт только с
+    числом дней и пунктов, а не с числом отчётов.
+    """
+
+    def __init__(self, base_dir: str, filename: str = ANALYTICS_FILE):
+        self.base_dir = base_dir
+        self.path = os.path.join(base_dir, filename)
+        self.seen_path = os.path.join(base_dir, SEEN_FILE)
+        self._lock = threading.Lock()
+        self._data: Optional[Dict[str, Any]] = None
+        self._seen: Set[str] = set()
+        # Отчёты, завершённые во время построения по архивам
+        self._pending: Optional[List[Tuple[Dict[str, Any], Optional[str]]]] = None
+
+    def _empty(self) -> Dict[str, Any]:
+        return {"version": FORMAT_VERSION, "items": {}, "days": {}}
+
+    def _load(self) -> Dict[str, Any]:
+        if self._data is None:
+            data = read_json(self.path, None)
+            if data is None or data.get("version") != FORMAT_VERSION:
+                self._data = self._empty()
+                self._seen = set()
+                self._start_backfill()
+            else:
+                self._data = data
+                self._seen = self._read_seen()
+        return self._data
+
+    def _start_backfill(self):
+        sessions_dir = os.path.join(self.base_dir, "sessions")
+        if os.path.isdir(sessions_dir):
+            self._pending = []
+            threading.Thread(target=self.rebuild_from_sessions, name="analytics-backfill", daemon=True).start()
+
+    def _read_seen(self) -> Set[str]:
+        try:
+            with open(self.seen_path, "r", encoding="utf-8") as f:
+                return {line.rstrip("\n") for line in f if line.strip()}
+        except FileNotFoundError:
+            return set()
+
+    def _write_seen(self, seen: Set[str]):
+        tmp = self.seen_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.writelines(f"{key}\n" for key in sorted(seen))
+        os.replace(tmp, self.seen_path)
+
+    @staticmethod
+    def report_key(report: Dict[str, Any], origin: Optional[str] = None) -> str:
+        """Устройство#заказ#№: авто-№ у каждого планшета свой, поэтому без устройства ключи совпадают"""
+        device = report.get("device") or origin or ""
+        return f"{device}#{report.get('order', '')}#{report.get('seq', '')}"
+
+    def _add(self, data: Dict[str, Any], seen: Set[str], report: Dict[str, Any], origin: Optional[str] = None) -> int:
+        key = self.report_key(report, origin)
+        if key in seen:
+            return 0
+        texts = {it.get("id"): it for b in report.get("blocks", []) for it in b.get("items", [])}
+        added = 0
+        for day, _order, block, item_id, duration, failed, critical, bypassed in report_rows(report):
+            meta = data["items"].setdefault(item_id, {"block": block, "text": "", "critical": False})
+            meta["text"] = texts.get(item_id, {}).get("text") or meta["text"]
+            meta["critical"] = meta["critical"] or critical
+            bucket = data["days"].setdefault(day, {}).setdefault(item_id, [0, 0, 0.0, 0, 0])
+            bucket[N] += 1
+            if duration == duration:
+                bucket[TIMED] += 1
+                bucket[SUM] += duration
+            bucket[FAILED] += failed
+            bucket[BYPASSED] += bypassed
+            added += 1
+        seen.add(key)
+        return added
+
+    def add_report(self, report: Dict[str, Any], origin: Optional[str] = None) -> int:
+        """Учесть завершённый отчёт; повторно тот же отчёт (устройство, заказ и №) не учитывается.
+
+        origin — устройство-источник для отчётов без поля device (полученных до его появления).
+        """
+        with self._lock:
+            data = self._load()
+            if self._pending is not None:
+                self._pending.append((report, origin))
+                return 0
+            added = self._add(data, self._seen, report, origin)
+            if added:
+                write_json(self.path, data)
+                with open(self.seen_path, "a", encoding="utf-8") as f:
+                    f.write(self.report_key(report, origin) + "\n")
+        logger.debug(f"Аналитика обновлена: {added} пунктов заказа {report.get('order')}")
+        return added
+
+    def rebuild_from_sessions(self):
+        """Однократное построение по архивам sessions/*.json"""
+        data, seen = self._empty(), set()
+        sessions_dir = os.path.join(self.base_dir, "sessions")
+        count = 0
+        with os.scandir(sessions_dir) as it:
+            for entry in it:
+                if entry.name.endswith(".json"):
+                    report = read_json(entry.path, None)
+                    if report:
+                        self._add(data, seen, report)
+                        count += 1
+        with self._lock:
+            for report, origin in self._pending or []:
+                self._add(data, seen, report, origin)
+            self._pending = None
+            self._data, self._seen = data, seen
+            self._write_seen(seen)
+            write_json(self.path, data)
+        logger.info(f"Аналитика построена по архивам: {count} сессий")
+
+    def days(self) -> List[str]:
+        return sorted(self._load()["days"])
+
+    def item_stats(self, date_from: str = "", date_to: str = "") -> List[Dict[str, Any]]:
+        """Статистика по пунктам за интервал дат (YYYY-MM-DD, включительно)"""
+        with self._lock:
+            data = self._load()
+            totals: Dict[str, List[float]] = {}
+            for day, items in data["days"].items():
+                if (date_from and day < date_from) or (date_to and day > date_to):
+                    continue
+                for item_id, bucket in items.items():
+                    t = totals.setdefault(item_id, [0, 0, 0.0, 0, 0])
+                    for i, v in enumerate(bucket):
+                        t[i] += v
+            meta = dict(data["items"])
+        rows = []
+        for item_id, t in totals.items():
+            m = meta.get(item_id, {})
+            rows.append({
+                "item": item_id,
+                "block": m.get("block"),
+                "text": m.get("text", ""),
+                "critical": m.get("critical", False),
+                "count": int(t[N]),
+                "avg_sec": round(t[SUM] / t[TIMED], 1) if t[TIMED] else None,
+                "failed": int(t[FAILED]),
+                "bypassed": int(t[BYPASSED]),
+                "fail_rate": round(t[FAILED] / t[N], 4) if t[N] else None,
+            })
+        rows.sort(key=lambda r: [int(p) if p.isdigit() else p for p in r["item"].split(".")])
+        return rows
+
+    def top_failed_critical(self, date_from: str = "", date_to: str = "", limit: int = 10) -> List[Dict[str, Any]]:
+        """Критические пункты, чаще всего отмеченные «✗»"""
+        rows = [r for r in self.item_stats(date_from, date_to) if r["critical"] and r["failed"]]
+        rows.sort(key=lambda r: (-r["failed"], -(r["fail_rate"] or 0)))
+        return rows[:limit]
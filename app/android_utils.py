@@ -1,9 +1,14 @@
-import os, time, logging
-from typing import Optional
+import os, logging
+from contextlib import contextmanager
+from concurrent.futures import Future, InvalidStateError
+from typing import Callable, Optional
+from kivy.clock import Clock
 from kivy.utils import platform
 
 logger = logging.getLogger(__name__)
 
+PHOTO_TIMEOUT_SEC = 20
+
 # SAF & camera
 if platform == "android":
     from android.permissions import request_permissions, Permission, check_permission
@@ -27,27 +32,55 @@ def ensure_permissions():
     logger.info("Разрешения запрошены")
     return True
 
-def take_photo_to(path:str)->Optional[str]:
+def _resolve(fut:Future, result)->bool:
+    """Завершить future, если его ещё не отменили/не завершили"""
+    try:
+        fut.set_result(result)
+        return True
+    except InvalidStateError:
+        return False
+
+def take_photo_async(path:str, on_done:Optional[Callable[[Future], None]]=None,
+                     timeout:float=PHOTO_TIMEOUT_SEC)->Future:
+    """Асинхронная съёмка фото в path.
+
+    Возвращает Future, который завершается путём к файлу или None
+    (нет камеры, ошибка, таймаут). Отмена — fut.cancel(). Колбек on_done
+    вызывается в главном потоке Kivy через Clock.
+    """
     logger.info(f"Попытка сделать фото и сохранить в: {path}")
+    fut = Future()
+    if on_done:
+        fut.add_done_callback(lambda f: Clock.schedule_once(lambda dt: on_done(f)))
     if platform != "android":
         logger.info("Платформа не Android, фото не доступно")
-        return None
+        _resolve(fut, None)
+        return fut
+
+    def on_timeout(dt):
+        if _resolve(fut, None):
+            logger.warning(f"Фото не было создано в течение {timeout} секунд")
+    timeout_ev = Clock.schedule_once(on_timeout, timeout)
+    fut.add_done_callback(lambda f: timeout_ev.cancel())
+
+    def on_complete(filename):
+        # Вызывается plyer по результату activity (не в главном потоке)
+        ok = os.path.exists(path)
+        if _resolve(fut, path if ok else None):
+            if ok:
+                logger.info(f"Фото успешно сохранено: {path}")
+            else:
+                logger.warning("Камера завершилась без файла фото")
+        # False — plyer не должен удалять файл
+        return False
+
     try:
-        camera.take_picture(filename=path, on_complete=lambda p: None)
+        camera.take_picture(filename=path, on_complete=on_complete)
         logger.info("Команда на съемку фото отправлена")
-        # простая задержка; в реальном проекте лучше колбек
-        t0 = time.time()
-        while not os.path.exists(path) and time.time()-t0 < 20: 
-            time.sleep(0.2)
-        if os.path.exists(path):
-            logger.info(f"Фото успешно сохранено: {path}")
-            return path
-        else:
-            logger.warning("Фото не было создано в течение 20 секунд")
-            return None
     except Exception as e:
         logger.error(f"Ошибка при съемке фото: {e}")
-        return None
+        _resolve(fut, None)
+    return fut
 
 def choose_saf_folder()->Optional[str]:
     logger.info("Выбор папки через SAF")
@@ -94,3 +127,13 @@ def write_bytes_to_saf(uri:str, data:bytes):
     except Exception as e:
         logger.error(f"Ошибка при записи данных в SAF файл: {e}")
         return False
+
+@contextmanager
+def open_saf_stream(uri:str):
+    """Файловый объект для потоковой записи в SAF-документ (Android)"""
+    if platform != "android":
+        raise RuntimeError("SAF доступен только на Android")
+    ss = SharedStorage()
+    with ss.open_document(uri, "w") as f:
+        yield f
+    logger.info(f"Поток записан в SAF файл: {uri}")
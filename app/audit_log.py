@@ -0,0 +1,425 @@
+"""
+Структурированный журнал аудита: JSON Lines, хэш-цепочка, сжатые сегменты и индекс
+"""
+import os
+import re
+import sys
+import gzip
+import json
+import shutil
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_MAX_BYTES = 1024 * 1024
+GENESIS_HASH = "0" * 64
+INDEX_FILE = "index.json"
+_SEGMENT_RE = re.compile(r"^audit-(\d{6})\.jsonl(\.gz)?$")
+
+def _segment_name(no: int, sealed: bool) -> str:
+    return f"audit-{no:06d}.jsonl" + (".gz" if sealed else "")
+
+def record_hash(record: Dict[str, Any]) -> str:
+    """SHA-256 от канонического JSON записи без поля hash (prev входит в хэш)"""
+    body = {k: v for k, v in record.items() if k != "hash"}
+    payload = json.dumps(body, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class _SegmentIndex:
+    """Смещения записей одного сегмента по заказу и типу события"""
+
+    def __init__(self, data: Optional[Dict] = None):
+        data = data or {}
+        self.orders: Dict[str, List[int]] = data.get("orders", {})
+        self.types: Dict[str, List[int]] = data.get("types", {})
+        self.first_seq: Optional[int] = data.get("first_seq")
+        self.last_seq: Optional[int] = data.get("last_seq")
+        self.first_ts: Optional[str] = data.get("first_ts")
+        self.last_ts: Optional[str] = data.get("last_ts")
+        self.last_hash: Optional[str] = data.get("last_hash")
+
+    def add(self, record: Dict[str, Any], offset: int):
+        if record.get("order"):
+            self.orders.setdefault(record["order"], []).append(offset)
+        self.types.setdefault(record["type"], []).append(offset)
+        if self.first_seq is None:
+            self.first_seq, self.first_ts = record["seq"], record["ts"]
+        self.last_seq, self.last_ts, self.last_hash = record["seq"], record["ts"], record["hash"]
+
+    def offsets(self, order: Optional[str], event_type: Optional[str]) -> Optional[List[int]]:
+        """Смещения по фильтру; None — фильтра нет (нужен полный просмотр)"""
+        result = None
+        if order is not None:
+            result = self.orders.get(order, [])
+        if event_type is not None:
+            by_type = self.types.get(event_type, [])
+            result = by_type if result is None else sorted(set(result) & set(by_type))
+        return result
+
+    def to_dict(self) -> Dict:
+        return {"orders": self.orders, "types": self.types,
+                "first_seq": self.first_seq, "last_seq": self.last_seq,
+                "first_ts": self.first_ts, "last_ts": self.last_ts, "last_hash": self.last_hash}
+
+class AuditLog:
+    """Журнал аудита в каталоге directory.
+
+    Активный сегмент audit-NNNNNN.jsonl дописывается построчно; при
+    превышении segment_max_bytes он сжимается в .jsonl.gz, а его индекс
+    переносится в общий index.json. Каждая запись содержит хэш
+    предыдущей (prev) и собственный хэш, поэтому правка или удаление
+    строки обнаруживается verify(). Сжатие идёт в фоновом потоке, пока
+    сегмент не сжат, он читается из .jsonl.
+
+    read_only=True — для проверки и отчётов по скопированным каталогам:
+    на диске ничего не меняется, недописанный хвост только учитывается
+    в torn_bytes, а в append() запись запрещена.
+    """
+
+    def __init__(self, directory: str, segment_max_bytes: int = SEGMENT_MAX_BYTES, read_only: bool = False):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.read_only = read_only
+        self.torn_bytes = 0
+        self._lock = threading.Lock()
+        self._sealed: Dict[int, _SegmentIndex] = {}
+        # Закрытые сегменты, которые сжимаются в фоне
+        self._rotating: Dict[int, _SegmentIndex] = {}
+        self._sealers: List[threading.Thread] = []
+        self._seal_lock = threading.Lock()  # сжатие и запись index.json — по одному сегменту
+        self._active_no = 1
+        self._active = _SegmentIndex()
+        self._active_size = 0
+        self._seq = 0
+        self._prev_hash = GENESIS_HASH
+        self._fh = None
+        self._load()
+
+    # ---- состояние на диске
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _load(self):
+        if not self.read_only:
+            os.makedirs(self.directory, exist_ok=True)
+        elif not os.path.isdir(self.directory):
+            raise FileNotFoundError(f"Каталог аудита не найден: {self.directory}")
+        dirty = False
+        try:
+            with open(self._path(INDEX_FILE), "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._sealed = {int(no): _SegmentIndex(d) for no, d in data.get("segments", {}).items()}
+        except FileNotFoundError:
+            # Индекса нет, а сжатые сегменты могут быть: без них новые сегменты перезаписали бы старые
+            self._sealed = self._rebuild_sealed_index()
+            if self._sealed:
+                logger.error("Индекс аудита отсутствует, перестроен по сжатым сегментам")
+                dirty = True
+        except Exception as e:
+            logger.error(f"Индекс аудита повреждён, перестраиваем: {e}")
+            self._sealed = self._rebuild_sealed_index()
+            dirty = True
+
+        sealed_nos, plain_nos = set(), set()
+        for name in os.listdir(self.directory):
+            m = _SEGMENT_RE.match(name)
+            if m:
+                (sealed_nos if m.group(2) else plain_nos).add(int(m.group(1)))
+        # Сегменты, сжатые до сбоя, но не попавшие в индекс
+        for no in sorted(sealed_nos - set(self._sealed)):
+            self._sealed[no] = self._scan_segment(no, True)
+            dirty = True
+        # Несжатые копии уже сжатых сегментов (.gz появляется только целиком)
+        for no in plain_nos & set(self._sealed):
+            if not self.read_only:
+                os.remove(self._path(_segment_name(no, False)))
+        plain = sorted(plain_nos - set(self._sealed))
+        self._active_no = max([max(self._sealed, default=0) + 1] + plain[-1:])
+        # Закрытые, но не сжатые до сбоя сегменты читаются как есть и сжимаются заново
+        for no in plain:
+            if no < self._active_no:
+                self._rotating[no] = self._scan_segment(no, False)
+
+        path = self._path(_segment_name(self._active_no, False))
+        if os.path.exists(path):
+            if self.read_only:
+                size = os.path.getsize(path)
+                self._active_size = self._complete_size(path)
+                self.torn_bytes = size - self._active_size
+                if self.torn_bytes:
+                    logger.warning(f"Аудит: недописанная запись в {os.path.basename(path)} "
+                                   f"({self.torn_bytes} байт), файл не изменён")
+            else:
+                self._active_size = self._drop_torn_tail(path)
+            self._active = self._scan_segment(self._active_no, False)
+
+        for _, _, idx in reversed(self._segments()):
+            if idx.last_seq is not None:
+                self._seq, self._prev_hash = idx.last_seq, idx.last_hash or GENESIS_HASH
+                break
+        if not self.read_only:
+            if dirty:
+                self._write_index()
+            for no in sorted(self._rotating):
+                self._start_seal(no)
+
+    @staticmethod
+    def _complete_size(path: str) -> int:
+        """Размер файла без недописанной последней строки"""
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            pos = size
+            while pos > 0:
+                step = min(4096, pos)
+                f.seek(pos - step)
+                chunk = f.read(step)
+                if pos == size and chunk.endswith(b"\n"):
+                    return size
+                i = chunk.rfind(b"\n")
+                if i != -1:
+                    return pos - step + i + 1
+                pos -= step
+        return 0
+
+    @classmethod
+    def _drop_torn_tail(cls, path: str) -> int:
+        """Отрезать недописанную последнюю строку (сбой во время записи); возвращает размер файла.
+
+        Иначе следующая запись приклеилась бы к обрывку и обе строки
+        стали бы нечитаемыми.
+        """
+        size = os.path.getsize(path)
+        pos = cls._complete_size(path)
+        if pos == size:
+            return size
+        with open(path, "rb+") as f:
+            f.truncate(pos)
+        logger.warning(f"Аудит: отрезана недописанная запись в {os.path.basename(path)} ({size - pos} байт)")
+        return pos
+
+    def _rebuild_sealed_index(self) -> Dict[int, _SegmentIndex]:
+        sealed = {}
+        for name in os.listdir(self.directory):
+            m = _SEGMENT_RE.match(name)
+            if m and m.group(2):
+                sealed[int(m.group(1))] = self._scan_segment(int(m.group(1)), True)
+        return sealed
+
+    def _open_segment(self, no: int, sealed: bool):
+        if not sealed:
+            try:
+                return open(self._path(_segment_name(no, False)), "rb")
+            except FileNotFoundError:
+                pass  # сегмент успели сжать
+        return gzip.open(self._path(_segment_name(no, True)), "rb")
+
+    def _scan_segment(self, no: int, sealed: bool) -> _SegmentIndex:
+        index = _SegmentIndex()
+        with self._open_segment(no, sealed) as f:
+            offset = 0
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # недописанная строка
+                try:
+                    index.add(json.loads(line), offset)
+                except ValueError:
+                    logger.error(f"Повреждённая запись аудита в сегменте {no} по смещению {offset}")
+                offset += len(line)
+        return index
+
+    def _write_index(self, sealed: Optional[Dict[int, _SegmentIndex]] = None):
+        sealed = self._sealed if sealed is None else sealed
+        tmp = self._path(INDEX_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"segments": {str(no): idx.to_dict() for no, idx in sorted(sealed.items())}},
+                      f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, self._path(INDEX_FILE))
+
+    def _rotate(self):
+        """Закрыть активный сегмент и начать новый (под блокировкой); сжатие — в фоне"""
+        if self._fh:
+            self._fh.close()
+            self._fh = None
+        no = self._active_no
+        self._rotating[no] = self._active
+        self._active_no += 1
+        self._active = _SegmentIndex()
+        self._active_size = 0
+        self._start_seal(no)
+
+    def _start_seal(self, no: int):
+        thread = threading.Thread(target=self._seal, args=(no,), name=f"audit-seal-{no}", daemon=True)
+        self._sealers = [t for t in self._sealers if t.is_alive()] + [thread]
+        thread.start()
+
+    def _seal(self, no: int):
+        """Сжать сегмент в .jsonl.gz и перенести его индекс в index.json"""
+        with self._seal_lock:
+            self._seal_locked(no)
+
+    def _seal_locked(self, no: int):
+        src = self._path(_segment_name(no, False))
+        dst = self._path(_segment_name(no, True))
+        try:
+            if os.path.exists(dst):
+                raise FileExistsError(f"Сжатый сегмент аудита {no} уже существует")
+            with open(src, "rb") as fin, gzip.open(dst + ".tmp", "wb") as fout:
+                shutil.copyfileobj(fin, fout)
+            os.replace(dst + ".tmp", dst)
+        except Exception as e:
+            # Сегмент остаётся несжатым и читается как есть; повтор при следующем открытии
+            logger.error(f"Сегмент аудита {no} не сжат: {e}")
+            return
+        with self._lock:
+            self._sealed[no] = self._rotating.pop(no)
+            sealed = dict(self._sealed)
+        # Индекс пишется вне self._lock, чтобы не задерживать append()
+        self._write_index(sealed)
+        os.remove(src)
+        logger.info(f"Сегмент аудита {no} сжат")
+
+    # ---- запись
+
+    def append(self, event_type: str, order: Optional[str] = None, **data) -> Dict[str, Any]:
+        """Добавить событие; возвращает записанную запись"""
+        if self.read_only:
+            raise RuntimeError("Журнал аудита открыт только для чтения")
+        with self._lock:
+            record = {
+                "seq": self._seq + 1,
+                "ts": datetime.now().isoformat(timespec="milliseconds"),
+                "type": event_type,
+                "order": order,
+                "data": data,
+                "prev": self._prev_hash,
+            }
+            record["hash"] = record_hash(record)
+            line = (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+            if self._fh is None:
+                self._fh = open(self._path(_segment_name(self._active_no, False)), "ab")
+            self._fh.write(line)
+            self._fh.flush()
+            self._active.add(record, self._active_size)
+            self._active_size += len(line)
+            self._seq, self._prev_hash = record["seq"], record["hash"]
+            if self._active_size >= self.segment_max_bytes:
+                self._rotate()
+            return record
+
+    def close(self):
+        """Закрыть файл и дождаться фонового сжатия"""
+        with self._lock:
+            if self._fh:
+                self._fh.close()
+                self._fh = None
+            sealers = list(self._sealers)
+        for thread in sealers:
+            thread.join()
+
+    # ---- чтение
+
+    def _segments(self) -> List[Tuple[int, bool, _SegmentIndex]]:
+        segs = sorted([(no, True, idx) for no, idx in self._sealed.items()]
+                      + [(no, False, idx) for no, idx in self._rotating.items()], key=lambda s: s[0])
+        if self._active.last_seq is not None:
+            segs.append((self._active_no, False, self._active))
+        return segs
+
+    def query(self, order: Optional[str] = None, event_type: Optional[str] = None,
+              since: Optional[str] = None, until: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """События по заказу и/или типу в порядке записи; since/until — ISO-время"""
+        for record in self._records(order, event_type, since, until):
+            if record is not None:
+                yield record
+
+    def _records(self, order: Optional[str] = None, event_type: Optional[str] = None,
+                 since: Optional[str] = None, until: Optional[str] = None) -> Iterator[Optional[Dict[str, Any]]]:
+        """Как query(), но вместо нечитаемой строки выдаёт None"""
+        with self._lock:
+            if self._fh:
+                self._fh.flush()
+            segments = self._segments()
+        for no, sealed, idx in segments:
+            if since and idx.last_ts and idx.last_ts < since:
+                continue
+            if until and idx.first_ts and idx.first_ts[:len(until)] > until:
+                continue
+            offsets = idx.offsets(order, event_type)
+            if offsets is not None and not offsets:
+                continue
+            with self._open_segment(no, sealed) as f:
+                lines = self._read_at(f, offsets) if offsets is not None else f
+                for line in lines:
+                    if not line.endswith(b"\n"):
+                        continue  # недописанная строка (пишется сейчас или оборвана сбоем)
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        logger.error(f"Нечитаемая запись аудита в сегменте {no}")
+                        yield None
+                        continue
+                    if since and record["ts"] < since:
+                        continue
+                    if until and record["ts"][:len(until)] > until:
+                        continue
+                    if order is not None and record.get("order") != order:
+                        continue
+                    if event_type is not None and record["type"] != event_type:
+                        continue
+                    yield record
+
+    @staticmethod
+    def _read_at(f, offsets: List[int]) -> Iterator[bytes]:
+        for offset in offsets:
+            f.seek(offset)
+            yield f.readline()
+
+    def iter_all(self) -> Iterator[Dict[str, Any]]:
+        return self.query()
+
+    def verify(self) -> Tuple[bool, Optional[int]]:
+        """Проверить хэш-цепочку; (True, None) или (False, seq первой испорченной записи)"""
+        prev, expected_seq = GENESIS_HASH, None
+        for record in self._records():
+            if record is None:
+                return False, expected_seq or 1
+            if record.get("prev") != prev or record_hash(record) != record.get("hash"):
+                return False, record.get("seq")
+            if expected_seq is not None and record["seq"] != expected_seq:
+                return False, expected_seq
+            prev, expected_seq = record["hash"], record["seq"] + 1
+        return True, None
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Запросы к журналу аудита CNC Checklist")
+    parser.add_argument("directory", help="Каталог audit/ из user_data_dir")
+    parser.add_argument("--order", help="Номер заказа")
+    parser.add_argument("--type", dest="event_type", help="Тип события, например MASTER_BYPASS")
+    parser.add_argument("--since", help="С момента (ISO, например 2025-01-01)")
+    parser.add_argument("--until", help="По момент (ISO)")
+    parser.add_argument("--verify", action="store_true", help="Проверить хэш-цепочку")
+    args = parser.parse_args(argv)
+
+    try:
+        log = AuditLog(args.directory, read_only=True)
+    except FileNotFoundError as e:
+        print(e, file=sys.stderr)
+        return 2
+    if log.torn_bytes:
+        print(f"Недописанная последняя запись: {log.torn_bytes} байт (не проверяется)", file=sys.stderr)
+    if args.verify:
+        ok, seq = log.verify()
+        print("Цепочка цела" if ok else f"Цепочка нарушена на записи {seq}")
+        return 0 if ok else 1
+    for record in log.query(args.order, args.event_type, args.since, args.until):
+        print(json.dumps(record, ensure_ascii=False))
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,103 @@
+"""
+Диагностический пакет: один ZIP с диагностикой, метриками, логами, аудитом и состоянием, записываемый потоком
+"""
+import io
+import os
+import json
+import time
+import shutil
+import zipfile
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from .log_reader import rotated_files
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+LOG_FILE = "cnc_checklist.log"
+STATE_FILES = ("session.json", "history.jsonl", "startup_report.json")
+REDACTED = "***"
+# Поля настроек, которые не должны покидать планшет
+SECRET_SETTINGS = ("admin_pin_hash", "master_pin_hash", "smtp_pass_app", "smtp_user", "sync_token")
+# Уже сжатые файлы кладутся без повторного сжатия
+_STORED_EXTS = (".gz", ".zip", ".jpg", ".jpeg", ".png", ".pdf")
+
+def redact_settings(settings: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: (REDACTED if k in SECRET_SETTINGS and v else v) for k, v in settings.items()}
+
+class DiagnosticsBundle:
+    """ZIP-архив, который пишется в произвольный файловый объект (в том числе
+    неперематываемый поток SAF).
+
+    Файлы копируются блоками по CHUNK_SIZE, JSON сериализуется по частям
+    через json.dump, так что ни один файл не загружается в память
+    целиком. manifest.json в конце перечисляет содержимое.
+    """
+
+    def __init__(self, fileobj, compresslevel: int = 6):
+        self.zip = zipfile.ZipFile(fileobj, "w", zipfile.ZIP_DEFLATED, compresslevel=compresslevel)
+        self.entries: List[Dict[str, Any]] = []
+
+    def add_file(self, path: str, arcname: str) -> bool:
+        """Добавить файл с диска; False — файла нет или он недоступен"""
+        try:
+            info = zipfile.ZipInfo.from_file(path, arcname)
+        except OSError:
+            return False
+        info.compress_type = zipfile.ZIP_STORED if path.lower().endswith(_STORED_EXTS) else zipfile.ZIP_DEFLATED
+        try:
+            with open(path, "rb") as src, self.zip.open(info, "w", force_zip64=True) as dst:
+                shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        except OSError as e:
+            logger.warning(f"Файл {path} не добавлен в пакет: {e}")
+            return False
+        self.entries.append({"name": arcname, "size": info.file_size})
+        return True
+
+    def add_json(self, arcname: str, data: Any):
+        info = zipfile.ZipInfo(arcname, time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED
+        with self.zip.open(info, "w", force_zip64=True) as raw:
+            with io.TextIOWrapper(raw, encoding="utf-8", write_through=True) as text:
+                json.dump(data, text, ensure_ascii=False, default=str)
+            size = info.file_size
+        self.entries.append({"name": arcname, "size": size})
+
+    def add_dir(self, directory: str, prefix: str):
+        """Все файлы каталога (без подкаталогов) в порядке имён"""
+        try:
+            names = sorted(e.name for e in os.scandir(directory) if e.is_file())
+        except OSError:
+            return
+        for name in names:
+            self.add_file(os.path.join(directory, name), f"{prefix}/{name}")
+
+    def close(self):
+        self.add_json("manifest.json", {"created_at": datetime.now().isoformat(), "files": self.entries})
+        self.zip.close()
+
+def write_bundle(fileobj, base_dir: str, diagnostics: Dict[str, Any], metrics: Optional[Dict[str, Any]] = None,
+                 trace: Optional[Dict[str, Any]] = None, settings: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Записать полный диагностический пакет в fileobj; возвращает список файлов пакета"""
+    t0 = time.perf_counter()
+    bundle = DiagnosticsBundle(fileobj)
+    bundle.add_json("diagnostics.json", diagnostics)
+    if metrics is not None:
+        bundle.add_json("performance_metrics.json", metrics)
+    if trace is not None:
+        bundle.add_json("trace.json", trace)
+    if settings is not None:
+        bundle.add_json("settings.redacted.json", redact_settings(settings))
+    for path in rotated_files(os.path.join(base_dir, LOG_FILE)):
+        bundle.add_file(path, f"logs/{os.path.basename(path)}")
+    bundle.add_dir(os.path.join(base_dir, "audit"), "audit")
+    # Архивы сессий нужны fleet_merge для сведения пунктов по всему парку
+    bundle.add_dir(os.path.join(base_dir, "sessions"), "sessions")
+    for name in STATE_FILES:
+        bundle.add_file(os.path.join(base_dir, name), f"state/{name}")
+    bundle.close()
+    logger.info("Диагностический пакет записан: %d файлов, %.0f мс",
+                len(bundle.entries), (time.perf_counter() - t0) * 1000)
+    return bundle.entries
@@ -5,14 +5,22 @@ import os
 import sys
 import logging
 import json
+import time
+import threading
 import traceback
 from datetime import datetime
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 from kivy.app import App
 from kivy.utils import platform
 
+from .log_reader import rotated_files, tail_matches, iter_matching_lines, is_error_line
+
 logger = logging.getLogger(__name__)
 
+RECENT_ERRORS_LIMIT = 10
+CRASH_REPORT_BUDGET_SEC = 3.0
+CRASH_RECENT_LOG_LINES = 200
+
 class DiagnosticsCollector:
     """Сборщик диагностической информации"""
     
@@ -134,6 +142,28 @@ class DiagnosticsCollector:
             if hasattr(self.app, 'sm') and self.app.sm:
                 state["current_screen"] = self.app.sm.current
             
+            # Асинхронный конвейер логирования (очередь, потери при переполнении)
+            from .logging_config import get_logging_stats
+            state["logging"] = get_logging_stats()
+            
+            # Статистика пула диалогов (построено/открыто, задержка открытия)
+            if hasattr(self.app, 'dialogs'):
+                state["dialogs"] = self.app.dialogs.stats()
+            
+            # Последний снятый профиль (топ функций; полные стеки — в profile_*.collapsed)
+            if getattr(self.app, 'last_profile', None):
+                state["last_profile"] = self.app.last_profile
+            
+            # Нарушения бюджетов производительности
+            from .performance_monitor import performance_monitor
+            if performance_monitor.budgets is not None:
+                state["perf_budgets"] = performance_monitor.budgets.to_dict()
+            
+            # Рост памяти между контрольными точками (режим tracemalloc)
+            from .memory_snapshots import memory_tracker
+            if memory_tracker.enabled or memory_tracker.diffs:
+                state["memory_snapshots"] = memory_tracker.to_dict()
+            
         except Exception as e:
             state["app_state_error"] = str(e)
         
@@ -154,9 +184,10 @@ class DiagnosticsCollector:
             key_files = [
                 "settings.json",
                 "session.json", 
-                "history.json",
+                "history.jsonl",
                 "cnc_checklist.log",
-                "audit.log"
+                "audit.log",
+                "audit/index.json"
             ]
             
             files_status = {}
@@ -174,20 +205,12 @@ class DiagnosticsCollector:
             
             file_info["files"] = files_status
             
-            # Размер директории
-            total_size = 0
-            file_count = 0
-            for root, dirs, files in os.walk(self.app.user_data_dir):
-                for file in files:
-                    filepath = os.path.join(root, file)
-                    try:
-                        total_size += os.path.getsize(filepath)
-                        file_count += 1
-                    except OSError:
-                        pass
-            
-            file_info["total_size_bytes"] = total_size
-            file_info["total_files"] = file_count
+            # Размер директории по категориям — из учёта записей, без обхода всех фото и PDF
+            from .storage_accounting import storage
+            usage = storage.usage()
+            file_info["storage"] = usage
+            file_info["total_size_bytes"] = usage.get("total_bytes")
+            file_info["total_files"] = usage.get("total_files")
             
         except Exception as e:
             file_info["file_info_error"] = str(e)
@@ -205,14 +228,14 @@ class DiagnosticsCollector:
         
         try:
             log_file = os.path.join(self.app.user_data_dir, "cnc_checklist.log")
-            if os.path.exists(log_file):
-                with open(log_file, 'r', encoding='utf-8') as f:
-                    lines = f.readlines()
-                
-                # Ищем строки с ошибками
-                error_lines = [line.strip() for line in lines if 'ERROR' in line or 'CRITICAL' in line]
-                error_info["error_count"] = len(error_lines)
-                error_info["recent_errors"] = error_lines[-10:]  # Последние 10 ошибок
+            files = rotated_files(log_file)
+            if files:
+                # Читаем с конца, включая ротированные файлы, до первых 10 совпадений
+                recent = tail_matches(log_file, is_error_line, RECENT_ERRORS_LIMIT)
+                error_info["recent_errors"] = recent
+                error_info["error_count"] = len(recent)
+                error_info["error_count_limit"] = RECENT_ERRORS_LIMIT
+                error_info["log_files"] = [os.path.basename(p) for p in files]
             else:
                 error_info["log_file_exists"] = False
                 
@@ -221,6 +244,11 @@ class DiagnosticsCollector:
         
         return error_info
     
+    def iter_error_lines(self, predicate=is_error_line):
+        """Потоковый доступ к строкам лога (новые первыми) для запросов больше RECENT_ERRORS_LIMIT"""
+        log_file = os.path.join(self.app.user_data_dir, "cnc_checklist.log")
+        return iter_matching_lines(log_file, predicate)
+    
     def collect_all_diagnostics(self) -> Dict[str, Any]:
         """Сбор всей диагностической информации"""
         logger.info("Начало сбора диагностической информации")
@@ -265,6 +293,89 @@ def create_diagnostics_report() -> str:
     collector = DiagnosticsCollector()
     return collector.export_diagnostics()
 
+def _session_pointer(app) -> Optional[Dict[str, Any]]:
+    """Где был оператор в момент сбоя (без сериализации всей сессии)"""
+    state = getattr(app, "state", None) if app else None
+    if not state:
+        return None
+    return {
+        "order_number": state.order_number,
+        "current_block": state.current_block_idx,
+        "current_item": state.current_item_idx,
+        "session_file": os.path.join(app.user_data_dir, "session.json"),
+        "screen": app.sm.current if getattr(app, "sm", None) else None,
+    }
+
+def _write_report(path: str, report: Dict[str, Any]):
+    tmp = path + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, default=str)
+    os.replace(tmp, path)
+
+def write_crash_report(exc_type, exc_value, exc_traceback, thread_name: Optional[str] = None,
+                       budget_sec: float = CRASH_REPORT_BUDGET_SEC) -> Optional[str]:
+    """Отчёт о сбое за ограниченное время.
+
+    Сначала сразу пишется минимальный отчёт (исключение, позиция в
+    сессии, последние строки лога из памяти). Затем дорогие разделы
+    собираются в фоновом потоке от дешёвых к дорогим; по истечении
+    budget_sec в отчёт попадает только то, что успело собраться.
+    """
+    deadline = time.monotonic() + budget_sec
+    app = App.get_running_app()
+    base_dir = app.user_data_dir if app else os.getcwd()
+    try:
+        from .logging_config import get_recent_log_lines
+        recent_logs = get_recent_log_lines(CRASH_RECENT_LOG_LINES)
+    except Exception as e:
+        recent_logs = [f"недоступно: {e}"]
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "thread": thread_name or threading.current_thread().name,
+        "exception": {
+            "type": str(exc_type),
+            "value": str(exc_value),
+            "traceback": traceback.format_exception(exc_type, exc_value, exc_traceback)
+        },
+        "session": _session_pointer(app),
+        "recent_logs": recent_logs,
+    }
+    crash_path = os.path.join(base_dir, f"crash_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    _write_report(crash_path, report)
+
+    collector = DiagnosticsCollector()
+    sections = [
+        ("system_info", collector.collect_system_info),
+        ("app_state", collector.collect_app_state),
+        ("error_logs", collector.collect_error_logs),
+        ("file_info", collector.collect_file_info),
+        ("android_info", collector.collect_android_info),
+    ]
+    extra: Dict[str, Any] = {}
+
+    def enrich():
+        for name, collect in sections:
+            if time.monotonic() >= deadline:
+                return
+            try:
+                extra[name] = collect()
+            except Exception as e:
+                extra[name] = {"error": str(e)}
+
+    worker = threading.Thread(target=enrich, name="crash-report", daemon=True)
+    worker.start()
+    worker.join(max(0.0, deadline - time.monotonic()))
+    done = dict(extra)
+    report.update(done)
+    report["missing_sections"] = [name for name, _ in sections if name not in done]
+    _write_report(crash_path, report)
+    try:
+        from .storage_accounting import storage
+        storage.record_write(crash_path)
+    except Exception:
+        pass
+    return crash_path
+
 def log_exception(exc_type, exc_value, exc_traceback):
     """Обработчик необработанных исключений"""
     if issubclass(exc_type, KeyboardInterrupt):
@@ -274,30 +385,27 @@ def log_exception(exc_type, exc_value, exc_traceback):
     logger = logging.getLogger(__name__)
     logger.critical("Необработанное исключение", exc_info=(exc_type, exc_value, exc_traceback))
     
-    # Создаем диагностический отчет при критической ошибке
+    # Создаем отчет о сбое с ограничением по времени
     try:
-        collector = DiagnosticsCollector()
-        diagnostics = collector.collect_all_diagnostics()
-        diagnostics["exception"] = {
-            "type": str(exc_type),
-            "value": str(exc_value),
-            "traceback": traceback.format_exception(exc_type, exc_value, exc_traceback)
-        }
-        
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        crash_file = f"crash_report_{timestamp}.json"
-        if collector.app:
-            crash_path = os.path.join(collector.app.user_data_dir, crash_file)
-        else:
-            crash_path = crash_file
-            
-        with open(crash_path, 'w', encoding='utf-8') as f:
-            json.dump(diagnostics, f, ensure_ascii=False, indent=2)
-            
+        crash_path = write_crash_report(exc_type, exc_value, exc_traceback)
+        logger.critical(f"Отчет о сбое сохранен в {crash_path}")
+    except Exception as e:
+        logger.critical(f"Не удалось создать отчет о сбое: {e}")
+
+def log_thread_exception(args):
+    """Необработанное исключение в фоновом потоке (threading.excepthook)"""
+    if issubclass(args.exc_type, SystemExit):
+        return
+    thread_name = args.thread.name if args.thread else None
+    logger = logging.getLogger(__name__)
+    logger.critical(f"Необработанное исключение в потоке {thread_name}",
+                    exc_info=(args.exc_type, args.exc_value, args.exc_traceback))
+    try:
+        crash_path = write_crash_report(args.exc_type, args.exc_value, args.exc_traceback, thread_name)
         logger.critical(f"Отчет о сбое сохранен в {crash_path}")
-        
     except Exception as e:
         logger.critical(f"Не удалось создать отчет о сбое: {e}")
 
-# Устанавливаем обработчик необработанных исключений
+# Устанавливаем обработчики необработанных исключений (главный и фоновые потоки)
 sys.excepthook = log_exception
+threading.excepthook = log_thread_exception
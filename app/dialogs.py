@@ -0,0 +1,207 @@
+"""
+Пул переиспользуемых диалогов (сообщение, PIN, ввод текста, выбор)
+"""
+import time
+import logging
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from kivy.uix.popup import Popup
+from kivy.uix.label import Label
+from kivy.uix.textinput import TextInput
+from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.button import Button
+
+logger = logging.getLogger(__name__)
+
+class PooledDialog(Popup):
+    """Диалог, который строится один раз и перенастраивается при каждом показе"""
+
+    kind = ""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._callback: Optional[Callable] = None
+
+    @property
+    def is_free(self) -> bool:
+        # После окончательного закрытия ModalView удаляется из окна
+        return self.parent is None
+
+    def close(self):
+        """Закрыть без анимации, чтобы экземпляр сразу вернулся в пул"""
+        self.dismiss(animation=False)
+
+class InfoDialog(PooledDialog):
+    kind = "info"
+
+    def __init__(self, **kwargs):
+        self.label = Label()
+        super().__init__(title="Сообщение", content=self.label, size_hint=(.85, .4), **kwargs)
+
+    def show(self, text: str, title: str = "Сообщение"):
+        self.title = title
+        self.label.text = text
+        self.open()
+
+class PinDialog(PooledDialog):
+    kind = "pin"
+
+    def __init__(self, **kwargs):
+        self.label = Label()
+        self.input = TextInput(password=True, multiline=False)
+        self.button = Button(text="ОК", size_hint_y=None, height='44dp')
+        box = BoxLayout(orientation='vertical', spacing=8, padding=8)
+        box.add_widget(self.label); box.add_widget(self.input); box.add_widget(self.button)
+        super().__init__(title="PIN", content=box, size_hint=(.7, .4), **kwargs)
+        self._validate: Optional[Callable[[str], bool]] = None
+        self.button.bind(on_release=self._submit)
+
+    def show(self, prompt: str, on_accept: Callable[[str], None],
+             validate: Optional[Callable[[str], bool]] = None):
+        """validate(pin) -> False оставляет диалог открытым; иначе он закрывается и вызывается on_accept"""
+        self.label.text = prompt
+        self.input.text = ""
+        self._callback = on_accept
+        self._validate = validate
+        self.open()
+
+    def _submit(self, *_):
+        text = self.input.text
+        if self._validate is not None and not self._validate(text):
+            self.input.text = ""
+            return
+        cb = self._callback
+        # Закрываем до колбека: он может сразу открыть следующий PIN-диалог
+        self.close()
+        if cb:
+            cb(text)
+
+class TextDialog(PooledDialog):
+    kind = "text"
+
+    def __init__(self, **kwargs):
+        self.input = TextInput()
+        self.button = Button()
+        self.buttons = BoxLayout(size_hint_y=None, height='48dp', spacing=8)
+        self.buttons.add_widget(self.button)
+        box = BoxLayout(orientation='vertical', spacing=8, padding=8)
+        box.add_widget(self.input); box.add_widget(self.buttons)
+        super().__init__(content=box, **kwargs)
+        self.button.bind(on_release=self._submit)
+
+    def show(self, title: str, on_submit: Callable[[str], None], text: str = "", hint: str = "",
+             multiline: bool = False, button_text: str = "OK", size_hint=(.7, .4)):
+        self.title = title
+        self.size_hint = size_hint
+        self.input.multiline = multiline
+        self.input.text = text
+        self.input.hint_text = hint
+        self.button.text = button_text
+        self._callback = on_submit
+        self.open()
+
+    def _submit(self, *_):
+        cb, text = self._callback, self.input.text
+        self.close()
+        if cb:
+            cb(text)
+
+class ChoiceDialog(PooledDialog):
+    kind = "choice"
+
+    def __init__(self, **kwargs):
+        self.label = Label()
+        self.buttons = BoxLayout(size_hint_y=None, height='48dp', spacing=8)
+        self._buttons: List[Button] = []
+        self._choices: List[Callable] = []
+        box = BoxLayout(orientation='vertical', spacing=8, padding=8)
+        box.add_widget(self.label); box.add_widget(self.buttons)
+        super().__init__(content=box, size_hint=(.8, .4), **kwargs)
+
+    def show(self, title: str, text: str, choices: Sequence[Tuple[str, Callable[[], None]]]):
+        self.title = title
+        self.label.text = text
+        # Кнопки создаются только если вариантов больше, чем было раньше
+        while len(self._buttons) < len(choices):
+            b = Button()
+            b.bind(on_release=lambda btn, i=len(self._buttons): self._choose(i))
+            self._buttons.append(b)
+        self.buttons.clear_widgets()
+        for b, (label, _) in zip(self._buttons, choices):
+            b.text = label
+            self.buttons.add_widget(b)
+        self._choices = [cb for _, cb in choices]
+        self.open()
+
+    def _choose(self, i: int):
+        cb = self._choices[i]
+        self.close()
+        cb()
+
+_DIALOG_CLASSES = {cls.kind: cls for cls in (InfoDialog, PinDialog, TextDialog, ChoiceDialog)}
+
+class DialogPool:
+    """Пул диалогов: свободный экземпляр переиспользуется, новый строится только если все заняты"""
+
+    def __init__(self):
+        self._dialogs: Dict[str, List[PooledDialog]] = {kind: [] for kind in _DIALOG_CLASSES}
+        self._stats: Dict[str, Dict[str, float]] = {
+            kind: {"built": 0, "opened": 0, "open_ms_total": 0.0, "open_ms_max": 0.0}
+            for kind in _DIALOG_CLASSES
+        }
+
+    def prewarm(self):
+        """Построить по одному диалогу каждого вида заранее (после показа первого экрана)"""
+        for kind in _DIALOG_CLASSES:
+            if not self._dialogs[kind]:
+                self._build(kind)
+
+    def _build(self, kind: str) -> PooledDialog:
+        dialog = _DIALOG_CLASSES[kind]()
+        self._dialogs[kind].append(dialog)
+        self._stats[kind]["built"] += 1
+        logger.debug(f"Создан диалог {kind} (всего: {len(self._dialogs[kind])})")
+        return dialog
+
+    def _acquire(self, kind: str) -> PooledDialog:
+        for dialog in self._dialogs[kind]:
+            if dialog.is_free:
+                return dialog
+        return self._build(kind)
+
+    def _show(self, kind: str, *args, **kwargs) -> PooledDialog:
+        t0 = time.perf_counter()
+        dialog = self._acquire(kind)
+        dialog.show(*args, **kwargs)
+        dt_ms = (time.perf_counter() - t0) * 1000
+        st = self._stats[kind]
+        st["opened"] += 1
+        st["open_ms_total"] += dt_ms
+        st["open_ms_max"] = max(st["open_ms_max"], dt_ms)
+        return dialog
+
+    def info(self, text: str, title: str = "Сообщение") -> PooledDialog:
+        return self._show("info", text, title)
+
+    def pin(self, prompt: str, on_accept: Callable[[str], None],
+            validate: Optional[Callable[[str], bool]] = None) -> PooledDialog:
+        return self._show("pin", prompt, on_accept, validate)
+
+    def text(self, title: str, on_submit: Callable[[str], None], **kwargs) -> PooledDialog:
+        return self._show("text", title, on_submit, **kwargs)
+
+    def choice(self, title: str, text: str, choices: Sequence[Tuple[str, Callable[[], None]]]) -> PooledDialog:
+        return self._show("choice", title, text, choices)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Сколько диалогов построено/открыто и средняя задержка открытия"""
+        result = {}
+        for kind, st in self._stats.items():
+            opened = st["opened"]
+            result[kind] = {
+                "built": st["built"],
+                "opened": opened,
+                "avg_open_ms": round(st["open_ms_total"] / opened, 3) if opened else None,
+                "max_open_ms": round(st["open_ms_max"], 3),
+            }
+        return result
@@ -0,0 +1,259 @@
+"""
+Сведение данных многих планшетов в одну базу SQLite.
+
+Источники — копии user_data_dir (каталоги) или диагностические пакеты
+cnc_diagnostics_*.zip. Из каждого берутся history.jsonl (или старый history.json) и архивы
+sessions/*.json; разбор идёт параллельно по источникам, загрузка в базу —
+одной транзакцией на источник. Устройство — device_id из settings.json
+(settings.redacted.json в пакете), а если его нет — имя каталога или пакета.
+Битый файл попадает в список ошибок, остальные файлы источника загружаются.
+
+Дубликаты отбрасываются по хэшу содержимого отчёта и по паре
+(устройство, авто-№): повторный импорт того же каталога ничего не
+добавляет. Отчёты, полученные по синхронизации (lan_sync), записываются
+под устройством-источником (origin), а не под устройством каталога.
+
+Использование:
+  python -m app.fleet_merge fleet.sqlite data/tablet01 data/tablet02 bundles/*.zip [--jobs 8]
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import zipfile
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .analytics_store import report_rows
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY,
+    device TEXT NOT NULL,
+    seq INTEGER,
+    order_no TEXT,
+    started_at TEXT,
+    completed_at TEXT,
+    file TEXT,
+    bypasses INTEGER,
+    content_hash TEXT NOT NULL UNIQUE,
+    UNIQUE (device, seq)
+);
+CREATE TABLE IF NOT EXISTS items (
+    report_id INTEGER NOT NULL REFERENCES reports(id),
+    day TEXT,
+    block_id TEXT,
+    item_id TEXT,
+    duration_sec REAL,
+    failed INTEGER,
+    critical INTEGER,
+    bypassed INTEGER
+);
+"""
+INDEXES = """
+CREATE INDEX IF NOT EXISTS reports_order ON reports(order_no);
+CREATE INDEX IF NOT EXISTS reports_completed ON reports(completed_at);
+CREATE INDEX IF NOT EXISTS items_item_day ON items(item_id, day);
+CREATE INDEX IF NOT EXISTS items_day ON items(day);
+CREATE INDEX IF NOT EXISTS items_report ON items(report_id);
+"""
+
+# (device, seq, order, started_at, completed_at, file, bypasses, content_hash, [item rows])
+Parsed = Tuple[str, Optional[int], str, Optional[str], Optional[str], Optional[str], int, str, List[tuple]]
+
+def content_hash(obj: Any) -> str:
+    """SHA-256 канонического JSON (не зависит от отступов и порядка ключей)"""
+    payload = json.dumps(obj, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def device_name(source: str) -> str:
+    """Имя устройства по умолчанию: имя каталога или пакета без расширения"""
+    name = os.path.basename(os.path.normpath(source))
+    return name[:-len(".zip")] if name.endswith(".zip") else name
+
+HISTORY_FILES = ("history.jsonl", "history.json")
+SETTINGS_FILES = ("settings.json", "settings.redacted.json")
+
+def _load_history(f, name: str) -> List[Dict]:
+    """history.jsonl (запись на строку) или старый history.json (список); битые строки пропускаются"""
+    if not name.endswith(".jsonl"):
+        return json.load(f)
+    entries = []
+    for line in f:
+        try:
+            entries.append(json.loads(line))
+        except ValueError:
+            continue
+    return entries
+
+def _source_files(source: str) -> Iterator[Tuple[str, str, Any]]:
+    """(вид, имя, открыть) для нужных файлов каталога или ZIP-пакета"""
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as z:
+            for name in z.namelist():
+                base = name.rsplit("/", 1)[-1]
+                if base in HISTORY_FILES:
+                    yield "history", name, lambda name=name: z.open(name)
+                elif base in SETTINGS_FILES:
+                    yield "settings", name, lambda name=name: z.open(name)
+                elif "sessions/" in name and base.endswith(".json"):
+                    yield "session", name, lambda name=name: z.open(name)
+        return
+    for name in SETTINGS_FILES:
+        path = os.path.join(source, name)
+        if os.path.exists(path):
+            yield "settings", path, lambda path=path: open(path, "rb")
+    for name in HISTORY_FILES:
+        path = os.path.join(source, name)
+        if os.path.exists(path):
+            yield "history", path, lambda path=path: open(path, "rb")
+            break
+    sessions_dir = os.path.join(source, "sessions")
+    if os.path.isdir(sessions_dir):
+        with os.scandir(sessions_dir) as it:
+            for entry in it:
+                if entry.name.endswith(".json"):
+                    yield "session", entry.path, lambda path=entry.path: open(path, "rb")
+
+def _iter_source_json(source: str, errors: List[str]) -> Iterator[Tuple[str, str, Any]]:
+    """('history' | 'session' | 'settings', имя файла, данные) из каталога или ZIP-пакета.
+
+    Ошибка чтения файла добавляется в errors, остальные файлы читаются дальше.
+    """
+    try:
+        for kind, name, opener in _source_files(source):
+            try:
+                with opener() as f:
+                    data = _load_history(f, name) if kind == "history" else json.load(f)
+            except Exception as e:
+                errors.append(f"{source}: {name}: {e}")
+                continue
+            yield kind, name, data
+    except Exception as e:
+        errors.append(f"{source}: {e}")
+
+def parse_source(source: str) -> Tuple[str, str, List[Parsed], List[str]]:
+    """Разбор одного источника (выполняется в отдельном процессе); (источник, устройство, отчёты, ошибки)"""
+    entries: List[Dict] = []
+    reports: List[Tuple[str, Dict]] = []
+    errors: List[str] = []
+    device = ""
+    for kind, name, data in _iter_source_json(source, errors):
+        if kind == "settings":
+            device = device or data.get("device_id") or ""
+        elif kind == "history":
+            entries.extend(data)
+        else:
+            reports.append((name, data))
+    device = device or device_name(source)
+
+    # Авто-№ у каждого планшета свой: ключ — (устройство-источник, №)
+    history: Dict[Tuple[str, Any], Dict] = {}
+    by_file: Dict[str, str] = {}
+    for entry in entries:
+        origin = entry.get("origin") or device
+        history[(origin, entry.get("seq"))] = entry
+        if entry.get("file"):
+            by_file[os.path.splitext(os.path.basename(entry["file"]))[0]] = origin
+    sessions: Dict[Tuple[str, Any], Dict] = {}
+    for name, report in reports:
+        stem = os.path.splitext(name.replace("\\", "/").rsplit("/", 1)[-1])[0]
+        origin = report.get("device") or by_file.get(stem) or device
+        sessions[(origin, report.get("seq"))] = report
+
+    parsed: List[Parsed] = []
+    for key in set(history) | set(sessions):
+        (origin, seq), entry, report = key, history.get(key, {}), sessions.get(key)
+        if report is not None:
+            items = [row[:1] + row[2:] for row in report_rows(report)]
+            bypasses = entry.get("bypasses", sum(1 for r in items if r[-1]))
+            parsed.append((origin, seq, report.get("order", ""), report.get("started_at"), report.get("completed_at"),
+                           os.path.basename(entry.get("file") or ""), bypasses, content_hash(report), items))
+        else:
+            parsed.append((origin, seq, entry.get("order", ""), None, entry.get("created_at"),
+                           os.path.basename(entry.get("file") or ""), entry.get("bypasses", 0),
+                           content_hash(entry), []))
+    return source, device, parsed, errors
+
+class FleetStore:
+    """Центральная база отчётов всех устройств"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+        self.db.execute("PRAGMA journal_mode=WAL")
+
+    def load(self, parsed: List[Parsed]) -> Tuple[int, int]:
+        """Загрузить разобранный источник; (добавлено, дубликатов)"""
+        added = duplicates = 0
+        items: List[tuple] = []
+        cur = self.db.cursor()
+        self.db.execute("PRAGMA synchronous=OFF")
+        with self.db:
+            for device, seq, order, started, completed, file, bypasses, digest, rows in parsed:
+                cur.execute("INSERT OR IGNORE INTO reports (device, seq, order_no, started_at, completed_at, file,"
+                            " bypasses, content_hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                            (device, seq, order, started, completed, file, bypasses, digest))
+                if cur.rowcount != 1:
+                    duplicates += 1
+                    continue
+                added += 1
+                report_id = cur.lastrowid
+                items.extend((report_id,) + row for row in rows)
+            cur.executemany("INSERT INTO items (report_id, day, block_id, item_id, duration_sec, failed, critical,"
+                            " bypassed) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", items)
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        return added, duplicates
+
+    def finish(self):
+        """Индексы строятся после загрузки — так быстрее, чем обновлять их на каждую вставку"""
+        self.db.executescript(INDEXES)
+        self.db.execute("ANALYZE")
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+def merge(db_path: str, sources: List[str], jobs: Optional[int] = None) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    store = FleetStore(db_path)
+    stats = {"sources": len(sources), "added": 0, "duplicates": 0, "errors": []}
+    try:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            # Загрузка в базу идёт в главном процессе по мере готовности разбора
+            for source, device, parsed, errors in pool.map(parse_source, sources):
+                added, duplicates = store.load(parsed)
+                stats["added"] += added
+                stats["duplicates"] += duplicates
+                stats["errors"].extend(errors)
+                logger.info(f"{source} ({device}): добавлено {added}, дубликатов {duplicates}")
+        store.finish()
+    finally:
+        store.close()
+    stats["elapsed_sec"] = round(time.perf_counter() - t0, 2)
+    return stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сведение истории и архивов сессий планшетов CNC Checklist")
+    parser.add_argument("database", help="Файл базы SQLite (создаётся или дополняется)")
+    parser.add_argument("sources", nargs="+", help="Каталоги данных (копии user_data_dir) или пакеты *.zip")
+    parser.add_argument("--jobs", type=int, help="Число процессов разбора (по умолчанию — число CPU)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    stats = merge(args.database, args.sources, args.jobs)
+    for error in stats["errors"]:
+        print(f"Ошибка: {error}", file=sys.stderr)
+    print(f"Источников: {stats['sources']}, добавлено отчётов: {stats['added']}, "
+          f"дубликатов: {stats['duplicates']}, {stats['elapsed_sec']} с", file=sys.stderr)
+    return 1 if stats["errors"] else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
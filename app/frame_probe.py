@@ -0,0 +1,100 @@
+"""
+Измерение времени кадров Kivy и поиск подвисаний UI
+"""
+import time
+import logging
+from bisect import bisect_left
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from .performance_monitor import performance_monitor
+
+logger = logging.getLogger(__name__)
+
+# Верхние границы корзин гистограммы, мс (последняя — всё, что дольше)
+FRAME_BUCKETS_MS = [8, 12, 16.7, 20, 25, 33.3, 50, 66.7, 100, 150, 250, 500, 1000]
+
+class FrameProbe:
+    """Гистограмма длительностей кадров по тикам Clock.
+
+    Кадр длиннее budget_ms считается подвисанием: он сохраняется вместе
+    со списком операций monitor_performance / save_json, выполнявшихся
+    в этот момент.
+    """
+
+    def __init__(self, budget_ms: float = 33.0, keep_long_frames: int = 100):
+        self.budget_ms = budget_ms
+        self.counts = [0] * (len(FRAME_BUCKETS_MS) + 1)
+        self.frames = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.over_budget = 0
+        self.long_frames = deque(maxlen=keep_long_frames)
+        self._last: Optional[float] = None
+        self._event = None
+
+    def attach(self):
+        """Подключиться к Clock (вызов на каждом кадре)"""
+        if self._event is not None:
+            return
+        from kivy.clock import Clock
+        self._last = None
+        self._event = Clock.schedule_interval(self._tick, 0)
+        performance_monitor.frame_probe = self
+        logger.info(f"Измерение кадров включено (бюджет {self.budget_ms:.0f} мс)")
+
+    def detach(self):
+        if self._event is not None:
+            self._event.cancel()
+            self._event = None
+
+    def _tick(self, dt):
+        now = time.perf_counter()
+        last, self._last = self._last, now
+        if last is not None:
+            self.record((now - last) * 1000, last, now)
+
+    def record(self, frame_ms: float, t0: float = 0.0, t1: float = 0.0):
+        self.frames += 1
+        self.total_ms += frame_ms
+        if frame_ms > self.max_ms:
+            self.max_ms = frame_ms
+        self.counts[bisect_left(FRAME_BUCKETS_MS, frame_ms)] += 1
+        if frame_ms > self.budget_ms:
+            self.over_budget += 1
+            activities = performance_monitor.activities_between(t0, t1)
+            self.long_frames.append({
+                "timestamp": datetime.now().isoformat(),
+                "duration_ms": round(frame_ms, 1),
+                "activities": activities,
+            })
+            if frame_ms > self.budget_ms * 3:
+                logger.debug("Долгий кадр %.0f мс: %s", frame_ms, activities)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Оценка перцентиля по верхней границе корзины, мс"""
+        if not self.frames:
+            return None
+        target = q * self.frames
+        acc = 0
+        for i, c in enumerate(self.counts):
+            acc += c
+            if acc >= target:
+                return min(FRAME_BUCKETS_MS[i], self.max_ms) if i < len(FRAME_BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    def to_dict(self) -> Dict:
+        labels = [f"<={b}" for b in FRAME_BUCKETS_MS] + [f">{FRAME_BUCKETS_MS[-1]}"]
+        return {
+            "budget_ms": self.budget_ms,
+            "frames": self.frames,
+            "avg_ms": round(self.total_ms / self.frames, 2) if self.frames else None,
+            "max_ms": round(self.max_ms, 1),
+            "p50_ms": self.percentile(0.50),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "over_budget": self.over_budget,
+            "histogram_ms": dict(zip(labels, self.counts)),
+            "long_frames": list(self.long_frames),
+        }
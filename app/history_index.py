@@ -0,0 +1,151 @@
+"""
+Индексы истории отчётов для быстрого поиска и фильтрации
+"""
+import logging
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_MAX_CHAR = "\U0010ffff"
+
+@dataclass(frozen=True)
+class HistoryQuery:
+    """Критерии фильтрации истории (пустые поля не ограничивают выборку)"""
+    order_prefix: str = ""
+    date_from: str = ""  # "YYYY-MM-DD" или любой префикс created_at
+    date_to: str = ""    # включительно
+    has_bypass: Optional[bool] = None
+    seq_min: Optional[int] = None
+    seq_max: Optional[int] = None
+
+    def is_empty(self) -> bool:
+        return (not self.order_prefix and not self.date_from and not self.date_to
+                and self.has_bypass is None and self.seq_min is None and self.seq_max is None)
+
+    def narrows(self, other: "HistoryQuery") -> bool:
+        """True, если результат этого запроса — подмножество результата other"""
+        return (self.order_prefix.startswith(other.order_prefix)
+                and self.date_from == other.date_from and self.date_to == other.date_to
+                and self.has_bypass == other.has_bypass
+                and self.seq_min == other.seq_min and self.seq_max == other.seq_max)
+
+class _SortedKeys:
+    """Отсортированные пары (ключ, позиция) в двух параллельных списках"""
+
+    def __init__(self, pairs: Iterable[Tuple[Any, int]] = ()):
+        pairs = sorted(pairs)
+        self.keys = [k for k, _ in pairs]
+        self.pos = [p for _, p in pairs]
+
+    def insert(self, key, pos: int):
+        i = bisect_right(self.keys, key)
+        self.keys.insert(i, key)
+        self.pos.insert(i, pos)
+
+    def range(self, lo=None, hi=None) -> Tuple[int, int]:
+        """Границы [start, end) для lo <= key <= hi"""
+        start = 0 if lo is None else bisect_left(self.keys, lo)
+        end = len(self.keys) if hi is None else bisect_right(self.keys, hi)
+        return start, max(start, end)
+
+class HistoryIndex:
+    """Отсортированные и префиксные индексы по записям истории.
+
+    Строится один раз по всем записям и дополняется через add() при
+    создании нового отчёта. Запрос выбирает самый узкий индексный
+    диапазон, а остальные критерии проверяет по колонкам.
+    """
+
+    def __init__(self, entries: Iterable[Dict[str, Any]] = ()):
+        self._orders: List[str] = []
+        self._dates: List[str] = []
+        self._seqs: List[int] = []
+        self._bypass: List[bool] = []
+        self._bypass_pos: List[int] = []  # позиции отчётов с обходом, по возрастанию
+        for e in entries:
+            self._append_columns(e)
+        n = len(self._orders)
+        self._by_order = _SortedKeys(zip(self._orders, range(n)))
+        self._by_date = _SortedKeys(zip(self._dates, range(n)))
+        self._by_seq = _SortedKeys(zip(self._seqs, range(n)))
+        self._last: Optional[Tuple[HistoryQuery, List[int]]] = None
+        logger.debug(f"Индекс истории построен: {n} записей")
+
+    def __len__(self) -> int:
+        return len(self._orders)
+
+    def _append_columns(self, e: Dict[str, Any]) -> int:
+        self._orders.append(e.get("order", ""))
+        self._dates.append(e.get("created_at", ""))
+        self._seqs.append(int(e.get("seq") or 0))
+        self._bypass.append(bool(e.get("bypasses")))
+        pos = len(self._orders) - 1
+        if self._bypass[pos]:
+            self._bypass_pos.append(pos)
+        return pos
+
+    def add(self, entry: Dict[str, Any]) -> int:
+        """Добавить запись (позиция = следующая по порядку)"""
+        pos = self._append_columns(entry)
+        self._by_order.insert(self._orders[pos], pos)
+        self._by_date.insert(self._dates[pos], pos)
+        self._by_seq.insert(self._seqs[pos], pos)
+        self._last = None
+        return pos
+
+    def _refine(self, positions: List[int], q: HistoryQuery, skip: str = "") -> List[int]:
+        """Отфильтровать позиции по всем критериям, кроме уже применённого индексом"""
+        if q.order_prefix and skip != "order":
+            orders, pref = self._orders, q.order_prefix
+            positions = [p for p in positions if orders[p].startswith(pref)]
+        if (q.date_from or q.date_to) and skip != "date":
+            dates, lo = self._dates, q.date_from
+            hi = (q.date_to + _MAX_CHAR) if q.date_to else _MAX_CHAR
+            positions = [p for p in positions if lo <= dates[p] <= hi]
+        if (q.seq_min is not None or q.seq_max is not None) and skip != "seq":
+            seqs = self._seqs
+            lo = q.seq_min if q.seq_min is not None else float("-inf")
+            hi = q.seq_max if q.seq_max is not None else float("inf")
+            positions = [p for p in positions if lo <= seqs[p] <= hi]
+        if q.has_bypass is not None and skip != "bypass":
+            bypass, want = self._bypass, q.has_bypass
+            positions = [p for p in positions if bypass[p] == want]
+        return positions if isinstance(positions, list) else list(positions)
+
+    def query(self, q: HistoryQuery) -> List[int]:
+        """Позиции подходящих записей, новые первыми"""
+        n = len(self._orders)
+        if q.is_empty():
+            return list(range(n - 1, -1, -1))
+
+        # Пользователь дописывает префикс — уточняем предыдущий результат
+        if self._last and q.narrows(self._last[0]):
+            result = self._refine(self._last[1], q)
+            self._last = (q, result)
+            return result
+
+        candidates = []
+        if q.order_prefix:
+            candidates.append(("order", self._by_order, self._by_order.range(q.order_prefix, q.order_prefix + _MAX_CHAR)))
+        if q.date_from or q.date_to:
+            candidates.append(("date", self._by_date, self._by_date.range(q.date_from or None,
+                                                                           (q.date_to + _MAX_CHAR) if q.date_to else None)))
+        if q.seq_min is not None or q.seq_max is not None:
+            candidates.append(("seq", self._by_seq, self._by_seq.range(q.seq_min, q.seq_max)))
+        if q.has_bypass:
+            candidates.append(("bypass", None, (0, len(self._bypass_pos))))
+
+        if candidates:
+            skip, idx, (start, end) = min(candidates, key=lambda c: c[2][1] - c[2][0])
+            if idx is None:
+                positions = self._bypass_pos[::-1]
+            else:
+                positions = idx.pos[start:end]
+                positions.sort(reverse=True)
+        else:
+            skip, positions = "", range(n - 1, -1, -1)
+        result = self._refine(positions, q, skip)
+        self._last = (q, result)
+        return result
@@ -0,0 +1,291 @@
+"""
+Хранилище истории отчётов CNC Checklist с постраничным доступом
+"""
+import os
+import json
+import logging
+import time
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .persistence import read_json
+from .history_index import HistoryIndex, HistoryQuery
+from .storage_accounting import storage
+
+logger = logging.getLogger(__name__)
+
+HISTORY_FILE = "history.jsonl"
+LEGACY_HISTORY_FILE = "history.json"
+SCAN_CHUNK = 1024 * 1024
+CACHE_ENTRIES = 512
+
+class HistoryStore:
+    """История отчётов в history.jsonl (одна запись JSON на строку, только дописывается).
+
+    При открытии файл один раз просматривается блоками в поисках
+    переводов строк — так строится индекс смещений без разбора JSON.
+    Страница читает и разбирает только свои строки (с небольшим
+    LRU-кэшем); все записи разбираются, лишь когда нужен индекс
+    фильтрации или полный список (синхронизация). Новая запись —
+    одна дописанная строка, а не перезапись всего файла.
+
+    Недописанная последняя строка (сбой во время записи) не считается
+    записью и отрезается перед следующим добавлением.
+
+    Индекс фильтрации строится в фоне (build_index_async) — разбор
+    всего файла занимает сотни миллисекунд и не должен попадать на
+    первое нажатие клавиши в фильтре.
+    """
+
+    def __init__(self, base_dir: str, filename: str = HISTORY_FILE):
+        self.base_dir = base_dir
+        self.path = os.path.join(base_dir, filename)
+        self._offsets = array("q")  # начало каждой полной строки
+        self._size = 0              # байт, занятых полными строками
+        self._stat: Optional[Tuple[int, int]] = None
+        self._entries: Optional[List[Dict[str, Any]]] = None
+        self._cache: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._index: Optional[HistoryIndex] = None
+        # Запись идёт и из UI, и из потока синхронизации (lan_sync)
+        self._lock = threading.RLock()
+
+    # ---- Файл и индекс смещений
+
+    def _reset(self):
+        self._offsets = array("q")
+        self._size = 0
+        self._stat = None
+        self._entries = None
+        self._cache.clear()
+        self._index = None
+
+    def _migrate(self) -> bool:
+        """Однократный перенос history.json (список JSON) в history.jsonl"""
+        legacy = os.path.join(self.base_dir, LEGACY_HISTORY_FILE)
+        if not os.path.exists(legacy):
+            return False
+        entries = read_json(legacy, [])
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(b"".join(_line(e) for e in entries))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        os.replace(legacy, legacy + ".bak")
+        storage.record_delete(legacy)
+        storage.record_write(legacy + ".bak")
+        storage.record_write(self.path)
+        logger.info(f"История перенесена из {LEGACY_HISTORY_FILE}: {len(entries)} записей")
+        return True
+
+    def _sync(self):
+        """Учесть изменения файла (вызывается под блокировкой)"""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            if not self._migrate():
+                self._reset()
+                return
+            st = os.stat(self.path)
+        key = (st.st_mtime_ns, st.st_size)
+        if key == self._stat:
+            return
+        if st.st_size < self._size:
+            self._reset()
+        first = len(self._offsets)
+        self._scan()
+        self._stat = key
+        if self._entries is not None and len(self._offsets) > first:
+            new = [self._read(pos) for pos in range(first, len(self._offsets))]
+            self._entries.extend(new)
+            if self._index is not None:
+                for entry in new:
+                    self._index.add(entry)
+        logger.debug(f"История: {len(self._offsets)} записей")
+
+    def _scan(self):
+        """Смещения новых полных строк начиная с self._size"""
+        line_start = self._size
+        with open(self.path, "rb") as f:
+            f.seek(line_start)
+            pos = line_start
+            while True:
+                chunk = f.read(SCAN_CHUNK)
+                if not chunk:
+                    break
+                i = chunk.find(b"\n")
+                while i != -1:
+                    if pos + i > line_start:
+                        self._offsets.append(line_start)
+                    line_start = pos + i + 1
+                    i = chunk.find(b"\n", i + 1)
+                pos += len(chunk)
+        self._size = line_start
+
+    def _read(self, pos: int) -> Dict[str, Any]:
+        entry = self._cache.get(pos)
+        if entry is not None:
+            self._cache.move_to_end(pos)
+            return entry
+        with open(self.path, "rb") as f:
+            f.seek(self._offsets[pos])
+            line = f.readline()
+        entry = _parse(line)
+        self._cache[pos] = entry
+        if len(self._cache) > CACHE_ENTRIES:
+            self._cache.popitem(last=False)
+        return entry
+
+    # ---- Чтение
+
+    def count(self) -> int:
+        """Количество записей в истории"""
+        with self._lock:
+            self._sync()
+            return len(self._offsets)
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """Все записи в порядке добавления (разбирает весь файл при первом вызове)"""
+        with self._lock:
+            self._sync()
+            if self._entries is None:
+                self._entries = [_parse(line) for line in self._lines()]
+            return self._entries
+
+    def _lines(self, size: Optional[int] = None):
+        remaining = self._size if size is None else size
+        if not remaining:
+            return  # файла ещё нет или в нём нет полных строк
+        with open(self.path, "rb") as f:
+            for line in f:
+                if remaining <= 0:
+                    break
+                remaining -= len(line)
+                if len(line) > 1:
+                    yield line
+
+    def get(self, pos: int) -> Dict[str, Any]:
+        """Запись по позиции в порядке добавления"""
+        with self._lock:
+            self._sync()
+            if pos < 0:
+                pos += len(self._offsets)
+            if self._entries is not None:
+                return self._entries[pos]
+            return self._read(pos)
+
+    def page(self, offset: int, limit: int, newest_first: bool = True) -> List[Dict[str, Any]]:
+        """Страница записей; по умолчанию новые записи идут первыми"""
+        n = self.count()
+        if newest_first:
+            positions = range(n - 1 - offset, max(-1, n - 1 - offset - limit), -1)
+        else:
+            positions = range(offset, min(n, offset + limit))
+        return [self.get(pos) for pos in positions]
+
+    @property
+    def index(self) -> HistoryIndex:
+        """Индекс для фильтрации; строится при первом обращении"""
+        # Под блокировкой: поток синхронизации дополняет индекс в extend()
+        with self._lock:
+            entries = self.entries()
+            if self._index is None:
+                self._index = HistoryIndex(entries)
+            return self._index
+
+    @property
+    def index_ready(self) -> bool:
+        return self._index is not None
+
+    def build_index(self):
+        """Разобрать историю и построить индекс; файл читается без блокировки,
+        записи, добавленные за это время, дочитываются в конце"""
+        with self._lock:
+            self._sync()
+            if self._index is not None:
+                return
+            size, count = self._size, len(self._offsets)
+        entries = [_parse(line) for line in self._lines(size)]
+        index = HistoryIndex(entries)
+        with self._lock:
+            self._sync()
+            if self._index is not None or self._size < size:
+                return  # уже построен или файл заменён — построится заново по запросу
+            for pos in range(count, len(self._offsets)):
+                entry = self._read(pos)
+                entries.append(entry)
+                index.add(entry)
+            if self._entries is None:
+                self._entries = entries
+            self._index = index
+
+    def build_index_async(self, on_ready: Optional[Callable[[], None]] = None):
+        """Построить индекс в фоновом потоке; on_ready вызывается в этом потоке"""
+        def _run():
+            t0 = time.perf_counter()
+            try:
+                self.build_index()
+            except Exception as e:
+                logger.error(f"Ошибка построения индекса истории: {e}")
+                return
+            logger.debug(f"Индекс истории построен в фоне за {(time.perf_counter() - t0) * 1000:.0f} мс")
+            if on_ready:
+                on_ready()
+        threading.Thread(target=_run, name="history-index", daemon=True).start()
+
+    def query(self, q: HistoryQuery, wait: bool = True) -> Optional[List[int]]:
+        """Позиции записей, подходящих под фильтр (новые первыми).
+
+        wait=False — для UI: пока индекс строится в фоне, возвращает None.
+        """
+        if q.is_empty():
+            # Без фильтра записи не разбираются — страницы читаются по мере прокрутки
+            return list(range(self.count() - 1, -1, -1))
+        if not wait and self._index is None:
+            return None
+        with self._lock:
+            return self.index.query(q)
+
+    # ---- Запись
+
+    def append(self, entry: Dict[str, Any]) -> int:
+        """Добавить запись; возвращает её позицию"""
+        return self.extend([entry])
+
+    def extend(self, new_entries: List[Dict[str, Any]]) -> int:
+        """Дописать записи в конец файла; возвращает позицию последней"""
+        lines = [_line(e) for e in new_entries]
+        with self._lock:
+            self._sync()
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "ab") as f:
+                if f.tell() > self._size:
+                    f.truncate(self._size)
+                    logger.warning("Отрезана недописанная последняя запись истории")
+                f.write(b"".join(lines))
+                f.flush()
+                os.fsync(f.fileno())
+            for line in lines:
+                self._offsets.append(self._size)
+                self._size += len(line)
+            st = os.stat(self.path)
+            self._stat = (st.st_mtime_ns, st.st_size)
+            if self._entries is not None:
+                self._entries.extend(new_entries)
+                if self._index is not None:
+                    for entry in new_entries:
+                        self._index.add(entry)
+            storage.record_write(self.path, st.st_size)
+            return len(self._offsets) - 1
+
+def _parse(line: bytes) -> Dict[str, Any]:
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        logger.error(f"Повреждена запись истории: {e}")
+        return {}
+
+def _line(entry: Dict[str, Any]) -> bytes:
+    return json.dumps(entry, ensure_ascii=False, default=str).encode("utf-8") + b"\n"
@@ -0,0 +1,636 @@
+"""
+Синхронизация истории отчётов и PDF между планшетами по локальной сети (asyncio, HTTP/1.1, только stdlib).
+
+Каждый планшет — узел с идентификатором устройства (Settings.device_id).
+Отчёт идентифицируется парой (устройство-источник, авто-№): свои записи
+истории не имеют поля origin, полученные хранят origin и hash источника.
+
+Обмен за один сеанс:
+  GET  /manifest            — по каждому источнику диапазоны № и сводный хэш
+  POST /reports             — записи истории, архивы сессий и хэши по списку ключей (пачками)
+  GET  /pdf/<origin>/<seq>  — PDF (потоком)
+  PUT  /pdf/<origin>/<seq>, PUT /reports — то же в обратную сторону
+
+Манифест — это диапазоны [[1, 120], [122, 130]], а не список отчётов,
+поэтому его размер и вычитание «чего у меня нет» зависят от числа
+разрывов, а передаются только недостающие отчёты.
+
+Без общего ключа (sync_token) узел слушает только 127.0.0.1: принимать
+отчёты из сети без ключа он отказывается.
+
+Проверка на одной машине (два каталога данных, два порта):
+  python -m app.lan_sync serve data/tab01 --port 8765
+  python -m app.lan_sync sync data/tab02 127.0.0.1:8765
+"""
+import os
+import sys
+import json
+import asyncio
+import hmac
+import hashlib
+import logging
+import argparse
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import quote, unquote
+
+from .persistence import read_json, write_json
+from .history_store import HistoryStore
+from .fleet_merge import content_hash
+from .storage_accounting import storage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8765
+CHUNK_SIZE = 64 * 1024
+MAX_JSON_BODY = 16 * 1024 * 1024
+MAX_PDF_BODY = 512 * 1024 * 1024
+SYNC_CONCURRENCY = 4
+# Отчётов в одном запросе POST/PUT /reports (и в одной дозаписи истории)
+BATCH_SIZE = 200
+TIMEOUT_SEC = 30
+TOKEN_HEADER = "x-sync-token"
+LOCAL_HOSTS = ("127.0.0.1", "::1", "localhost")
+# Поля записи истории, по которым считается хэш записей без поля hash
+_ENTRY_HASH_FIELDS = ("order", "created_at", "seq", "bypasses")
+
+Key = Tuple[str, int]
+
+def entry_hash(entry: Dict[str, Any]) -> str:
+    """Хэш записи истории: сохранённый при получении или по неизменным полям записи"""
+    return entry.get("hash") or content_hash({k: entry.get(k) for k in _ENTRY_HASH_FIELDS})
+
+def to_ranges(seqs: List[int]) -> List[List[int]]:
+    """[1, 2, 3, 5] -> [[1, 3], [5, 5]]"""
+    ranges: List[List[int]] = []
+    for seq in sorted(seqs):
+        if ranges and seq == ranges[-1][1] + 1:
+            ranges[-1][1] = seq
+        elif not ranges or seq > ranges[-1][1]:
+            ranges.append([seq, seq])
+    return ranges
+
+def subtract_ranges(theirs: List[List[int]], ours: List[List[int]]) -> List[List[int]]:
+    """Диапазоны theirs, не покрытые ours (оба списка отсортированы); O(число диапазонов)"""
+    result: List[List[int]] = []
+    i = 0
+    for lo, hi in theirs:
+        while i < len(ours) and ours[i][1] < lo:
+            i += 1
+        j = i
+        while lo <= hi:
+            if j >= len(ours) or ours[j][0] > hi:
+                result.append([lo, hi])
+                break
+            if ours[j][0] > lo:
+                result.append([lo, ours[j][0] - 1])
+            lo = max(lo, ours[j][1] + 1)
+            j += 1
+    return result
+
+def _safe_name(name: str) -> Optional[str]:
+    """Имя PDF без каталогов; None — подозрительное имя"""
+    name = os.path.basename(name or "")
+    return name if name.endswith(".pdf") and not name.startswith(".") else None
+
+class SyncError(Exception):
+    pass
+
+class SyncNode:
+    """Локальная сторона синхронизации: манифест, выдача и приём отчётов.
+
+    Записи истории только добавляются, поэтому множество известных
+    ключей и сводные хэши обновляются по новым записям с конца, а не
+    пересчитываются по всей истории при каждом запросе.
+    """
+
+    def __init__(self, base_dir: str, device_id: str, history: Optional[HistoryStore] = None,
+                 token: str = "", on_received: Optional[Callable[[Dict, Optional[Dict]], None]] = None):
+        if not device_id:
+            raise ValueError("Не задан идентификатор устройства")
+        self.base_dir = base_dir
+        self.device_id = device_id
+        self.history = history or HistoryStore(base_dir)
+        self.token = token
+        self.on_received = on_received
+        self._lock = threading.Lock()
+        self._positions: Dict[Key, int] = {}
+        self._seqs: Dict[str, List[int]] = {}
+        self._digests: Dict[str, int] = {}
+        self._seen = 0
+        self._manifest: Optional[Dict[str, Any]] = None
+
+    # ---- Локальные данные
+
+    def _origin(self, entry: Dict[str, Any]) -> str:
+        return entry.get("origin") or self.device_id
+
+    def _refresh(self):
+        entries = self.history.entries()
+        if len(entries) < self._seen:
+            self._positions, self._seqs, self._digests, self._seen = {}, {}, {}, 0
+        for pos in range(self._seen, len(entries)):
+            entry = entries[pos]
+            seq = entry.get("seq")
+            if not isinstance(seq, int):
+                continue
+            key = (self._origin(entry), seq)
+            if key in self._positions:
+                continue
+            self._positions[key] = pos
+            self._seqs.setdefault(key[0], []).append(seq)
+            # XOR не зависит от порядка добавления — одинаковый набор даёт одинаковый хэш
+            self._digests[key[0]] = self._digests.get(key[0], 0) ^ int(entry_hash(entry), 16)
+            self._manifest = None
+        self._seen = len(entries)
+
+    def manifest(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refresh()
+            if self._manifest is None:
+                self._manifest = {
+                    "device": self.device_id,
+                    "origins": {origin: {"ranges": to_ranges(seqs), "count": len(seqs),
+                                         "digest": f"{self._digests[origin]:064x}"}
+                                for origin, seqs in self._seqs.items()},
+                }
+            return self._manifest
+
+    def missing_from(self, manifest: Dict[str, Any]) -> List[Key]:
+        """Ключи отчётов из чужого манифеста, которых нет локально"""
+        ours = self.manifest()["origins"]
+        missing: List[Key] = []
+        for origin, theirs in manifest.get("origins", {}).items():
+            mine = ours.get(origin)
+            if mine is None:
+                gaps = theirs["ranges"]
+            elif mine["ranges"] == theirs["ranges"]:
+                if mine["digest"] != theirs["digest"]:
+                    logger.warning(f"Синхронизация: отчёты источника {origin} совпадают по номерам, "
+                                   f"но различаются по содержимому")
+                continue
+            else:
+                gaps = subtract_ranges(theirs["ranges"], mine["ranges"])
+            missing.extend((origin, seq) for lo, hi in gaps for seq in range(lo, hi + 1))
+        return missing
+
+    def _entry(self, key: Key) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._refresh()
+            pos = self._positions.get(key)
+        return None if pos is None else self.history.get(pos)
+
+    def _session_path(self, pdf_name: str) -> str:
+        return os.path.join(self.base_dir, "sessions", pdf_name[:-len(".pdf")] + ".json")
+
+    def export_report(self, key: Key) -> Optional[Dict[str, Any]]:
+        """Пакет отчёта для передачи: запись истории, архив сессии, имя и размер PDF"""
+        entry = self._entry(key)
+        if entry is None:
+            return None
+        name = _safe_name(entry.get("file"))
+        report = read_json(self._session_path(name), None) if name else None
+        pdf = self.pdf_path(key)
+        return {
+            "origin": key[0],
+            "entry": {k: v for k, v in entry.items() if k not in ("file", "origin")},
+            "hash": entry_hash(entry),
+            "pdf": name if pdf else None,
+            "report": report,
+            "report_hash": content_hash(report) if report is not None else None,
+        }
+
+    def export_reports(self, keys: List[Key]) -> List[Dict[str, Any]]:
+        return [p for p in map(self.export_report, keys) if p]
+
+    def pdf_path(self, key: Key) -> Optional[str]:
+        entry = self._entry(key)
+        name = _safe_name(entry.get("file")) if entry else None
+        path = os.path.join(self.base_dir, name) if name else None
+        return path if path and os.path.isfile(path) else None
+
+    def import_reports(self, payloads: List[Dict[str, Any]]) -> int:
+        """Принять пакеты отчётов (PDF к этому моменту уже приняты); возвращает число новых.
+
+        Все записи добавляются в историю одной записью файла.
+        """
+        accepted = []
+        for payload in payloads:
+            key = (payload.get("origin"), (payload.get("entry") or {}).get("seq"))
+            report = payload.get("report")
+            if not isinstance(key[0], str) or not isinstance(key[1], int):
+                raise SyncError("Пакет отчёта без источника или номера")
+            if report is not None and content_hash(report) != payload.get("report_hash"):
+                raise SyncError(f"Хэш отчёта {key} не совпадает")
+            accepted.append((key, payload))
+        new_entries = []
+        with self._lock:
+            self._refresh()
+            keys = set()
+            for key, payload in accepted:
+                if key in self._positions or key in keys:
+                    continue
+                keys.add(key)
+                name = _safe_name(payload.get("pdf") or "")
+                report = payload.get("report")
+                if report is not None and name:
+                    path = self._session_path(name)
+                    if not os.path.exists(path):
+                        os.makedirs(os.path.dirname(path), exist_ok=True)
+                        write_json(path, report)
+                pdf = os.path.join(self.base_dir, name) if name else None
+                entry = dict(payload["entry"], file=pdf if pdf and os.path.isfile(pdf) else "",
+                             hash=payload["hash"])
+                if key[0] != self.device_id:
+                    entry["origin"] = key[0]
+                new_entries.append((entry, report))
+            if new_entries:
+                self.history.extend([entry for entry, _ in new_entries])
+                self._refresh()
+        if self.on_received:
+            for entry, report in new_entries:
+                try:
+                    self.on_received(entry, report)
+                except Exception as e:
+                    logger.error(f"Ошибка обработки полученного отчёта {entry.get('order')}: {e}")
+        return len(new_entries)
+
+    def pdf_target(self, name: str) -> Optional[str]:
+        """Куда записать принимаемый PDF; None — такой файл уже есть"""
+        name = _safe_name(name)
+        if name is None:
+            raise SyncError("Недопустимое имя PDF")
+        path = os.path.join(self.base_dir, name)
+        return None if os.path.exists(path) else path
+
+    # ---- Сервер
+
+    async def serve(self, host: Optional[str] = None, port: int = DEFAULT_PORT) -> asyncio.AbstractServer:
+        """Запустить сервер; по умолчанию — все интерфейсы при заданном ключе, иначе только 127.0.0.1"""
+        if host is None:
+            host = "0.0.0.0" if self.token else "127.0.0.1"
+        elif not self.token and host not in LOCAL_HOSTS:
+            raise SyncError(f"Без ключа синхронизации узел не открывается в сеть ({host})")
+        server = await asyncio.start_server(self._handle, host, port)
+        logger.info(f"Синхронизация: узел {self.device_id} слушает {host}:{server.sockets[0].getsockname()[1]}")
+        return server
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            method, path, headers = await asyncio.wait_for(_read_head(reader, request=True), TIMEOUT_SEC)
+            if self.token and not hmac.compare_digest(headers.get(TOKEN_HEADER, "").encode("utf-8"),
+                                                      self.token.encode("utf-8")):
+                await _respond(writer, 403, {"error": "forbidden"})
+                return
+            await self._route(method, path, headers, reader, writer)
+        except SyncError as e:
+            await _respond(writer, 400, {"error": str(e)})
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError) as e:
+            logger.debug(f"Синхронизация: соединение прервано: {e}")
+        except Exception as e:
+            logger.error(f"Синхронизация: ошибка обработки запроса: {e}")
+            await _respond(writer, 500, {"error": str(e)})
+        finally:
+            writer.close()
+
+    async def _route(self, method: str, path: str, headers: Dict[str, str], reader, writer):
+        parts = [unquote(p) for p in path.split("?", 1)[0].strip("/").split("/")]
+        length = int(headers.get("content-length") or 0)
+        if method == "GET" and parts == ["manifest"]:
+            await _respond(writer, 200, await _in_thread(self.manifest))
+        elif parts == ["reports"] and method in ("POST", "PUT"):
+            if length > MAX_JSON_BODY:
+                raise SyncError("Слишком большой пакет")
+            data = json.loads(await asyncio.wait_for(reader.readexactly(length), TIMEOUT_SEC))
+            if method == "POST":
+                keys = [(origin, seq) for origin, seq in data.get("keys", [])[:BATCH_SIZE]]
+                await _respond(writer, 200, {"reports": await _in_thread(self.export_reports, keys)})
+            else:
+                await _respond(writer, 200, {"added": await _in_thread(self.import_reports, data.get("reports", []))})
+        elif len(parts) == 3 and parts[0] == "pdf" and parts[2].isdigit():
+            key = (parts[1], int(parts[2]))
+            if method == "GET":
+                pdf = self.pdf_path(key)
+                if pdf is None:
+                    await _respond(writer, 404, {"error": "not found"})
+                else:
+                    await _send_file(writer, pdf)
+            elif method == "PUT":
+                if length > MAX_PDF_BODY:
+                    raise SyncError("Слишком большой PDF")
+                target = self.pdf_target(unquote(headers.get("x-file-name", "")))
+                if target is None:
+                    await _drain_body(reader, length)
+                else:
+                    await _receive_file(reader, length, target)
+                await _respond(writer, 200, {"stored": target is not None})
+            else:
+                await _respond(writer, 405, {"error": "method not allowed"})
+        else:
+            await _respond(writer, 404, {"error": "not found"})
+
+    # ---- Клиент
+
+    async def sync_with(self, peer: str, push: bool = True) -> Dict[str, Any]:
+        """Сеанс с узлом host:port: забрать недостающие отчёты и (push) отдать те, которых нет у него"""
+        client = _Client(peer, self.token)
+        loop = asyncio.get_running_loop()
+        t0 = loop.time()
+        theirs = await client.json("GET", "/manifest")
+        pulled = await _in_thread(self.missing_from, theirs)
+        pushed = _missing_in(await _in_thread(self.manifest), theirs) if push else []
+        gate = asyncio.Semaphore(SYNC_CONCURRENCY)
+        stats = {"peer": peer, "peer_device": theirs.get("device"), "pulled": 0, "pushed": 0, "errors": []}
+
+        async def fetch_pdf(payload: Dict[str, Any]):
+            async with gate:
+                target = self.pdf_target(payload["pdf"])
+                if target is not None:
+                    await client.download(_path("pdf", (payload["origin"], payload["entry"]["seq"])), target)
+
+        async def send_pdf(payload: Dict[str, Any]):
+            key = (payload["origin"], payload["entry"]["seq"])
+            pdf = self.pdf_path(key)
+            if pdf is not None:
+                async with gate:
+                    await client.upload(_path("pdf", key), pdf, payload["pdf"])
+
+        async def batch(keys: List[Key], pull: bool):
+            if pull:
+                payloads = (await client.json("POST", "/reports", {"keys": keys}))["reports"]
+            else:
+                payloads = await _in_thread(self.export_reports, keys)
+            with_pdf = [p for p in payloads if p.get("pdf")]
+            results = await asyncio.gather(*((fetch_pdf if pull else send_pdf)(p) for p in with_pdf),
+                                           return_exceptions=True)
+            # Отчёт без своего PDF не передаётся: при сбое он будет запрошен снова в следующий раз
+            failed = set()
+            for p, r in zip(with_pdf, results):
+                if isinstance(r, BaseException):
+                    failed.add(id(p))
+                    stats["errors"].append(f"PDF {p['pdf']}: {r}")
+            ready = [p for p in payloads if id(p) not in failed]
+            if pull:
+                stats["pulled"] += await _in_thread(self.import_reports, ready)
+            elif ready:
+                stats["pushed"] += (await client.json("PUT", "/reports", {"reports": ready}))["added"]
+
+        for keys, pull in ([(pulled[i:i + BATCH_SIZE], True) for i in range(0, len(pulled), BATCH_SIZE)]
+                           + [(pushed[i:i + BATCH_SIZE], False) for i in range(0, len(pushed), BATCH_SIZE)]):
+            try:
+                await batch(keys, pull)
+            except (SyncError, OSError, ValueError, asyncio.TimeoutError) as e:
+                stats["errors"].append(str(e))
+        stats["elapsed_sec"] = round(loop.time() - t0, 3)
+        for error in stats["errors"]:
+            logger.error(f"Синхронизация с {peer}: {error}")
+        logger.info("Синхронизация с %s (%s): получено %d, отправлено %d, ошибок %d, %.2f с",
+                    peer, stats["peer_device"], stats["pulled"], stats["pushed"], len(stats["errors"]),
+                    stats["elapsed_sec"])
+        return stats
+
+    async def sync_all(self, peers: List[str], push: bool = True) -> List[Dict[str, Any]]:
+        """Сеансы с узлами по очереди; недоступный узел или отказ не прерывают остальные"""
+        results = []
+        for peer in peers:
+            try:
+                results.append(await self.sync_with(peer, push=push))
+            except Exception as e:
+                logger.error(f"Синхронизация с {peer} не выполнена: {e}")
+                results.append({"peer": peer, "pulled": 0, "pushed": 0, "errors": [str(e)], "elapsed_sec": 0})
+        return results
+
+def _missing_in(ours: Dict[str, Any], theirs: Dict[str, Any]) -> List[Key]:
+    """Ключи наших отчётов, которых нет в манифесте узла theirs"""
+    missing: List[Key] = []
+    for origin, mine in ours["origins"].items():
+        other = theirs.get("origins", {}).get(origin)
+        gaps = mine["ranges"] if other is None else subtract_ranges(mine["ranges"], other["ranges"])
+        missing.extend((origin, seq) for lo, hi in gaps for seq in range(lo, hi + 1))
+    return missing
+
+def _path(kind: str, key: Key) -> str:
+    return f"/{kind}/{quote(key[0], safe='')}/{key[1]}"
+
+async def _in_thread(func: Callable, *args):
+    """Работа с диском (fsync истории, запись PDF и архивов) — в пуле потоков,
+    чтобы медленная запись одного узла не задерживала остальные соединения"""
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+# ---- Минимальный HTTP/1.1 поверх asyncio-потоков
+
+async def _read_head(reader: asyncio.StreamReader, request: bool) -> Tuple[str, str, Dict[str, str]]:
+    line = (await reader.readline()).decode("latin-1").rstrip("\r\n")
+    if not line:
+        raise asyncio.IncompleteReadError(b"", None)
+    first, second, _ = (line.split(" ", 2) + ["", ""])[:3]
+    headers: Dict[str, str] = {}
+    while True:
+        h = await reader.readline()
+        if h in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = h.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return (first, second, headers) if request else (second, first, headers)
+
+def _head(status_or_method: str, headers: Dict[str, Any]) -> bytes:
+    lines = [status_or_method] + [f"{k}: {v}" for k, v in headers.items()] + ["", ""]
+    return "\r\n".join(lines).encode("latin-1")
+
+async def _respond(writer: asyncio.StreamWriter, status: int, data: Any):
+    body = json.dumps(data, ensure_ascii=False, default=str).encode("utf-8")
+    writer.write(_head(f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}",
+                       {"Content-Type": "application/json; charset=utf-8", "Content-Length": len(body),
+                        "Connection": "close"}) + body)
+    await writer.drain()
+
+async def _write_file(writer: asyncio.StreamWriter, path: str):
+    with open(path, "rb") as f:
+        while True:
+            chunk = await _in_thread(f.read, CHUNK_SIZE)
+            if not chunk:
+                break
+            writer.write(chunk)
+            await writer.drain()
+
+async def _send_file(writer: asyncio.StreamWriter, path: str):
+    writer.write(_head("HTTP/1.1 200 OK", {"Content-Type": "application/pdf", "Connection": "close",
+                                           "Content-Length": os.path.getsize(path)}))
+    await _write_file(writer, path)
+
+async def _receive_file(reader: asyncio.StreamReader, length: int, target: str):
+    """Тело запроса в файл блоками; файл появляется под своим именем только целиком"""
+    tmp = target + ".part"
+    try:
+        f = await _in_thread(open, tmp, "wb")
+        try:
+            remaining = length
+            while remaining:
+                chunk = await asyncio.wait_for(reader.read(min(CHUNK_SIZE, remaining)), TIMEOUT_SEC)
+                if not chunk:
+                    raise asyncio.IncompleteReadError(b"", remaining)
+                await _in_thread(f.write, chunk)
+                remaining -= len(chunk)
+        finally:
+            await _in_thread(f.close)
+        await _in_thread(os.replace, tmp, target)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    storage.record_write(target, length)
+
+async def _drain_body(reader: asyncio.StreamReader, length: int):
+    while length:
+        chunk = await asyncio.wait_for(reader.read(min(CHUNK_SIZE, length)), TIMEOUT_SEC)
+        if not chunk:
+            break
+        length -= len(chunk)
+
+class _Client:
+    """Запросы к узлу; одно соединение на запрос (Connection: close)"""
+
+    def __init__(self, peer: str, token: str = ""):
+        host, _, port = peer.rpartition(":")
+        self.host, self.port = (host, int(port)) if host else (peer, DEFAULT_PORT)
+        self.token = token
+
+    async def _open(self, method: str, path: str, headers: Dict[str, Any]):
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), TIMEOUT_SEC)
+        headers = dict(headers, Host=f"{self.host}:{self.port}", Connection="close")
+        if self.token:
+            headers["X-Sync-Token"] = self.token
+        writer.write(_head(f"{method} {path} HTTP/1.1", headers))
+        return reader, writer
+
+    async def _response(self, reader, writer) -> Tuple[int, Dict[str, str]]:
+        await writer.drain()
+        status, _, headers = await asyncio.wait_for(_read_head(reader, request=False), TIMEOUT_SEC)
+        return int(status), headers
+
+    async def json(self, method: str, path: str, data: Any = None) -> Dict[str, Any]:
+        body = b"" if data is None else json.dumps(data, ensure_ascii=False, default=str).encode("utf-8")
+        reader, writer = await self._open(method, path, {"Content-Type": "application/json", "Content-Length": len(body)})
+        try:
+            writer.write(body)
+            status, headers = await self._response(reader, writer)
+            result = json.loads(await asyncio.wait_for(reader.readexactly(int(headers.get("content-length") or 0)),
+                                                       TIMEOUT_SEC) or b"{}")
+        finally:
+            writer.close()
+        if status != 200:
+            raise SyncError(f"{method} {path}: {status} {result.get('error', '')}")
+        return result
+
+    async def download(self, path: str, target: str):
+        reader, writer = await self._open("GET", path, {"Content-Length": 0})
+        try:
+            status, headers = await self._response(reader, writer)
+            if status != 200:
+                raise SyncError(f"GET {path}: {status}")
+            await _receive_file(reader, int(headers.get("content-length") or 0), target)
+        finally:
+            writer.close()
+
+    async def upload(self, path: str, source: str, name: str):
+        reader, writer = await self._open("PUT", path, {"Content-Type": "application/pdf", "X-File-Name": quote(name),
+                                                        "Content-Length": os.path.getsize(source)})
+        try:
+            await _write_file(writer, source)
+            status, headers = await self._response(reader, writer)
+            await reader.read()
+        finally:
+            writer.close()
+        if status != 200:
+            raise SyncError(f"PUT {path}: {status}")
+
+class SyncService:
+    """Узел синхронизации в фоновом потоке со своим циклом asyncio (для приложения)"""
+
+    def __init__(self, node: SyncNode, host: Optional[str] = None, port: int = DEFAULT_PORT):
+        self.node = node
+        self.host = host
+        self.port = port
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "SyncService":
+        self._loop = asyncio.new_event_loop()
+        self._server = self._loop.run_until_complete(self.node.serve(self.host, self.port))
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._thread = threading.Thread(target=self._loop.run_forever, name="lan-sync", daemon=True)
+        self._thread.start()
+        return self
+
+    def sync(self, peers: List[str], on_done: Optional[Callable[[List[Dict[str, Any]]], None]] = None):
+        """Синхронизация со списком узлов в фоне; on_done вызывается в потоке синхронизации"""
+
+        async def run():
+            results = await self.node.sync_all(peers)
+            if on_done:
+                on_done(results)
+
+        return asyncio.run_coroutine_threadsafe(run(), self._loop)
+
+    def stop(self):
+        if self._loop is None:
+            return
+
+        async def close():
+            self._server.close()
+            await self._server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(close(), self._loop).result(TIMEOUT_SEC)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(TIMEOUT_SEC)
+        self._loop.close()
+        self._loop = None
+        logger.info("Синхронизация остановлена")
+
+def _node_for(base_dir: str, device: Optional[str], token: str) -> SyncNode:
+    settings = read_json(os.path.join(base_dir, "settings.json"), {}) or {}
+    device = device or settings.get("device_id")
+    if not device:
+        device = hashlib.sha256(os.path.abspath(base_dir).encode("utf-8")).hexdigest()[:12]
+    return SyncNode(base_dir, device, token=token or settings.get("sync_token", ""))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Синхронизация истории и PDF CNC Checklist по локальной сети")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve", help="Запустить узел")
+    serve.add_argument("data_dir")
+    serve.add_argument("--host", help="Адрес (по умолчанию 0.0.0.0 с --token, иначе 127.0.0.1)")
+    serve.add_argument("--port", type=int, default=DEFAULT_PORT)
+    sync = sub.add_parser("sync", help="Синхронизироваться с узлами и выйти")
+    sync.add_argument("data_dir")
+    sync.add_argument("peers", nargs="+", help="host:port")
+    sync.add_argument("--pull-only", action="store_true")
+    for p in (serve, sync):
+        p.add_argument("--device", help="Идентификатор устройства (по умолчанию из settings.json)")
+        p.add_argument("--token", default="", help="Общий ключ узлов (заголовок X-Sync-Token)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    node = _node_for(args.data_dir, args.device, args.token)
+    if args.command == "serve":
+        async def run():
+            server = await node.serve(args.host, args.port)
+            async with server:
+                await server.serve_forever()
+        try:
+            asyncio.run(run())
+        except SyncError as e:
+            print(f"Ошибка: {e}", file=sys.stderr)
+            return 2
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    results = asyncio.run(node.sync_all(args.peers, push=not args.pull_only))
+    for r in results:
+        print(f"{r['peer']}: получено {r['pulled']}, отправлено {r['pushed']}, "
+              f"ошибок {len(r['errors'])}, {r['elapsed_sec']} с", file=sys.stderr)
+    return 1 if any(r["errors"] for r in results) else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,61 @@
+"""
+Чтение логов с конца файла с учётом ротации (cnc_checklist.log, .1 ... .5)
+"""
+import os
+import logging
+from typing import Callable, Iterator, List
+
+logger = logging.getLogger(__name__)
+
+BLOCK_SIZE = 64 * 1024
+LOG_BACKUP_COUNT = 5
+
+def rotated_files(base_path: str, backups: int = LOG_BACKUP_COUNT) -> List[str]:
+    """Существующие файлы лога от текущего к самому старому"""
+    paths = [base_path] + [f"{base_path}.{i}" for i in range(1, backups + 1)]
+    return [p for p in paths if os.path.exists(p)]
+
+def iter_lines_reverse(path: str, block_size: int = BLOCK_SIZE) -> Iterator[str]:
+    """Строки файла от последней к первой; читается блоками с конца"""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        tail = b""
+        while pos > 0:
+            step = min(block_size, pos)
+            pos -= step
+            f.seek(pos)
+            chunk = f.read(step) + tail
+            lines = chunk.split(b"\n")
+            # Первая строка блока может быть неполной — переносим её в следующий блок
+            tail = lines.pop(0)
+            for line in reversed(lines):
+                if line:
+                    yield line.decode("utf-8", errors="replace").rstrip("\r")
+        if tail:
+            yield tail.decode("utf-8", errors="replace").rstrip("\r")
+
+def iter_matching_lines(base_path: str, predicate: Callable[[str], bool],
+                        backups: int = LOG_BACKUP_COUNT, block_size: int = BLOCK_SIZE) -> Iterator[str]:
+    """Потоково: подходящие строки от самых новых к старым по всем ротированным файлам"""
+    for path in rotated_files(base_path, backups):
+        try:
+            for line in iter_lines_reverse(path, block_size):
+                if predicate(line):
+                    yield line
+        except OSError as e:
+            logger.warning(f"Не удалось прочитать лог {path}: {e}")
+
+def tail_matches(base_path: str, predicate: Callable[[str], bool], limit: int,
+                 backups: int = LOG_BACKUP_COUNT) -> List[str]:
+    """Последние limit подходящих строк в хронологическом порядке; чтение останавливается сразу"""
+    found = []
+    for line in iter_matching_lines(base_path, predicate, backups):
+        found.append(line)
+        if len(found) >= limit:
+            break
+    found.reverse()
+    return found
+
+def is_error_line(line: str) -> bool:
+    return " - ERROR - " in line or " - CRITICAL - " in line
@@ -4,10 +4,142 @@
 import logging
 import logging.handlers
 import os
+import queue
+import atexit
 from datetime import datetime
+from collections import deque
+from typing import Dict, List, Optional
 from kivy.app import App
 
-def setup_logging():
+from .performance_monitor import performance_monitor
+
+LOG_QUEUE_SIZE = 10000
+RECENT_LOG_RECORDS = 300
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler с ограниченной очередью и политикой переполнения.
+
+    Запись в файл/консоль выполняет QueueListener в отдельном потоке,
+    а вызывающий поток только кладёт запись в очередь. Сообщение
+    форматируется уже в потоке слушателя (record.msg % record.args).
+
+    Политика при заполненной очереди:
+      drop_new — отбросить новую запись;
+      drop_old — вытеснить самую старую запись.
+    Записи WARNING и выше всегда вытесняют старые.
+    """
+
+    def __init__(self, q: queue.Queue, policy: str = "drop_new"):
+        super().__init__(q)
+        self.policy = policy
+        self.enqueued = 0
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Без форматирования: только трассировка стека превращается в текст,
+        # чтобы не держать кадры исключения до обработки слушателем
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+            self.enqueued += 1
+            return
+        except queue.Full:
+            pass
+        if self.policy == "drop_old" or record.levelno >= logging.WARNING:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            self.dropped += 1
+            try:
+                self.queue.put_nowait(record)
+                self.enqueued += 1
+                return
+            except queue.Full:
+                pass
+        self.dropped += 1
+
+class RecentRecordsHandler(logging.Handler):
+    """Последние записи лога в памяти (для отчёта о сбое без чтения файла).
+
+    Запись только добавляется в deque; форматирование — при чтении.
+    """
+
+    def __init__(self, capacity: int = RECENT_LOG_RECORDS):
+        super().__init__(logging.DEBUG)
+        self.records = deque(maxlen=capacity)
+
+    def emit(self, record):
+        self.records.append(record)
+
+    def lines(self, limit: Optional[int] = None) -> List[str]:
+        records = list(self.records)
+        if limit is not None:
+            records = records[-limit:]
+        result = []
+        for r in records:
+            try:
+                result.append(self.format(r))
+            except Exception:
+                result.append(f"{r.levelname} {r.name}: {r.msg!r}")
+        return result
+
+_recent_records = RecentRecordsHandler()
+_queue_handler: Optional[BoundedQueueHandler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+_atexit_registered = False
+
+def get_recent_log_lines(limit: Optional[int] = None) -> List[str]:
+    """Последние строки лога из памяти"""
+    return _recent_records.lines(limit)
+
+def get_logging_stats() -> Dict:
+    """Счётчики асинхронного конвейера логирования"""
+    if _queue_handler is None:
+        return {"async": False}
+    return {
+        "async": True,
+        "policy": _queue_handler.policy,
+        "enqueued": _queue_handler.enqueued,
+        "dropped": _queue_handler.dropped,
+        "queue_size": _queue_handler.queue.qsize(),
+        "queue_capacity": _queue_handler.queue.maxsize,
+    }
+
+def set_log_level(logger_name: str, level) -> bool:
+    """Изменить уровень логгера на лету (например, 'app.persistence' -> 'WARNING').
+
+    Неизвестный уровень не применяется: ошибка пишется в лог, возвращается False.
+    """
+    log = logging.getLogger(__name__)
+    value = level
+    if isinstance(level, str):
+        value = logging._nameToLevel.get(level.strip().upper())
+    if not isinstance(value, int) or isinstance(value, bool):
+        log.error(f"Неизвестный уровень логирования {level!r} для {logger_name or 'root'}")
+        return False
+    logging.getLogger(logger_name or None).setLevel(value)
+    log.info(f"Уровень логгера {logger_name or 'root'}: {logging.getLevelName(value)}")
+    return True
+
+def apply_log_levels(levels: Dict[str, str]) -> None:
+    """Применить словарь {имя логгера: уровень}; неизвестные уровни пропускаются"""
+    for name, level in (levels or {}).items():
+        set_log_level(name, level)
+
+def shutdown_logging() -> None:
+    """Остановить слушатель очереди, дописав накопленные записи"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def setup_logging(queue_size: int = LOG_QUEUE_SIZE, overflow_policy: str = "drop_new"):
     """Настройка системы логирования"""
     
     # Получаем директорию приложения
@@ -34,6 +166,7 @@ def setup_logging():
     root_logger.setLevel(logging.DEBUG)
     
     # Удаляем существующие обработчики
+    shutdown_logging()
     for handler in root_logger.handlers[:]:
         root_logger.removeHandler(handler)
     
@@ -52,9 +185,19 @@ def setup_logging():
     console_handler.setLevel(logging.INFO)
     console_handler.setFormatter(formatter)
     
-    # Добавляем обработчики
-    root_logger.addHandler(file_handler)
-    root_logger.addHandler(console_handler)
+    # Файл и консоль обслуживает отдельный поток; в корневом логгере только очередь
+    global _queue_handler, _listener
+    _queue_handler = BoundedQueueHandler(queue.Queue(maxsize=queue_size), overflow_policy)
+    _listener = logging.handlers.QueueListener(
+        _queue_handler.queue, file_handler, console_handler, respect_handler_level=True)
+    _listener.start()
+    root_logger.addHandler(_queue_handler)
+    _recent_records.setFormatter(formatter)
+    root_logger.addHandler(_recent_records)
+    global _atexit_registered
+    if not _atexit_registered:
+        atexit.register(shutdown_logging)
+        _atexit_registered = True
     
     # Настраиваем логгеры для внешних библиотек
     logging.getLogger('kivy').setLevel(logging.WARNING)
@@ -124,59 +267,78 @@ def log_performance(func):
     return wrapper
 
 class AuditLogger:
-    """Класс для аудита действий пользователя"""
+    """Класс для аудита действий пользователя.
+
+    События пишутся в структурированный журнал audit/ (см. audit_log.AuditLog);
+    краткая строка дублируется в основной лог.
+    """
     
     def __init__(self):
         self.logger = logging.getLogger("audit")
         self.logger.setLevel(logging.INFO)
-        
-        # Создаем отдельный файл для аудита
-        app = App.get_running_app()
-        if app:
-            audit_file = os.path.join(app.user_data_dir, "audit.log")
-        else:
-            audit_file = "audit.log"
-            
-        audit_handler = logging.FileHandler(audit_file, encoding='utf-8')
-        audit_formatter = logging.Formatter(
-            '%(asctime)s - AUDIT - %(message)s',
-            datefmt='%Y-%m-%d %H:%M:%S'
-        )
-        audit_handler.setFormatter(audit_formatter)
-        self.logger.addHandler(audit_handler)
+        self._log = None
+        self.current_order: Optional[str] = None
+    
+    @property
+    def log(self):
+        """Журнал создаётся при первом событии, когда user_data_dir уже известен"""
+        if self._log is None:
+            from .audit_log import AuditLog
+            app = App.get_running_app()
+            base_dir = app.user_data_dir if app else os.getcwd()
+            self._log = AuditLog(os.path.join(base_dir, "audit"))
+        return self._log
+    
+    def log_event(self, event_type: str, order: Optional[str] = None, **data):
+        """Записать произвольное событие (по умолчанию — для текущего заказа)"""
+        order = order if order is not None else self.current_order
+        performance_monitor.incr("audit_events", event_type)
+        try:
+            self.log.append(event_type, order=order, **data)
+        except Exception as e:
+            self.logger.error(f"Не удалось записать событие аудита {event_type}: {e}")
+        self.logger.info("%s - Заказ: %s %s", event_type, order, data)
+    
+    def query(self, order: Optional[str] = None, event_type: Optional[str] = None, **kwargs):
+        """События из журнала по заказу и/или типу"""
+        return self.log.query(order=order, event_type=event_type, **kwargs)
+    
+    def set_order(self, order_number: Optional[str]):
+        """Заказ, к которому относятся последующие события (например, при возобновлении сессии)"""
+        self.current_order = order_number
     
     def log_session_start(self, order_number: str):
         """Логирование начала сессии"""
-        self.logger.info(f"СЕССИЯ_НАЧАЛО - Заказ: {order_number}")
+        self.set_order(order_number)
+        self.log_event("SESSION_START", order_number)
     
     def log_session_end(self, order_number: str, completed: bool):
         """Логирование завершения сессии"""
-        status = "ЗАВЕРШЕНА" if completed else "ПРЕРВАНА"
-        self.logger.info(f"СЕССИЯ_КОНЕЦ - Заказ: {order_number}, Статус: {status}")
+        self.log_event("SESSION_END", order_number, completed=completed)
     
-    def log_item_completion(self, item_id: str, status: bool, critical: bool):
+    def log_item_completion(self, item_id: str, status: bool, critical: bool,
+                            duration_sec: Optional[float] = None):
         """Логирование завершения пункта"""
-        status_text = "ВЫПОЛНЕН" if status else "НЕ_ВЫПОЛНЕН"
-        critical_text = " (КРИТИЧЕСКИЙ)" if critical else ""
-        self.logger.info(f"ПУНКТ_{status_text} - ID: {item_id}{critical_text}")
+        self.log_event("ITEM_COMPLETED", item_id=item_id, status=status, critical=critical,
+                       duration_sec=duration_sec)
     
     def log_master_bypass(self, item_id: str, master_name: str):
         """Логирование обхода критического пункта мастером"""
-        self.logger.info(f"ОБХОД_КРИТИЧЕСКОГО - Пункт: {item_id}, Мастер: {master_name}")
+        self.log_event("MASTER_BYPASS", item_id=item_id, master=master_name)
     
     def log_pin_attempt(self, pin_type: str, success: bool):
         """Логирование попытки ввода PIN"""
-        status = "УСПЕШНО" if success else "НЕУДАЧНО"
-        self.logger.info(f"PIN_{status} - Тип: {pin_type}")
+        if not success:
+            performance_monitor.incr("pin_failures", pin_type)
+        self.log_event("PIN_ATTEMPT", pin_type=pin_type, success=success)
     
     def log_pdf_generation(self, order_number: str, file_path: str):
         """Логирование генерации PDF"""
-        self.logger.info(f"PDF_СОЗДАН - Заказ: {order_number}, Файл: {file_path}")
+        self.log_event("PDF_CREATED", order_number, file=file_path)
     
     def log_email_send(self, order_number: str, recipients: list, success: bool):
         """Логирование отправки email"""
-        status = "УСПЕШНО" if success else "ОШИБКА"
-        self.logger.info(f"EMAIL_{status} - Заказ: {order_number}, Получатели: {recipients}")
+        self.log_event("EMAIL_SENT", order_number, recipients=list(recipients), success=success)
 
 # Глобальный экземпляр аудитора
 audit_logger = AuditLogger()
@@ -1,43 +1,92 @@
-import os, time, json, io, logging
+import os, time, json, io, logging, threading
 from datetime import datetime
+from .startup import startup_timer, install_import_profiler, end_entry_module, write_startup_report, warm_up_imports
+install_import_profiler(__package__, entry_module=f"{__package__}.main")
 from kivy.app import App
 from kivy.lang import Builder
+from kivy.factory import Factory
 from kivy.uix.screenmanager import ScreenManager, Screen
 from kivy.clock import Clock
 from kivy.utils import platform
-from kivy.uix.popup import Popup
-from kivy.uix.label import Label
-from kivy.uix.textinput import TextInput
-from kivy.uix.boxlayout import BoxLayout
-from kivy.uix.button import Button
 
 from .models import SessionState, Settings
 from .checklist_data import make_blocks
-from .persistence import load_json, save_json, sha, now_ts
-from .pdf_report import generate_pdf
+from .persistence import load_json, save_json, write_json, sha, now_ts
+from .history_store import HistoryStore
+from .history_index import HistoryQuery
+from .analytics_store import AnalyticsStore
+from .dialogs import DialogPool
+from .frame_probe import FrameProbe
 from . import android_utils
-from . import emailer
+# pdf_report (reportlab, PIL) и emailer (smtplib, ssl) импортируются при первом
+# использовании и прогреваются в фоне после показа первого экрана
 
 # Импорт системы логирования и диагностики
-from .logging_config import setup_logging, log_app_info, log_performance, audit_logger
+from .logging_config import setup_logging, log_app_info, log_performance, audit_logger, apply_log_levels, shutdown_logging
 from .diagnostics import DiagnosticsCollector
 from .performance_monitor import performance_monitor, monitor_performance
+from .tracing import tracer
+from .memory_snapshots import memory_tracker
+from .storage_accounting import storage
+from .perf_budgets import BudgetWatcher, load_budgets, BUDGETS_FILE
+end_entry_module()
 
 APP_VERSION = "1.3"
 DEFAULT_MASTER_PIN = "2969"
 DEFAULT_ADMIN_PIN = "7717"
 
+logger = logging.getLogger(__name__)
+
 AUTO_SAVE_SEC = 10
+FRAME_BUDGET_MS = 33
+BUDGET_CHECK_SEC = 30
+WARM_UP_IMPORTS = True
+HEAVY_MODULES = [f"{__package__}.pdf_report", f"{__package__}.emailer"]
+HISTORY_PAGE_SIZE = 50
+PROFILE_DURATIONS_SEC = (10, 30, 60)
 
 def j(obj): return json.loads(json.dumps(obj, default=lambda o: o.__dict__))
 
-class RootSM(ScreenManager): pass
+KV_DIR = os.path.join(os.path.dirname(__file__), "kv")
+
+# имя экрана -> (динамический класс из KV, файл правил или None для базового KV)
+SCREENS = {
+    "start": ("StartScreen", None),
+    "checklist": ("ChecklistScreen", "checklist.kv"),
+    "history": ("HistoryScreen", "history.kv"),
+    "settings": ("SettingsScreen", "settings.kv"),
+    "analytics": ("AnalyticsScreen", "analytics.kv"),
+}
+
+_loaded_kv = set()
+
+def load_kv_once(path):
+    """Разобрать KV-файл один раз за процесс; повторная загрузка дублировала бы правила"""
+    if path in _loaded_kv:
+        return
+    Builder.load_file(path)
+    _loaded_kv.add(path)
+
+class RootSM(ScreenManager):
+    """ScreenManager, создающий экраны при первом обращении к ним"""
+
+    def get_screen(self, name):
+        if not self.has_screen(name) and name in SCREENS:
+            cls_name, kv_file = SCREENS[name]
+            t0 = time.perf_counter()
+            if kv_file:
+                load_kv_once(os.path.join(KV_DIR, kv_file))
+            self.add_widget(Factory.get(cls_name)())
+            logger.info(f"Экран {name} построен за {(time.perf_counter()-t0)*1000:.1f} мс")
+        return super().get_screen(name)
 
 class CNCChecklistApp(App):
     def build(self):
+        startup_timer.mark("imports")
         # Настройка логирования
-        setup_logging()
-        log_app_info()
+        with startup_timer.phase("logging"):
+            setup_logging()
+            log_app_info()
         
         # Запуск мониторинга производительности
         performance_monitor.start_system_monitoring(interval=60)
@@ -45,20 +94,37 @@ class CNCChecklistApp(App):
         logger = logging.getLogger(__name__)
         logger.info("Инициализация приложения CNC Checklist")
         
+        self.dialogs = DialogPool()
         try:
-            Builder.load_file(os.path.join(os.path.dirname(__file__), "cnc_checklist.kv"))
+            with startup_timer.phase("kv_base"):
+                load_kv_once(os.path.join(os.path.dirname(__file__), "cnc_checklist.kv"))
             logger.info("KV файл загружен успешно")
             
-            self.sm = RootSM()
-            self.sm.add_widget(Builder.template("StartScreen")())
-            self.sm.add_widget(Builder.template("ChecklistScreen")())
-            self.sm.add_widget(Builder.template("HistoryScreen")())
-            self.sm.add_widget(Builder.template("SettingsScreen")())
-            logger.info("Экраны приложения инициализированы")
+            # Остальные экраны строятся при первом переходе (RootSM.get_screen)
+            with startup_timer.phase("start_screen"):
+                self.sm = RootSM()
+                self.sm.get_screen("start")
+            logger.info("Стартовый экран инициализирован")
             
-            self.state = None
-            self.settings = self._load_settings()
-            self.history_index = []
+            with startup_timer.phase("settings_and_state"):
+                self.state = None
+                self._photo_capture = None
+                self._profiler = None
+                self.last_profile = None
+                self.settings = self._load_settings()
+                apply_log_levels(self.settings.log_levels)
+                self.metrics_exporter = self._start_metrics_exporter()
+                performance_monitor.budgets = BudgetWatcher(load_budgets(os.path.join(self.user_data_dir, BUDGETS_FILE)))
+                storage.attach(self.user_data_dir)
+                self.history = HistoryStore(self.user_data_dir)
+                self.analytics = AnalyticsStore(self.user_data_dir)
+                self.sync_service = self._start_sync_service()
+                self._analytics_range = ("", "")
+                self._analytics_trigger = Clock.create_trigger(lambda dt: self.refresh_analytics())
+                self._history_query = HistoryQuery()
+                self._history_view = []
+                self._history_loaded = 0
+                self._history_filter_trigger = Clock.create_trigger(lambda dt: self.refresh_history())
             logger.info("Настройки загружены")
             
             Clock.schedule_interval(lambda dt: self.autosave(), AUTO_SAVE_SEC)
@@ -71,11 +137,71 @@ class CNCChecklistApp(App):
                 logger.info(f"Платформа: {platform}")
                 
             logger.info("Приложение успешно инициализировано")
+            startup_timer.mark("build_rest")
             return self.sm
         except Exception as e:
             logger.error(f"Ошибка при инициализации приложения: {e}")
             raise
 
+    def on_stop(self):
+        if getattr(self, "metrics_exporter", None):
+            self.metrics_exporter.stop()
+        if getattr(self, "sync_service", None):
+            self.sync_service.stop()
+        shutdown_logging()
+
+    def _start_metrics_exporter(self):
+        """Эндпоинт /metrics для Prometheus, если в настройках задан metrics_port"""
+        if not self.settings.metrics_port:
+            return None
+        from .metrics_exporter import MetricsExporter
+        try:
+            return MetricsExporter(performance_monitor, port=self.settings.metrics_port).start()
+        except OSError as e:
+            logger.error(f"Не удалось запустить экспорт метрик на порту {self.settings.metrics_port}: {e}")
+            return None
+
+    def _start_sync_service(self):
+        """Узел синхронизации истории и PDF с другими планшетами, если задан sync_port"""
+        if not self.settings.sync_port:
+            return None
+        if not self.settings.sync_token:
+            # Без ключа любой узел сети мог бы читать и дописывать историю
+            logger.error("Синхронизация не запущена: не задан sync_token")
+            return None
+        from .lan_sync import SyncNode, SyncService
+        node = SyncNode(self.user_data_dir, self.settings.device_id, history=self.history,
+                        token=self.settings.sync_token, on_received=self._sync_received)
+        try:
+            return SyncService(node, port=self.settings.sync_port).start()
+        except OSError as e:
+            logger.error(f"Не удалось запустить синхронизацию на порту {self.settings.sync_port}: {e}")
+            return None
+
+    def _sync_received(self, entry, report):
+        """Отчёт, полученный с другого планшета (поток синхронизации)"""
+        if report is not None:
+            self.analytics.add_report(report, origin=entry.get("origin"))
+
+    def on_start(self):
+        # Первый кадр отрисован на следующем тике Clock
+        Clock.schedule_once(self._on_first_frame, 0)
+
+    def _on_first_frame(self, dt):
+        startup_timer.mark("first_frame")
+        startup_timer.log_summary()
+        self.frame_probe = FrameProbe(budget_ms=FRAME_BUDGET_MS)
+        self.frame_probe.attach()
+        Clock.schedule_interval(lambda dt: performance_monitor.budgets.check_frames(self.frame_probe), BUDGET_CHECK_SEC)
+        Clock.schedule_once(lambda dt: self.dialogs.prewarm(), 0.5)
+        storage.reconcile_async()
+        # Индекс фильтра истории — в фоне, чтобы первый ввод в фильтр не разбирал весь файл
+        self.history.build_index_async(on_ready=lambda: Clock.schedule_once(self._history_index_ready, 0))
+        if install_import_profiler(__package__):
+            write_startup_report(os.path.join(self.user_data_dir, "startup_report.json"))
+        elif WARM_UP_IMPORTS:
+            warm_up_imports(HEAVY_MODULES)
+
     def _load_settings(self)->Settings:
         logger.info("Загрузка настроек приложения")
         d = load_json("settings.json", None)
@@ -87,14 +213,23 @@ class CNCChecklistApp(App):
             logger.info("Настройки по умолчанию сохранены")
         else:
             logger.info("Настройки загружены из файла")
-        return Settings(**d)
+        settings = Settings(**d)
+        if not settings.device_id:
+            import uuid
+            settings.device_id = uuid.uuid4().hex[:12]
+            save_json("settings.json", settings.__dict__)
+            logger.info(f"Идентификатор устройства: {settings.device_id}")
+        return settings
 
     # ======== Навигация
     def go_start(self):
         self.sm.current = "start"
     def go_history(self):
-        self.refresh_history()
         self.sm.current = "history"
+        self.refresh_history()
+    def go_analytics(self):
+        self.sm.current = "analytics"
+        self.refresh_analytics()
     def open_settings(self):
         self._require_admin_pin(self._open_settings_after_pin)
     def _open_settings_after_pin(self):
@@ -115,24 +250,18 @@ class CNCChecklistApp(App):
         if existing and not existing.get("completed"):
             logger.info("Найдена незавершенная сессия, предлагаем выбор пользователю")
             # Есть незавершённая — предложить продолжить/сбросить
-            box = BoxLayout(orientation='vertical', spacing=8, padding=8)
-            box.add_widget(Label(text="Найдена незавершённая сессия."))
-            bb = BoxLayout(size_hint_y=None, height='48dp', spacing=8)
-            b1 = Button(text="Продолжить")
-            b2 = Button(text="Начать заново")
-            bb.add_widget(b1); bb.add_widget(b2)
-            box.add_widget(bb)
-            popup = Popup(title="Выбор", content=box, size_hint=(.8,.4))
-            b1.bind(on_release=lambda *_: (popup.dismiss(), self._resume_session(existing)))
-            b2.bind(on_release=lambda *_: (popup.dismiss(), self._new_session(order)))
-            popup.open()
+            self.dialogs.choice("Выбор", "Найдена незавершённая сессия.", [
+                ("Продолжить", lambda: self._resume_session(existing)),
+                ("Начать заново", lambda: self._new_session(order)),
+            ])
         else:
             logger.info("Создание новой сессии")
             self._new_session(order)
 
     def _resume_session(self, d):
         logger.info("Возобновление существующей сессии")
-        self.state = SessionState(**d["state"])
+        self.state = SessionState.from_dict(d["state"])
+        audit_logger.set_order(self.state.order_number)
         logger.info(f"Сессия возобновлена для заказа: {self.state.order_number}")
         self._enter_checklist()
 
@@ -146,6 +275,7 @@ class CNCChecklistApp(App):
         self.state = SessionState(order_number=order, started_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"), blocks=blocks)
         save_json("session.json", {"state": j(self.state), "completed": False})
         logger.info("Новая сессия создана и сохранена")
+        memory_tracker.checkpoint(f"session_start:{order}")
         self._enter_checklist()
 
     def _enter_checklist(self):
@@ -165,7 +295,7 @@ class CNCChecklistApp(App):
         screen.ids.item_text.text = f"{it.id}. {it.text}"
         # Прогресс
         total = sum(len(x.items) for x in self.state.blocks)
-        done = sum(1 for bl in self.state.blocks for i in bl.items if i.completed_at)
+        done = sum(1 for bl in self.state.blocks for i in bl.items if i.completed_ns)
         screen.ids.progress.value = 100*done/max(1,total)
 
     def show_hint(self):
@@ -174,24 +304,31 @@ class CNCChecklistApp(App):
 
     def add_note(self):
         _, it = self._current()
-        ti = TextInput(text=it.note, multiline=True)
-        box = BoxLayout(orientation='vertical', spacing=8, padding=8)
-        box.add_widget(ti)
-        bb = BoxLayout(size_hint_y=None, height='48dp', spacing=8)
-        b = Button(text="Сохранить"); bb.add_widget(b); box.add_widget(bb)
-        p = Popup(title="Заметка", content=box, size_hint=(.9,.6))
-        b.bind(on_release=lambda *_:(setattr(it,'note',ti.text), p.dismiss(), self.autosave()))
-        p.open()
+        def save(text):
+            it.note = text
+            self.autosave()
+        self.dialogs.text("Заметка", save, text=it.note, multiline=True,
+                          button_text="Сохранить", size_hint=(.9,.6))
 
     def add_photo(self):
         photos_dir = os.path.join(self.user_data_dir, "photos")
         os.makedirs(photos_dir, exist_ok=True)
         fname = datetime.now().strftime("%Y%m%d_%H%M%S") + ".jpg"
         fpath = os.path.join(photos_dir, fname)
-        uri = android_utils.take_photo_to(fpath)
-        if uri or os.path.exists(fpath):
-            _, it = self._current()
-            it.photos.append(fpath)
+        if self._photo_capture and not self._photo_capture.done():
+            self._photo_capture.cancel()
+        _, it = self._current()
+        self._photo_capture = android_utils.take_photo_async(
+            fpath, on_done=lambda fut: self._photo_captured(it, fut))
+
+    def _photo_captured(self, it, fut):
+        if fut.cancelled():
+            logger.info("Съемка фото отменена")
+            return
+        path = fut.result()
+        if path:
+            storage.record_write(path)
+            it.photos.append(path)
             self._popup_info("Фото добавлено.")
             self.autosave()
         else:
@@ -199,15 +336,15 @@ class CNCChecklistApp(App):
 
     def mark(self, ok:bool):
         b, it = self._current()
-        logger.info(f"Отметка пункта {it.id}: {'✓' if ok else '✗'} (критический: {it.critical})")
+        logger.info("Отметка пункта %s: %s (критический: %s)", it.id, '✓' if ok else '✗', it.critical)
         
-        if it.started_at is None:
-            it.started_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            logger.info(f"Пункт {it.id} начат в {it.started_at}")
+        if it.started_ns is None:
+            it.started_ns, it.started_mono_ns = time.time_ns(), time.monotonic_ns()
+            logger.info("Пункт %s начат", it.id)
             
         # Критический «✗» — блокировка с мастер-PIN
         if not ok and it.critical:
-            logger.warning(f"Попытка отметить критический пункт {it.id} как невыполненный, требуется мастер-PIN")
+            logger.warning("Попытка отметить критический пункт %s как невыполненный, требуется мастер-PIN", it.id)
             self._require_master_pin(lambda master_name: self._mark_after_master(it, master_name))
             return
         self._complete_item(it, ok)
@@ -224,24 +361,20 @@ class CNCChecklistApp(App):
     def _complete_item(self, it, ok):
         logger = logging.getLogger(__name__)
         
-        if it.started_at is None:
-            it.started_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        it.completed_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        now_ns, mono_ns = time.time_ns(), time.monotonic_ns()
+        if it.started_ns is None:
+            it.started_ns, it.started_mono_ns = now_ns, mono_ns
+        it.completed_ns = now_ns
         it.status = ok
-        logger.info(f"Пункт {it.id} завершен в {it.completed_at} со статусом {'✓' if ok else '✗'}")
+        # Длительность по монотонным часам; если пункт начат до перезапуска — по времени эпохи
+        if it.started_mono_ns is not None:
+            it.duration_ns = mono_ns - it.started_mono_ns
+        else:
+            it.duration_ns = max(0, now_ns - it.started_ns)
+        logger.info("Пункт %s завершен со статусом %s за %.3f с", it.id, '✓' if ok else '✗', it.duration_ns / 1e9)
         
         # Аудит завершения пункта
-        audit_logger.log_item_completion(it.id, ok, it.critical)
-        
-        # duration
-        try:
-            t0 = datetime.strptime(it.started_at, "%Y-%m-%d %H:%M:%S")
-            t1 = datetime.strptime(it.completed_at, "%Y-%m-%d %H:%M:%S")
-            it.duration_sec = int((t1 - t0).total_seconds())
-            logger.info(f"Пункт {it.id} выполнялся {it.duration_sec} секунд")
-        except Exception as e:
-            logger.error(f"Ошибка при вычислении времени выполнения пункта {it.id}: {e}")
-            it.duration_sec = None
+        audit_logger.log_item_completion(it.id, ok, it.critical, it.duration_sec)
         self.autosave()
         self._refresh_checklist_ui()
 
@@ -255,6 +388,7 @@ class CNCChecklistApp(App):
             self.state.current_item_idx += 1
         else:
             # следующий блок
+            memory_tracker.checkpoint(f"block_done:{b.id}")
             if self.state.current_block_idx + 1 < len(self.state.blocks):
                 self.state.current_block_idx += 1
                 self.state.current_item_idx = 0
@@ -279,6 +413,8 @@ class CNCChecklistApp(App):
         self.settings.report_seq += 1
         save_json("settings.json", self.settings.__dict__)
 
+        bypasses = sum(1 for b in self.state.blocks for i in b.items if i.bypassed_by_master)
+
         # Формируем структуру отчёта
         report = {
             "order": self.state.order_number,
@@ -287,12 +423,14 @@ class CNCChecklistApp(App):
             "completed_at": completed_at,
             "version": self.state.version,
             "seq": report_seq,
+            "device": self.settings.device_id,
             "blocks": []
         }
         for b in self.state.blocks:
             report["blocks"].append({
+                "id": b.id,
                 "title": b.title,
-                "items": [i.__dict__ for i in b.items]
+                "items": [i.to_report() for i in b.items]
             })
 
         # Имя файла
@@ -300,9 +438,13 @@ class CNCChecklistApp(App):
         fname = f"{ts}_{self.state.order_number}_nesting_{report_seq:04d}.pdf"
 
         # Пишем PDF в bytes
+        from .pdf_report import generate_pdf
         tmp_dir = self.user_data_dir
         tmp_pdf = os.path.join(tmp_dir, fname)
-        generate_pdf(report, tmp_pdf)
+        with performance_monitor.timed("pdf_render"):
+            generate_pdf(report, tmp_pdf)
+        memory_tracker.checkpoint("after_generate_pdf")
+        storage.record_write(tmp_pdf)
         audit_logger.log_pdf_generation(report['order'], tmp_pdf)
         
         # Если выбран SAF — копируем в выбранную папку
@@ -314,14 +456,23 @@ class CNCChecklistApp(App):
                 android_utils.write_bytes_to_saf(uri, data)
                 saved_uri = uri
         # История
-        hist = load_json("history.json", [])
-        hist.append({"order": report["order"], "file": tmp_pdf, "created_at": completed_at, "seq": report_seq})
-        save_json("history.json", hist)
+        self.history.append({"order": report["order"], "file": tmp_pdf, "created_at": completed_at, "seq": report_seq,
+                             "bypasses": bypasses})
+        # Архив завершённой сессии — источник данных для аналитики по пунктам
+        sessions_dir = os.path.join(self.user_data_dir, "sessions")
+        os.makedirs(sessions_dir, exist_ok=True)
+        write_json(os.path.join(sessions_dir, fname[:-len(".pdf")] + ".json"), report)
+        try:
+            self.analytics.add_report(report)
+        except Exception as e:
+            logger.error(f"Ошибка обновления аналитики: {e}")
 
         # SMTP
         if self.settings.smtp_enabled and self.settings.smtp_recipients:
             try:
-                emailer.send_mail(self.settings.__dict__, f"Отчёт CNC {report['order']}", "См. вложение", [tmp_pdf])
+                from . import emailer
+                with performance_monitor.timed("email_send"):
+                    emailer.send_mail(self.settings.__dict__, f"Отчёт CNC {report['order']}", "См. вложение", [tmp_pdf])
                 audit_logger.log_email_send(report['order'], self.settings.smtp_recipients, True)
             except Exception as e:
                 audit_logger.log_email_send(report['order'], self.settings.smtp_recipients, False)
@@ -334,50 +485,108 @@ class CNCChecklistApp(App):
 
     # ======== История
     def refresh_history(self):
-        hist = load_json("history.json", [])
-        screen = self.sm.get_screen("history")
-        gl = screen.ids.hist_list
-        gl.clear_widgets()
-        from kivy.uix.button import Button
-        for row in reversed(hist):
-            btn = Button(text=f"{row['created_at']}  {row['order']}  →  {os.path.basename(row['file'])}",
-                         size_hint_y=None, height='46dp')
-            def _open(_btn, path=row["file"]): 
-                if platform == "android":
-                    from jnius import autoclass, cast
-                    Intent = autoclass('android.content.Intent')
-                    Uri = autoclass('android.net.Uri')
-                    File = autoclass('java.io.File')
-                    intent = Intent(Intent.ACTION_VIEW)
-                    uri = Uri.fromFile(File(path))
-                    intent.setDataAndType(uri, "application/pdf")
-                    mActivity = autoclass('org.kivy.android.PythonActivity').mActivity
-                    mActivity.startActivity(intent)
-                else:
-                    os.startfile(path) if os.name == 'nt' else os.system(f'xdg-open "{path}"')
-            btn.bind(on_release=_open)
-            gl.add_widget(btn)
-
-    def apply_history_filter(self, order: str, ymd: str):
-        hist = load_json("history.json", [])
-        if order: hist = [h for h in hist if order in h["order"]]
-        if ymd: hist = [h for h in hist if h["created_at"].startswith(ymd)]
-        save_json("history_filtered.json", hist)
-        self.refresh_history()
+        """Показать первую страницу отфильтрованной истории; остальные подгружаются при прокрутке"""
+        rv = self.sm.get_screen("history").ids.hist_rv
+        view = self.history.query(self._history_query, wait=False)
+        self._history_view = view if view is not None else []
+        self._history_loaded = 0
+        if view is None:
+            rv.data = [{"text": "Индексация истории…", "path": ""}]
+        else:
+            rv.data = self._history_rows(HISTORY_PAGE_SIZE)
+        rv.scroll_y = 1
+
+    def _history_index_ready(self, dt):
+        """Индекс построен: обновить список, если фильтр ждал индекса"""
+        if self.sm.current == "history" and not self._history_query.is_empty():
+            self.refresh_history()
+
+    def load_more_history(self, rv):
+        """Подгрузка следующей страницы, когда прокрутка дошла до конца списка"""
+        if rv.scroll_y > 0.05 or self._history_loaded >= len(self._history_view):
+            return
+        rv.data.extend(self._history_rows(HISTORY_PAGE_SIZE))
+
+    def _history_rows(self, limit):
+        positions = self._history_view[self._history_loaded:self._history_loaded + limit]
+        self._history_loaded += len(positions)
+        rows = []
+        for pos in positions:
+            row = self.history.get(pos)
+            name = os.path.basename(row["file"]) if row.get("file") else "PDF нет на этом планшете"
+            rows.append({"text": f"{row.get('created_at', '')}  {row.get('order', '')}  →  {name}",
+                         "path": row.get("file") or ""})
+        return rows
+
+    # ======== Аналитика
+    def refresh_analytics(self):
+        """Строки экрана аналитики из дневных корзин за выбранный интервал"""
+        date_from, date_to = self._analytics_range
+        rows = [{"text": "[b]Чаще всего не выполнены (критические)[/b]"}]
+        for r in self.analytics.top_failed_critical(date_from, date_to):
+            rows.append({"text": f"{r['item']}  ✗ {r['failed']} из {r['count']} ({r['fail_rate']:.0%}), обходов: {r['bypassed']}  {r['text']}"})
+        if len(rows) == 1:
+            rows.append({"text": "Нет данных"})
+        rows.append({"text": "[b]Среднее время по пунктам[/b]"})
+        for r in self.analytics.item_stats(date_from, date_to):
+            avg = f"{r['avg_sec']:.0f} с" if r["avg_sec"] is not None else "—"
+            crit = " [КРИТ.]" if r["critical"] else ""
+            rows.append({"text": f"{r['item']}{crit}  {avg}  (n={r['count']})  {r['text']}"})
+        self.sm.get_screen("analytics").ids.an_rv.data = rows
+
+    def analytics_filter_changed(self, screen):
+        ids = screen.ids
+        self._analytics_range = (ids.an_date_from.text.strip(), ids.an_date_to.text.strip())
+        self._analytics_trigger()
+
+    def analytics_last_days(self, screen, days):
+        """Быстрый выбор интервала; 0 — за всё время"""
+        from datetime import timedelta
+        today = datetime.now().date()
+        screen.ids.an_date_from.text = (today - timedelta(days=days - 1)).isoformat() if days else ""
+        screen.ids.an_date_to.text = today.isoformat() if days else ""
+
+    def open_history_file(self, path):
+        if not path:
+            return
+        if platform == "android":
+            from jnius import autoclass, cast
+            Intent = autoclass('android.content.Intent')
+            Uri = autoclass('android.net.Uri')
+            File = autoclass('java.io.File')
+            intent = Intent(Intent.ACTION_VIEW)
+            uri = Uri.fromFile(File(path))
+            intent.setDataAndType(uri, "application/pdf")
+            mActivity = autoclass('org.kivy.android.PythonActivity').mActivity
+            mActivity.startActivity(intent)
+        else:
+            os.startfile(path) if os.name == 'nt' else os.system(f'xdg-open "{path}"')
+
+    def history_filter_changed(self, screen):
+        ids = screen.ids
+        self.apply_history_filter(ids.filt_order.text, ids.filt_date_from.text, ids.filt_date_to.text,
+                                  ids.filt_seq_from.text, ids.filt_seq_to.text, ids.filt_bypass.active)
+
+    def apply_history_filter(self, order: str, date_from: str, date_to: str,
+                             seq_from: str = "", seq_to: str = "", bypass_only: bool = False):
+        """Вызывается при каждом изменении полей фильтра; обновление — раз в кадр"""
+        def _int(text):
+            text = (text or "").strip()
+            return int(text) if text.isdigit() else None
+        self._history_query = HistoryQuery(
+            order_prefix=(order or "").strip(),
+            date_from=(date_from or "").strip(),
+            date_to=(date_to or "").strip(),
+            has_bypass=True if bypass_only else None,
+            seq_min=_int(seq_from),
+            seq_max=_int(seq_to),
+        )
+        self._history_filter_trigger()
 
     # ======== Настройки
     def change_pins(self):
-        def ask_pin(title, cb):
-            ti = TextInput(password=True, multiline=False)
-            box = BoxLayout(orientation='vertical', spacing=8, padding=8)
-            box.add_widget(Label(text=title)); box.add_widget(ti)
-            b = Button(text="OK", size_hint_y=None, height='44dp')
-            box.add_widget(b)
-            p = Popup(title="PIN", content=box, size_hint=(.7,.4))
-            b.bind(on_release=lambda *_:(p.dismiss(), cb(ti.text)))
-            p.open()
-        ask_pin("Новый мастер-PIN", lambda mp:
-            ask_pin("Новый админ-PIN", lambda ap: self._save_pins(mp, ap)))
+        self.dialogs.pin("Новый мастер-PIN", lambda mp:
+            self.dialogs.pin("Новый админ-PIN", lambda ap: self._save_pins(mp, ap)))
     def _save_pins(self, master, admin):
         self.settings.master_pin_hash = sha(master.strip())
         self.settings.admin_pin_hash = sha(admin.strip())
@@ -385,6 +594,15 @@ class CNCChecklistApp(App):
         save_json("settings.json", self.settings.__dict__)
         self._popup_info("PIN-коды обновлены.")
 
+    def set_log_level(self, logger_name, level):
+        """Сменить уровень логгера без перезапуска и сохранить в настройках"""
+        from .logging_config import set_log_level
+        if not set_log_level(logger_name, level):
+            self._popup_info(f"Неизвестный уровень логирования: {level}")
+            return
+        self.settings.log_levels[logger_name] = level
+        save_json("settings.json", self.settings.__dict__)
+
     def choose_folder(self):
         uri = android_utils.choose_saf_folder()
         if uri:
@@ -403,24 +621,113 @@ class CNCChecklistApp(App):
         self._popup_info("Откройте app/settings.json и заполните SMTP (host/port/tls/ssl/user/pass, recipients).")
 
     def export_logs(self):
-        """Экспорт логов и диагностической информации"""
+        """Экспорт диагностического пакета (ZIP) в выбранную папку SAF или в user_data_dir"""
+        logger.info("Экспорт диагностической информации")
         try:
-            logger = logging.getLogger(__name__)
-            logger.info("Экспорт диагностической информации")
-            
-            # Создаем диагностический отчет
-            collector = DiagnosticsCollector()
-            diagnostics_file = collector.export_diagnostics()
-            
-            # Экспортируем метрики производительности
-            metrics_file = os.path.join(self.user_data_dir, f"performance_metrics_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
-            performance_monitor.export_metrics(metrics_file)
-            
-            self._popup_info(f"Диагностика экспортирована:\n{os.path.basename(diagnostics_file)}\n{os.path.basename(metrics_file)}")
-            
+            # Снимок состояния — в главном потоке; упаковка логов и файлов — в фоне
+            diagnostics = DiagnosticsCollector().collect_all_diagnostics()
+            metrics = performance_monitor.metrics_data()
+            trace = tracer.chrome_trace()
+            settings = dict(self.settings.__dict__)
         except Exception as e:
             logger.error(f"Ошибка при экспорте диагностики: {e}")
             self._popup_info(f"Ошибка при экспорте: {e}")
+            return
+        name = f"cnc_diagnostics_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+        threading.Thread(target=self._write_diagnostics_bundle, name="diagnostics-bundle", daemon=True,
+                         args=(name, diagnostics, metrics, trace, settings)).start()
+        self._popup_info("Диагностический пакет собирается…")
+
+    def _write_diagnostics_bundle(self, name, diagnostics, metrics, trace, settings):
+        from .diag_bundle import write_bundle
+        try:
+            uri = None
+            if self.settings.saf_tree_uri:
+                uri = android_utils.create_saf_file(self.settings.saf_tree_uri, name, "application/zip")
+            if uri:
+                with android_utils.open_saf_stream(uri) as f:
+                    entries = write_bundle(f, self.user_data_dir, diagnostics, metrics, trace, settings)
+                where = "в выбранную папку"
+            else:
+                path = os.path.join(self.user_data_dir, name)
+                with open(path, "wb") as f:
+                    entries = write_bundle(f, self.user_data_dir, diagnostics, metrics, trace, settings)
+                storage.record_write(path)
+                where = "в папку приложения"
+            text = f"Диагностика экспортирована {where}:\n{name}\n(файлов в пакете: {len(entries)})"
+        except Exception as e:
+            logger.error(f"Ошибка при экспорте диагностики: {e}")
+            text = f"Ошибка при экспорте: {e}"
+        Clock.schedule_once(lambda dt: self._popup_info(text), 0)
+
+    def sync_now(self):
+        """Синхронизация истории и PDF с планшетами из sync_peers"""
+        if self.sync_service is None:
+            self._popup_info("Синхронизация выключена: задайте sync_port и sync_token в настройках")
+            return
+        if not self.settings.sync_peers:
+            self.dialogs.text("Адреса планшетов (host:port через запятую)", self._save_sync_peers,
+                              button_text="Синхронизировать")
+            return
+
+        def done(results):
+            lines = [f"{r['peer']}: получено {r['pulled']}, отправлено {r['pushed']}"
+                     + (f", ошибок {len(r['errors'])}" if r["errors"] else "") for r in results]
+            Clock.schedule_once(lambda dt: self._sync_done(lines), 0)
+
+        self.sync_service.sync(list(self.settings.sync_peers), on_done=done)
+        self._popup_info("Синхронизация…")
+
+    def _save_sync_peers(self, text):
+        peers = [p.strip() for p in text.split(",") if p.strip()]
+        if peers:
+            self.settings.sync_peers = peers
+            save_json("settings.json", self.settings.__dict__)
+            self.sync_now()
+
+    def _sync_done(self, lines):
+        if self.sm.current == "history":
+            self.refresh_history()
+        self._popup_info("Синхронизация завершена\n" + "\n".join(lines))
+
+    def capture_profile(self):
+        """Снять сэмплирующий профиль (экран настроек открывается только по админ-PIN)"""
+        if self._profiler is not None:
+            self._popup_info("Профилирование уже идёт.")
+            return
+        self.dialogs.choice("Профилирование", "Сколько секунд сэмплировать?",
+                            [(f"{sec} с", lambda sec=sec: self._start_profile(sec)) for sec in PROFILE_DURATIONS_SEC])
+
+    def _start_profile(self, seconds):
+        from .sampling_profiler import SamplingProfiler
+        self._profiler = SamplingProfiler()
+        self._profiler.start(seconds, on_done=self._profile_done)
+        self._popup_info(f"Профилирование {seconds} с запущено.\nПовторите медленное действие.")
+
+    def _profile_done(self, profiler):
+        # Вызывается из потока профилировщика: файлы пишем здесь, UI — через Clock
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        try:
+            collapsed = profiler.write_collapsed(os.path.join(self.user_data_dir, f"profile_{stamp}.collapsed"))
+            top = profiler.write_summary(os.path.join(self.user_data_dir, f"profile_{stamp}_top.json"))
+            storage.record_write(collapsed)
+            storage.record_write(top)
+            self.last_profile = dict(profiler.summary(limit=10), files=[os.path.basename(collapsed), os.path.basename(top)])
+            text = f"Профиль сохранён:\n{os.path.basename(collapsed)}\n{os.path.basename(top)}"
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении профиля: {e}")
+            text = f"Ошибка при сохранении профиля: {e}"
+        self._profiler = None
+        Clock.schedule_once(lambda dt: self._popup_info(text), 0)
+
+    def toggle_memory_tracing(self):
+        """Режим диагностики памяти: снимки tracemalloc в контрольных точках (замедляет работу)"""
+        if memory_tracker.enabled:
+            memory_tracker.stop()
+            self._popup_info("Диагностика памяти выключена.")
+        else:
+            memory_tracker.start()
+            self._popup_info("Диагностика памяти включена.\nРост памяти между начатой сессией,\nблоками и PDF попадёт в экспорт диагностики.")
 
     # ======== PIN-охранники
     def _locked(self)->bool:
@@ -446,32 +753,22 @@ class CNCChecklistApp(App):
             self._popup_info("Ввод PIN заблокирован временно."); return
         # мастер-пин + ввод ФИО
         def after_ok():
-            ti = TextInput(hint_text="ФИО мастера", multiline=False)
-            box = BoxLayout(orientation='vertical', spacing=8, padding=8)
-            box.add_widget(ti)
-            b = Button(text="OK", size_hint_y=None, height='44dp')
-            box.add_widget(b)
-            p = Popup(title="ФИО мастера", content=box, size_hint=(.7,.4))
-            b.bind(on_release=lambda *_:(p.dismiss(), ok_cb(ti.text.strip() or "Мастер")))
-            p.open()
+            self.dialogs.text("ФИО мастера", lambda name: ok_cb(name.strip() or "Мастер"),
+                              hint="ФИО мастера")
         self._ask_pin("Мастер-PIN для обхода", self.settings.master_pin_hash, after_ok)
 
     def _ask_pin(self, title, expected_hash, ok_cb):
-        ti = TextInput(password=True, multiline=False)
-        box = BoxLayout(orientation='vertical', spacing=8, padding=8)
-        box.add_widget(Label(text=title)); box.add_widget(ti)
-        b = Button(text="ОК", size_hint_y=None, height='44dp'); box.add_widget(b)
-        p = Popup(title="PIN", content=box, size_hint=(.7,.4))
-        def chk(*_):
-            if sha(ti.text.strip()) == expected_hash:
+        pin_type = "ADMIN" if "админ" in title.lower() else "MASTER"
+        def chk(text):
+            if sha(text.strip()) == expected_hash:
                 self._reset_pin_fail()
-                audit_logger.log_pin_attempt("ADMIN" if "админ" in title.lower() else "MASTER", True)
-                p.dismiss(); ok_cb()
-            else:
-                self._register_pin_fail()
-                audit_logger.log_pin_attempt("ADMIN" if "админ" in title.lower() else "MASTER", False)
-                self._popup_info("Неверный PIN.")
-        b.bind(on_release=chk); p.open()
+                audit_logger.log_pin_attempt(pin_type, True)
+                return True
+            self._register_pin_fail()
+            audit_logger.log_pin_attempt(pin_type, False)
+            self._popup_info("Неверный PIN.")
+            return False
+        self.dialogs.pin(title, lambda _: ok_cb(), validate=chk)
 
     # ======== Вспомогательные
     def autosave(self):
@@ -479,14 +776,15 @@ class CNCChecklistApp(App):
             logger.debug("Нет активной сессии для автосохранения")
             return
         try:
-            save_json("session.json", {"state": j(self.state), "completed": False})
+            with performance_monitor.timed("autosave"):
+                save_json("session.json", {"state": j(self.state), "completed": False})
             logger.debug("Автосохранение выполнено успешно")
         except Exception as e:
-            logger.error(f"Ошибка при автосохранении: {e}")
+            logger.error("Ошибка при автосохранении: %s", e)
             
     def _popup_info(self, text):
-        logger.info(f"Показ сообщения пользователю: {text}")
-        Popup(title="Сообщение", content=Label(text=text), size_hint=(.85,.4)).open()
+        logger.info("Показ сообщения пользователю: %s", text)
+        self.dialogs.info(text)
 
 if __name__ == "__main__":
     CNCChecklistApp().run()
@@ -0,0 +1,107 @@
+"""
+Снимки tracemalloc в контрольных точках и рост памяти между ними (поиск утечек)
+"""
+import time
+import logging
+import tracemalloc
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TRACE_FRAMES = 10
+TOP_LIMIT = 15
+
+# Служебные аллокации, которые не относятся к приложению
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+def _top_growth(stats, limit: int) -> List[Dict]:
+    """Записи с наибольшим приростом (из Snapshot.compare_to)"""
+    result = []
+    for st in stats:
+        if st.size_diff <= 0:
+            continue
+        frame = st.traceback[0]
+        result.append({
+            "location": f"{frame.filename}:{frame.lineno}" if frame.lineno else frame.filename,
+            "size_diff_kb": round(st.size_diff / 1024, 1),
+            "size_kb": round(st.size / 1024, 1),
+            "count_diff": st.count_diff,
+        })
+        if len(result) >= limit:
+            break
+    return result
+
+class MemoryTracker:
+    """Режим диагностики памяти для администратора.
+
+    Пока tracemalloc включён, checkpoint(label) делает снимок и
+    сравнивает его с предыдущим: топ прироста по строкам и по файлам
+    сохраняется в diffs. Храним только последний снимок; при
+    выключенном режиме checkpoint ничего не стоит.
+    """
+
+    def __init__(self, nframes: int = TRACE_FRAMES, keep_diffs: int = 50):
+        self.nframes = nframes
+        self.diffs = deque(maxlen=keep_diffs)
+        self._last: Optional[tracemalloc.Snapshot] = None
+        self._last_label: Optional[str] = None
+
+    @property
+    def enabled(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.nframes)
+        self._last, self._last_label = None, None
+        self.checkpoint("tracing_started")
+        logger.info(f"tracemalloc включён ({self.nframes} кадров стека)")
+
+    def stop(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self._last, self._last_label = None, None
+        logger.info("tracemalloc выключен")
+
+    def checkpoint(self, label: str) -> Optional[Dict]:
+        """Снимок в контрольной точке; возвращает разницу с предыдущим снимком"""
+        if not tracemalloc.is_tracing():
+            return None
+        t0 = time.perf_counter()
+        snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        current, peak = tracemalloc.get_traced_memory()
+        diff = None
+        if self._last is not None:
+            diff = {
+                "timestamp": datetime.now().isoformat(),
+                "from": self._last_label,
+                "to": label,
+                "traced_kb": round(current / 1024, 1),
+                "peak_kb": round(peak / 1024, 1),
+                "top_lines": _top_growth(snapshot.compare_to(self._last, "lineno"), TOP_LIMIT),
+                "top_files": _top_growth(snapshot.compare_to(self._last, "filename"), TOP_LIMIT),
+            }
+            diff["total_growth_kb"] = round(sum(x["size_diff_kb"] for x in diff["top_files"]), 1)
+            self.diffs.append(diff)
+        self._last, self._last_label = snapshot, label
+        logger.debug("Снимок памяти %s: %.0f КБ, %.0f мс", label, current / 1024,
+                     (time.perf_counter() - t0) * 1000)
+        return diff
+
+    def to_dict(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "last_checkpoint": self._last_label,
+            "diffs": list(self.diffs),
+        }
+
+# Глобальный экземпляр
+memory_tracker = MemoryTracker()
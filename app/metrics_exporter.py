@@ -0,0 +1,123 @@
+"""
+HTTP-эндпоинт /metrics в текстовом формате OpenMetrics (Prometheus), только stdlib
+"""
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+PREFIX = "cnc"
+QUANTILES = (0.5, 0.95, 0.99)
+
+# колонка SampleRing -> (метрика, множитель к базовой единице)
+SYSTEM_GAUGES = {
+    "system_cpu": ("system_cpu_ratio", 0.01),
+    "system_memory_percent": ("system_memory_used_ratio", 0.01),
+    "system_memory_available_gb": ("system_memory_available_bytes", 1024 ** 3),
+    "disk_usage_percent": ("disk_used_ratio", 0.01),
+    "disk_free_gb": ("disk_free_bytes", 1024 ** 3),
+    "process_memory_mb": ("process_resident_memory_bytes", 1024 ** 2),
+    "process_cpu": ("process_cpu_ratio", 0.01),
+}
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _num(value: float) -> str:
+    return repr(float(value)) if value == value else "NaN"
+
+def render_openmetrics(monitor) -> str:
+    """Текст экспозиции из уже агрегированного состояния PerformanceMonitor"""
+    out: List[str] = []
+    add = out.append
+
+    name = f"{PREFIX}_operation_duration_seconds"
+    add(f"# TYPE {name} summary")
+    add(f"# UNIT {name} seconds")
+    add(f"# HELP {name} Длительность операций monitor_performance / timed")
+    for op, agg in list(monitor.aggregates.items()):
+        label = _escape(op)
+        for q in QUANTILES:
+            v = agg.percentile(q)
+            if v is not None:
+                add(f'{name}{{name="{label}",quantile="{q}"}} {_num(v)}')
+        add(f'{name}_sum{{name="{label}"}} {_num(agg.total)}')
+        add(f'{name}_count{{name="{label}"}} {agg.count}')
+
+    latest = monitor.system_metrics.latest()
+    if latest is not None:
+        for column, (metric, scale) in SYSTEM_GAUGES.items():
+            add(f"# TYPE {PREFIX}_{metric} gauge")
+            add(f"{PREFIX}_{metric} {_num(latest[column] * scale)}")
+        add(f"# TYPE {PREFIX}_system_samples counter")
+        add(f"{PREFIX}_system_samples_total {monitor.system_metrics.total}")
+
+    probe = monitor.frame_probe
+    if probe is not None:
+        add(f"# TYPE {PREFIX}_frames counter")
+        add(f"{PREFIX}_frames_total {probe.frames}")
+        add(f"# TYPE {PREFIX}_frames_over_budget counter")
+        add(f"{PREFIX}_frames_over_budget_total {probe.over_budget}")
+        add(f"# TYPE {PREFIX}_frame_max_seconds gauge")
+        add(f"{PREFIX}_frame_max_seconds {_num(probe.max_ms / 1000)}")
+
+    for counter, by_label in list(monitor.counters.items()):
+        add(f"# TYPE {PREFIX}_{counter} counter")
+        for label, value in list(by_label.items()):
+            labels = f'{{type="{_escape(label)}"}}' if label else ""
+            add(f"{PREFIX}_{counter}_total{labels} {value}")
+
+    add("# EOF")
+    return "\n".join(out) + "\n"
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "CNCChecklistMetrics/1.0"
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_openmetrics(self.server.monitor).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        logger.debug("metrics %s - %s", self.address_string(), fmt % args)
+
+class MetricsExporter:
+    """Фоновый HTTP-сервер для Prometheus; port=0 — выбрать свободный порт"""
+
+    def __init__(self, monitor, host: str = "0.0.0.0", port: int = 9108):
+        self.monitor = monitor
+        self.host = host
+        self.port = port
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host = "127.0.0.1" if self.host in ("", "0.0.0.0") else self.host
+        return f"http://{host}:{self.port}/metrics"
+
+    def start(self) -> "MetricsExporter":
+        self._server = ThreadingHTTPServer((self.host, self.port), _Handler)
+        self._server.daemon_threads = True
+        self._server.monitor = self.monitor
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-exporter", daemon=True)
+        self._thread.start()
+        logger.info(f"Экспорт метрик OpenMetrics: {self.url}")
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            logger.info("Экспорт метрик остановлен")
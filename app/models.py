@@ -1,10 +1,23 @@
 import logging
 from dataclasses import dataclass, field
-from typing import List, Optional, Dict
+from typing import Any, List, Optional, Dict
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+TS_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+def format_ns(ns: Optional[int]) -> str:
+    """Время эпохи в наносекундах -> строка отчёта ("" — нет отметки)"""
+    return datetime.fromtimestamp(ns / 1e9).strftime(TS_FORMAT) if ns else ""
+
+def _parse_ts(text: Optional[str]) -> Optional[int]:
+    """Строка старого формата -> наносекунды эпохи (только при загрузке старых сессий)"""
+    try:
+        return int(datetime.strptime(text, TS_FORMAT).timestamp()) * 1_000_000_000 if text else None
+    except ValueError:
+        return None
+
 @dataclass
 class ItemAudit:
     timestamp: str
@@ -20,12 +33,43 @@ class ChecklistItem:
     status: Optional[bool] = None  # True=✓, False=✗, None=не начато
     note: str = ""
     photos: List[str] = field(default_factory=list)
-    started_at: Optional[str] = None
-    completed_at: Optional[str] = None
-    duration_sec: Optional[int] = None
+    started_ns: Optional[int] = None     # time.time_ns() — для отчёта
+    completed_ns: Optional[int] = None
+    duration_ns: Optional[int] = None    # по time.monotonic_ns(), не зависит от перевода часов
+    started_mono_ns: Optional[int] = None  # действителен только в текущем запуске (см. SessionState.from_dict)
     bypassed_by_master: Optional[str] = None  # ФИО мастера при обходе критического
     audit: List[ItemAudit] = field(default_factory=list)
 
+    @property
+    def duration_sec(self) -> Optional[float]:
+        return self.duration_ns / 1e9 if self.duration_ns is not None else None
+
+    def to_report(self) -> Dict[str, Any]:
+        """Пункт для отчёта и архива сессии: строки времени формируются только здесь"""
+        d = {k: v for k, v in self.__dict__.items() if k != "started_mono_ns"}
+        d["audit"] = [a.__dict__ for a in self.audit]
+        d["started_at"] = format_ns(self.started_ns) or None
+        d["completed_at"] = format_ns(self.completed_ns) or None
+        d["duration_sec"] = round(self.duration_sec, 3) if self.duration_ns is not None else None
+        return d
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "ChecklistItem":
+        d = dict(d)
+        # Монотонные часы не переживают перезагрузку планшета: после возобновления
+        # длительность незавершённого пункта считается по времени эпохи
+        d.pop("started_mono_ns", None)
+        started_at, completed_at = d.pop("started_at", None), d.pop("completed_at", None)
+        duration_sec = d.pop("duration_sec", None)
+        if d.get("started_ns") is None:
+            d["started_ns"] = _parse_ts(started_at)
+        if d.get("completed_ns") is None:
+            d["completed_ns"] = _parse_ts(completed_at)
+        if d.get("duration_ns") is None and duration_sec is not None:
+            d["duration_ns"] = int(duration_sec * 1e9)
+        d["audit"] = [a if isinstance(a, ItemAudit) else ItemAudit(**a) for a in d.get("audit", [])]
+        return cls(**d)
+
 @dataclass
 class Block:
     id: str
@@ -41,6 +85,14 @@ class SessionState:
     current_item_idx: int = 0
     version: str = "1.3"
 
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "SessionState":
+        """Состояние из session.json: блоки и пункты восстанавливаются как объекты, а не словари"""
+        d = dict(d)
+        d["blocks"] = [Block(id=b["id"], title=b["title"], items=[ChecklistItem.from_dict(i) for i in b["items"]])
+                       for b in d.get("blocks", [])]
+        return cls(**d)
+
 @dataclass
 class Settings:
     admin_pin_hash: str
@@ -58,3 +110,9 @@ class Settings:
     smtp_pass_app: str = ""
     smtp_recipients: List[str] = field(default_factory=list)
     report_seq: int = 1  # авто-нумерация
+    log_levels: Dict[str, str] = field(default_factory=dict)  # {"app.persistence": "WARNING"}
+    metrics_port: int = 0  # порт эндпоинта /metrics (OpenMetrics); 0 — выключен
+    device_id: str = ""  # идентификатор планшета для синхронизации; создаётся при первом запуске
+    sync_port: int = 0  # порт узла синхронизации по локальной сети (lan_sync); 0 — выключен
+    sync_peers: List[str] = field(default_factory=list)  # ["192.168.1.21:8765", ...]
+    sync_token: str = ""  # общий ключ узлов синхронизации
@@ -7,6 +7,8 @@ from reportlab.lib.units import mm
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 
+from .tracing import traced
+
 logger = logging.getLogger(__name__)
 
 FONT_NAME = "DejaVuSans"
@@ -15,40 +17,42 @@ FONT_PATH = os.path.join(os.path.dirname(__file__), "assets", "fonts", "DejaVuSa
 def ensure_font():
     logger.info("Проверка наличия шрифта")
     if not os.path.exists(FONT_PATH):
-        logger.error(f"Шрифт не найден: {FONT_PATH}")
+        logger.error("Шрифт не найден: %s", FONT_PATH)
         raise RuntimeError("Шрифт DejaVuSans.ttf не найден. Его скачает GitHub Actions, либо положите вручную в app/assets/fonts/")
     if FONT_NAME not in pdfmetrics.getRegisteredFontNames():
         logger.info("Регистрация шрифта")
         pdfmetrics.registerFont(TTFont(FONT_NAME, FONT_PATH))
         logger.info("Шрифт зарегистрирован")
     else:
-        logger.info("Шрифт уже зарегистрирован")
+        logger.debug("Шрифт уже зарегистрирован")
 
 def _draw_text(c, x, y, text, size=10):
     c.setFont(FONT_NAME, size)
     c.drawString(x, y, text)
 
+@traced("shrink_image_to_jpeg_bytes")
 def shrink_image_to_jpeg_bytes(path:str, max_px:int=1600, quality:int=80)->bytes:
-    logger.info(f"Обработка изображения: {path}")
+    logger.info("Обработка изображения: %s", path)
     try:
         im = Image.open(path).convert("RGB")
         original_size = im.size
         im.thumbnail((max_px,max_px))
         new_size = im.size
-        logger.info(f"Изображение изменено с {original_size} на {new_size}")
+        logger.info("Изображение изменено с %s на %s", original_size, new_size)
         
         bio = io.BytesIO()
         im.save(bio, format="JPEG", quality=quality, optimize=True)
         result_size = len(bio.getvalue())
-        logger.info(f"Изображение сжато до {result_size} байт")
+        logger.info("Изображение сжато до %d байт", result_size)
         return bio.getvalue()
     except Exception as e:
-        logger.error(f"Ошибка при обработке изображения {path}: {e}")
+        logger.error("Ошибка при обработке изображения %s: %s", path, e)
         raise
 
+@traced("generate_pdf")
 def generate_pdf(report, out_path:str):
-    logger.info(f"Генерация PDF отчета: {out_path}")
-    logger.info(f"Заказ: {report['order']}")
+    logger.info("Генерация PDF отчета: %s", out_path)
+    logger.info("Заказ: %s", report['order'])
     
     try:
         ensure_font()
@@ -70,7 +74,7 @@ def generate_pdf(report, out_path:str):
         logger.info("Начало создания таблицы пунктов")
         
         for b in report["blocks"]:
-            logger.info(f"Обработка блока: {b['title']}")
+            logger.debug("Обработка блока: %s", b['title'])
             _draw_text(c, m, y, b["title"], 11); y -= 5*mm
             for it in b["items"]:
                 status = "✓" if it["status"] is True else ("✗" if it["status"] is False else "—")
@@ -78,7 +82,9 @@ def generate_pdf(report, out_path:str):
                 line = f"{it['id']} {status}{crit}  {it['text']}"
                 _draw_text(c, m+5*mm, y, line)
                 y -= 5*mm
-                _draw_text(c, m+10*mm, y, f"Нач: {it.get('started_at','')}  Оконч: {it.get('completed_at','')}  Длит: {it.get('duration_sec','')} сек.")
+                dur = it.get("duration_sec")
+                dur = f"{dur:.1f}" if isinstance(dur, (int, float)) else ""
+                _draw_text(c, m+10*mm, y, f"Нач: {it.get('started_at') or ''}  Оконч: {it.get('completed_at') or ''}  Длит: {dur} сек.")
                 y -= 5*mm
                 if it.get("note"):
                     _draw_text(c, m+10*mm, y, f"Заметка: {it['note']}")
@@ -97,11 +103,11 @@ def generate_pdf(report, out_path:str):
             for it in b["items"]:
                 photos += it.get("photos", [])
             if photos:
-                logger.info(f"Добавление {len(photos)} фотографий для блока: {b['title']}")
+                logger.info("Добавление %d фотографий для блока: %s", len(photos), b['title'])
                 c.showPage(); y = H - m; ensure_font()
                 _draw_text(c, m, y, f"Фото – {b['title']}", 12); y -= 10*mm
                 for p in photos:
-                    logger.info(f"Добавление фото: {p}")
+                    logger.info("Добавление фото: %s", p)
                     img_bytes = shrink_image_to_jpeg_bytes(p)
                     bio = io.BytesIO(img_bytes)
                     iw, ih = Image.open(io.BytesIO(img_bytes)).size
@@ -114,7 +120,7 @@ def generate_pdf(report, out_path:str):
                     y -= (ph + 8*mm)
         c.showPage()
         c.save()
-        logger.info(f"PDF отчет успешно создан: {out_path}")
+        logger.info("PDF отчет успешно создан: %s", out_path)
     except Exception as e:
-        logger.error(f"Ошибка при создании PDF отчета: {e}")
+        logger.error("Ошибка при создании PDF отчета: %s", e)
         raise
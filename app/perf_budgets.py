@@ -0,0 +1,167 @@
+"""
+Бюджеты производительности: целевые p95 по операциям monitor_performance и по кадрам UI.
+
+Бюджеты по умолчанию — DEFAULT_BUDGETS; файл perf_budgets.json в
+user_data_dir (тот же формат) переопределяет отдельные значения:
+
+  {"operations": {"pdf_generation": {"p95_sec": 8.0, "min_count": 3}},
+   "frame": {"p95_ms": 33}}
+
+Проверка экспортированных метрик (performance_metrics_*.json) как
+pass/fail-гейт, код возврата 1 при нарушении:
+
+  python -m app.perf_budgets performance_metrics_20250101_120000.json [--budgets perf_budgets.json]
+"""
+import os
+import json
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+BUDGETS_FILE = "perf_budgets.json"
+TRACE_SPANS_LIMIT = 50
+
+DEFAULT_BUDGETS: Dict[str, Any] = {
+    "operations": {
+        "new_session_creation": {"p95_sec": 0.5, "min_count": 3},
+        "pdf_generation": {"p95_sec": 10.0, "min_count": 3},
+        "pdf_render": {"p95_sec": 8.0, "min_count": 3},
+        "autosave": {"p95_sec": 0.1, "min_count": 10},
+        "email_send": {"p95_sec": 15.0, "min_count": 3},
+    },
+    "frame": {"p95_ms": 33.4, "min_count": 300},
+}
+
+def load_budgets(path: Optional[str] = None) -> Dict[str, Any]:
+    """Бюджеты по умолчанию с переопределениями из файла path (если он есть)"""
+    budgets = {"operations": {k: dict(v) for k, v in DEFAULT_BUDGETS["operations"].items()},
+               "frame": dict(DEFAULT_BUDGETS["frame"])}
+    if path and os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                override = json.load(f)
+            for name, budget in override.get("operations", {}).items():
+                budgets["operations"].setdefault(name, {}).update(budget)
+            budgets["frame"].update(override.get("frame", {}))
+            logger.info(f"Бюджеты производительности загружены из {path}")
+        except Exception as e:
+            logger.error(f"Ошибка чтения бюджетов {path}: {e}")
+    return budgets
+
+def check_operation(name: str, p95_sec: Optional[float], count: int, budgets: Dict) -> Optional[Dict]:
+    """Нарушение бюджета операции или None (бюджета нет, мало замеров, всё в норме)"""
+    budget = budgets["operations"].get(name)
+    if not budget or p95_sec is None or count < budget.get("min_count", 1):
+        return None
+    if p95_sec <= budget["p95_sec"]:
+        return None
+    return {"kind": "operation", "name": name, "p95_sec": round(p95_sec, 4),
+            "budget_p95_sec": budget["p95_sec"], "count": count}
+
+def check_frames(p95_ms: Optional[float], frames: int, budgets: Dict) -> Optional[Dict]:
+    budget = budgets.get("frame") or {}
+    if "p95_ms" not in budget or p95_ms is None or frames < budget.get("min_count", 1):
+        return None
+    if p95_ms <= budget["p95_ms"]:
+        return None
+    return {"kind": "frame", "name": "frame", "p95_ms": p95_ms,
+            "budget_p95_ms": budget["p95_ms"], "count": frames}
+
+def evaluate_export(metrics: Dict, budgets: Dict) -> List[Dict]:
+    """Нарушения по файлу export_metrics(); используется как гейт в бенчмарках/CI"""
+    breaches = []
+    by_name = (metrics.get("summary") or {}).get("by_name", {})
+    for name, s in by_name.items():
+        breach = check_operation(name, s.get("p95_duration"), s.get("count", 0), budgets)
+        if breach:
+            breaches.append(breach)
+    frames = metrics.get("frame_timing") or {}
+    breach = check_frames(frames.get("p95_ms"), frames.get("frames", 0), budgets)
+    if breach:
+        breaches.append(breach)
+    return breaches
+
+def _trace_of(name: str) -> List[Dict]:
+    """Последний span операции и его потомки — компактно, для записи в аудит"""
+    from .tracing import tracer
+    root = tracer.last_span(name)
+    if root is None:
+        return []
+    spans = tracer.subtree(root)[:TRACE_SPANS_LIMIT]
+    return [{"id": s.id, "parent": s.parent_id, "name": s.name,
+             "offset_ms": round((s.start_ns - root.start_ns) / 1e6, 2),
+             "duration_ms": round(s.duration_ns / 1e6, 2) if s.end_ns else None} for s in spans]
+
+class BudgetWatcher:
+    """Проверка бюджетов по живым агрегатам PerformanceMonitor.
+
+    check() вызывается после каждого замера операции и стоит одного
+    расчёта p95 по гистограмме. О нарушении сообщается один раз при
+    переходе «в норме → нарушен»: предупреждение в лог, событие
+    PERF_BUDGET_BREACH в аудит с трассой последнего выполнения и запись
+    в breaches для диагностики.
+    """
+
+    def __init__(self, budgets: Dict[str, Any], keep_breaches: int = 50):
+        self.budgets = budgets
+        self.breaches = deque(maxlen=keep_breaches)
+        self._breached: set = set()
+
+    def check(self, name: str, aggregate):
+        if name not in self.budgets["operations"]:
+            return
+        self._update(name, check_operation(name, aggregate.percentile(0.95), aggregate.count, self.budgets))
+
+    def check_frames(self, frame_probe):
+        if frame_probe is not None:
+            self._update("frame", check_frames(frame_probe.percentile(0.95), frame_probe.frames, self.budgets))
+
+    def _update(self, key: str, breach: Optional[Dict]):
+        if breach is None:
+            if key in self._breached:
+                self._breached.discard(key)
+                logger.info(f"Бюджет производительности {key} снова выполняется")
+            return
+        if key in self._breached:
+            return
+        self._breached.add(key)
+        breach["timestamp"] = datetime.now().isoformat()
+        trace = _trace_of(key) if breach["kind"] == "operation" else []
+        logger.warning("Нарушен бюджет производительности: %s", breach)
+        self.breaches.append(dict(breach, trace=trace))
+        try:
+            from .logging_config import audit_logger
+            audit_logger.log_event("PERF_BUDGET_BREACH", **breach, trace=trace)
+        except Exception as e:
+            logger.error(f"Не удалось записать нарушение бюджета в аудит: {e}")
+
+    def to_dict(self) -> Dict:
+        return {"budgets": self.budgets, "breached": sorted(self._breached),
+                "breaches": list(self.breaches)}
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Проверка метрик CNC Checklist по бюджетам производительности")
+    parser.add_argument("metrics", nargs="+", help="Файлы performance_metrics_*.json")
+    parser.add_argument("--budgets", help="Файл бюджетов (по умолчанию — встроенные)")
+    args = parser.parse_args(argv)
+
+    budgets = load_budgets(args.budgets)
+    failed = False
+    for path in args.metrics:
+        with open(path, "r", encoding="utf-8") as f:
+            breaches = evaluate_export(json.load(f), budgets)
+        for b in breaches:
+            failed = True
+            budget = b.get("budget_p95_sec", b.get("budget_p95_ms"))
+            actual = b.get("p95_sec", b.get("p95_ms"))
+            print(f"FAIL {path}: {b['name']} p95={actual} > {budget} (n={b['count']})")
+        if not breaches:
+            print(f"OK   {path}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
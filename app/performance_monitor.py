@@ -2,15 +2,32 @@
 Модуль для мониторинга производительности приложения CNC Checklist
 """
 import time
+import math
 import logging
-import psutil
+import itertools
 import threading
+import functools
+from array import array
+from collections import deque
+from contextlib import contextmanager
 from typing import Dict, List, Optional
 from dataclasses import dataclass, field
 from datetime import datetime
 
+from .tracing import Span, tracer
+
 logger = logging.getLogger(__name__)
 
+_psutil = None
+
+def get_psutil():
+    """psutil импортируется при первом измерении, а не при загрузке модуля"""
+    global _psutil
+    if _psutil is None:
+        import psutil
+        _psutil = psutil
+    return _psutil
+
 @dataclass
 class PerformanceMetric:
     """Метрика производительности"""
@@ -21,26 +38,207 @@ class PerformanceMetric:
     memory_usage: Optional[float] = None
     cpu_usage: Optional[float] = None
     details: Dict = field(default_factory=dict)
+    span: Optional[Span] = None
+    cpu_time_start: Optional[float] = None  # user + system процесса на старте, с
+
+class LogHistogram:
+    """Гистограмма с логарифмическими корзинами фиксированного размера.
+
+    Граница корзины i — min_value * growth**i; относительная ошибка
+    перцентиля не больше (growth - 1) / 2. Значения вне диапазона
+    попадают в крайние корзины.
+    """
+
+    def __init__(self, min_value: float = 1e-4, max_value: float = 1e3, growth: float = 1.1):
+        self.min_value = min_value
+        self.growth = growth
+        self._log_growth = math.log(growth)
+        self.counts = [0] * (int(math.log(max_value / min_value) / self._log_growth) + 2)
+
+    def bucket(self, value: float) -> int:
+        if value <= self.min_value:
+            return 0
+        return min(len(self.counts) - 1, int(math.log(value / self.min_value) / self._log_growth) + 1)
+
+    def upper_bound(self, i: int) -> float:
+        return self.min_value * self.growth ** i
+
+    def add(self, value: float):
+        self.counts[self.bucket(value)] += 1
+
+    def percentile(self, q: float, total: int) -> Optional[float]:
+        """Значение q-перцентиля (q от 0 до 1) — середина корзины в логарифмической шкале"""
+        if not total:
+            return None
+        target = q * total
+        acc = 0
+        for i, c in enumerate(self.counts):
+            acc += c
+            if c and acc >= target:
+                return self.upper_bound(i) / math.sqrt(self.growth) if i else self.min_value
+        return self.upper_bound(len(self.counts) - 1)
+
+class MetricAggregate:
+    """Потоковые агрегаты одной метрики: count/sum/min/max и гистограмма длительностей"""
+
+    __slots__ = ("count", "total", "min", "max", "histogram", "memory_max_mb", "last_memory_mb")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.histogram = LogHistogram()
+        self.memory_max_mb = 0.0
+        self.last_memory_mb: Optional[float] = None
+
+    def add(self, duration: float, memory_mb: Optional[float] = None):
+        self.count += 1
+        self.total += duration
+        if duration < self.min:
+            self.min = duration
+        if duration > self.max:
+            self.max = duration
+        self.histogram.add(duration)
+        if memory_mb is not None:
+            self.last_memory_mb = memory_mb
+            self.memory_max_mb = max(self.memory_max_mb, memory_mb)
+
+    def percentile(self, q: float) -> Optional[float]:
+        p = self.histogram.percentile(q, self.count)
+        # Оценка по корзине не выходит за фактические min/max
+        return None if p is None else min(max(p, self.min), self.max)
+
+    def summary(self) -> Dict:
+        return {
+            "count": self.count,
+            "avg_duration": self.total / self.count if self.count else None,
+            "min_duration": self.min if self.count else None,
+            "max_duration": self.max if self.count else None,
+            "p50_duration": self.percentile(0.50),
+            "p95_duration": self.percentile(0.95),
+            "p99_duration": self.percentile(0.99),
+            "last_memory_mb": self.last_memory_mb,
+            "max_memory_mb": self.memory_max_mb or None,
+        }
+
+class SampleRing:
+    """Кольцевой буфер замеров в типизированных колонках array('d').
+
+    Память выделяется один раз при создании; новый замер перезаписывает
+    самый старый, без списков словарей и срезов.
+    """
+
+    def __init__(self, columns, capacity: int = 1000):
+        self.columns = tuple(columns)
+        self.capacity = capacity
+        self._data = {c: array("d", bytes(8 * capacity)) for c in self.columns}
+        self._head = 0
+        self.total = 0
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    def latest(self) -> Optional[Dict[str, float]]:
+        """Последний замер или None"""
+        if not self.total:
+            return None
+        i = (self._head - 1) % self.capacity
+        return {c: self._data[c][i] for c in self.columns}
+
+    def append(self, **values) -> Dict[str, float]:
+        i = self._head
+        for c in self.columns:
+            self._data[c][i] = values[c]
+        self._head = (i + 1) % self.capacity
+        self.total += 1
+        return values
+
+    def _indices(self, n: int) -> List[int]:
+        n = min(n, len(self))
+        return [(self._head - n + k) % self.capacity for k in range(n)]
+
+    def column(self, name: str, n: int) -> List[float]:
+        """Последние n значений колонки (от старых к новым)"""
+        data = self._data[name]
+        return [data[i] for i in self._indices(n)]
+
+    def last(self, n: int) -> List[Dict]:
+        """Последние n замеров в виде словарей (для экспорта)"""
+        rows = []
+        for i in self._indices(n):
+            row = {c: self._data[c][i] for c in self.columns}
+            row["timestamp"] = datetime.fromtimestamp(row["timestamp"]).isoformat()
+            rows.append(row)
+        return rows
+
+SYSTEM_COLUMNS = ("timestamp", "system_cpu", "system_memory_percent", "system_memory_available_gb",
+                  "disk_usage_percent", "disk_free_gb", "process_memory_mb", "process_cpu",
+                  "active_metrics_count")
 
 class PerformanceMonitor:
     """Монитор производительности приложения"""
     
+    RECENT_SAMPLES = 200
+    SYSTEM_SAMPLES = 1000
+    BUSY_INTERVAL_SEC = 2.0
+    BATTERY_FACTOR = 4
+    SLOW_PROBE_SEC = 300
+
     def __init__(self):
-        self.metrics: List[PerformanceMetric] = []
+        # Агрегаты по имени метрики (фиксированный объём памяти) и последние сырые замеры
+        self.aggregates: Dict[str, MetricAggregate] = {}
+        self.recent_metrics = deque(maxlen=self.RECENT_SAMPLES)
         self.active_metrics: Dict[str, PerformanceMetric] = {}
-        self.system_metrics: List[Dict] = []
+        self.system_metrics = SampleRing(SYSTEM_COLUMNS, self.SYSTEM_SAMPLES)
         self.monitoring = False
         self.monitor_thread: Optional[threading.Thread] = None
+        self.idle_interval = 30
+        self._wake = threading.Event()
+        self._battery = False
+        self._battery_checked = -math.inf
+        self._disk = None
+        self._disk_checked = -math.inf
+        self.frame_probe = None
+        self._ids = itertools.count(1)
+        self._process = None
+        # Проверка бюджетов (perf_budgets.BudgetWatcher) после каждого замера
+        self.budgets = None
+        # Счётчики событий: имя -> метка -> количество
+        self.counters: Dict[str, Dict[str, int]] = {}
+
+    def process(self):
+        """Один psutil.Process на всё время работы.
+
+        cpu_percent() на нём вызывает только поток мониторинга: psutil
+        сбрасывает точку отсчёта при каждом вызове, поэтому операции
+        считают свой CPU по разности cpu_times() (см. _cpu_time).
+        """
+        if self._process is None:
+            self._process = get_psutil().Process()
+        return self._process
         
+    def _cpu_time(self) -> Optional[float]:
+        try:
+            t = self.process().cpu_times()
+            return t.user + t.system
+        except Exception:
+            return None
+
     def start_metric(self, name: str, details: Dict = None) -> str:
-        """Начать измерение метрики"""
-        metric_id = f"{name}_{int(time.time() * 1000)}"
+        """Начать измерение метрики (одновременно открывается span трассировки)"""
+        metric_id = f"{name}_{next(self._ids)}"
         metric = PerformanceMetric(
             name=name,
             start_time=time.time(),
-            details=details or {}
+            details=details or {},
+            span=tracer.start_span(name, **(details or {})),
+            cpu_time_start=self._cpu_time(),
         )
         self.active_metrics[metric_id] = metric
+        # Первая активная операция переводит мониторинг на частые замеры
+        if self.monitoring and len(self.active_metrics) == 1:
+            self._wake.set()
         logger.debug(f"Начато измерение: {name} (ID: {metric_id})")
         return metric_id
     
@@ -51,56 +249,84 @@ class PerformanceMonitor:
             return None
             
         metric = self.active_metrics.pop(metric_id)
+        tracer.end_span(metric.span)
         metric.end_time = time.time()
-        metric.duration = metric.end_time - metric.start_time
+        metric.duration = metric.span.duration_ns / 1e9
         
         # Получаем системные метрики
         try:
-            process = psutil.Process()
+            process = self.process()
             metric.memory_usage = process.memory_info().rss / 1024 / 1024  # MB
-            metric.cpu_usage = process.cpu_percent()
+            cpu_time = self._cpu_time()
+            if cpu_time is not None and metric.cpu_time_start is not None and metric.duration > 0:
+                metric.cpu_usage = round(100 * (cpu_time - metric.cpu_time_start) / metric.duration, 1)
         except Exception as e:
             logger.warning(f"Не удалось получить системные метрики: {e}")
             
-        self.metrics.append(metric)
-        logger.info(f"Завершено измерение: {metric.name} - {metric.duration:.3f}с, "
-                   f"Память: {metric.memory_usage:.1f}MB, CPU: {metric.cpu_usage:.1f}%")
+        self.record(metric.name, metric.duration, metric.memory_usage)
+        self.recent_metrics.append(metric)
+        logger.info("Завершено измерение: %s - %.3fс, Память: %sMB, CPU: %s%%",
+                    metric.name, metric.duration, metric.memory_usage, metric.cpu_usage)
         
         return metric
     
+    def record(self, name: str, duration: float, memory_mb: Optional[float] = None):
+        """Добавить длительность в агрегат name"""
+        agg = self.aggregates.get(name)
+        if agg is None:
+            agg = self.aggregates[name] = MetricAggregate()
+        agg.add(duration, memory_mb)
+        if self.budgets is not None:
+            self.budgets.check(name, agg)
+
+    @contextmanager
+    def timed(self, name: str):
+        """Частая операция (автосохранение, отправка почты): span и агрегат без замера памяти и записи в лог"""
+        s = tracer.start_span(name)
+        try:
+            yield s
+        finally:
+            tracer.end_span(s)
+            self.record(name, s.duration_ns / 1e9)
+
+    def incr(self, name: str, label: str = "", n: int = 1):
+        """Увеличить счётчик событий"""
+        by_label = self.counters.setdefault(name, {})
+        by_label[label] = by_label.get(label, 0) + n
+
+    @contextmanager
+    def activity(self, name: str):
+        """Отметить короткую операцию (например, save_json) span-ом без записи метрики"""
+        with tracer.span(name) as s:
+            yield s
+
+    def activities_between(self, t0: float, t1: float) -> List[str]:
+        """Операции (span-ы), выполнявшиеся в интервале [t0, t1] по perf_counter"""
+        return [s.name for s in tracer.spans_between(int(t0 * 1e9), int(t1 * 1e9))]
+
     def get_metrics_summary(self) -> Dict:
-        """Получить сводку по метрикам"""
-        if not self.metrics:
+        """Получить сводку по метрикам (по каждому имени отдельно)"""
+        if not self.aggregates:
             return {"message": "Нет данных о производительности"}
-            
-        total_metrics = len(self.metrics)
-        avg_duration = sum(m.duration for m in self.metrics if m.duration) / total_metrics
-        max_duration = max(m.duration for m in self.metrics if m.duration)
-        min_duration = min(m.duration for m in self.metrics if m.duration)
-        
-        avg_memory = sum(m.memory_usage for m in self.metrics if m.memory_usage) / total_metrics
-        max_memory = max(m.memory_usage for m in self.metrics if m.memory_usage)
         
         return {
-            "total_metrics": total_metrics,
-            "avg_duration": avg_duration,
-            "max_duration": max_duration,
-            "min_duration": min_duration,
-            "avg_memory_mb": avg_memory,
-            "max_memory_mb": max_memory,
-            "active_metrics": len(self.active_metrics)
+            "total_metrics": sum(a.count for a in self.aggregates.values()),
+            "active_metrics": len(self.active_metrics),
+            "by_name": {name: agg.summary() for name, agg in self.aggregates.items()},
         }
     
     def start_system_monitoring(self, interval: int = 30):
-        """Начать мониторинг системных ресурсов"""
+        """Начать мониторинг системных ресурсов; interval — период в простое, с"""
         if self.monitoring:
             logger.warning("Мониторинг уже запущен")
             return
             
         self.monitoring = True
+        self.idle_interval = interval
+        self._wake.clear()
         self.monitor_thread = threading.Thread(
             target=self._monitor_system,
-            args=(interval,),
+            name="system-monitor",
             daemon=True
         )
         self.monitor_thread.start()
@@ -109,99 +335,133 @@ class PerformanceMonitor:
     def stop_system_monitoring(self):
         """Остановить мониторинг системных ресурсов"""
         self.monitoring = False
+        self._wake.set()
         if self.monitor_thread:
             self.monitor_thread.join(timeout=5)
         logger.info("Мониторинг системных ресурсов остановлен")
+
+    def _on_battery(self, now: float) -> bool:
+        """Работа от батареи (проверяется не чаще раза в SLOW_PROBE_SEC)"""
+        if now - self._battery_checked >= self.SLOW_PROBE_SEC:
+            self._battery_checked = now
+            try:
+                battery = get_psutil().sensors_battery()
+                self._battery = battery is not None and not battery.power_plugged
+            except Exception:
+                self._battery = False
+        return self._battery
+
+    def next_interval(self, now: float) -> float:
+        """Период до следующего замера: чаще во время операций, реже в простое и от батареи"""
+        if self.active_metrics:
+            return self.BUSY_INTERVAL_SEC
+        if self._on_battery(now):
+            return self.idle_interval * self.BATTERY_FACTOR
+        return self.idle_interval
+
+    def sample_system(self) -> Dict[str, float]:
+        """Один неблокирующий замер.
+
+        cpu_percent(interval=None) возвращает загрузку с предыдущего
+        вызова (первый вызов лишь запоминает точку отсчёта), поэтому
+        поток не спит секунду внутри psutil. Диск меняется медленно и
+        опрашивается не чаще раза в SLOW_PROBE_SEC.
+        """
+        psutil = get_psutil()
+        process = self.process()
+        now = time.time()
+        if now - self._disk_checked >= self.SLOW_PROBE_SEC:
+            self._disk_checked = now
+            self._disk = psutil.disk_usage('/')
+        memory = psutil.virtual_memory()
+        return self.system_metrics.append(
+            timestamp=now,
+            system_cpu=psutil.cpu_percent(interval=None),
+            system_memory_percent=memory.percent,
+            system_memory_available_gb=memory.available / 1024 / 1024 / 1024,
+            disk_usage_percent=self._disk.percent,
+            disk_free_gb=self._disk.free / 1024 / 1024 / 1024,
+            process_memory_mb=process.memory_info().rss / 1024 / 1024,
+            process_cpu=process.cpu_percent(),
+            active_metrics_count=len(self.active_metrics),
+        )
     
-    def _monitor_system(self, interval: int):
+    def _monitor_system(self):
         """Мониторинг системных ресурсов в отдельном потоке"""
+        try:
+            # Точка отсчёта для дельт CPU
+            get_psutil().cpu_percent(interval=None)
+            self.process().cpu_percent()
+        except Exception as e:
+            logger.error(f"Ошибка при мониторинге системы: {e}")
         while self.monitoring:
+            interval = self.next_interval(time.time())
+            # start_metric будит поток, чтобы сразу перейти на частые замеры
+            self._wake.wait(interval)
+            self._wake.clear()
+            if not self.monitoring:
+                break
             try:
-                # Получаем системные метрики
-                cpu_percent = psutil.cpu_percent(interval=1)
-                memory = psutil.virtual_memory()
-                disk = psutil.disk_usage('/')
-                
-                # Получаем метрики процесса
-                process = psutil.Process()
-                process_memory = process.memory_info().rss / 1024 / 1024  # MB
-                process_cpu = process.cpu_percent()
-                
-                metric = {
-                    "timestamp": datetime.now().isoformat(),
-                    "system_cpu": cpu_percent,
-                    "system_memory_percent": memory.percent,
-                    "system_memory_available_gb": memory.available / 1024 / 1024 / 1024,
-                    "disk_usage_percent": disk.percent,
-                    "disk_free_gb": disk.free / 1024 / 1024 / 1024,
-                    "process_memory_mb": process_memory,
-                    "process_cpu": process_cpu,
-                    "active_metrics_count": len(self.active_metrics)
-                }
-                
-                self.system_metrics.append(metric)
-                
-                # Ограничиваем количество метрик в памяти
-                if len(self.system_metrics) > 1000:
-                    self.system_metrics = self.system_metrics[-500:]
+                m = self.sample_system()
                 
                 # Логируем предупреждения
-                if cpu_percent > 80:
-                    logger.warning(f"Высокая загрузка CPU: {cpu_percent:.1f}%")
-                if memory.percent > 85:
-                    logger.warning(f"Высокое использование памяти: {memory.percent:.1f}%")
-                if process_memory > 500:  # 500MB
-                    logger.warning(f"Высокое использование памяти процессом: {process_memory:.1f}MB")
-                
-                time.sleep(interval)
+                if m["system_cpu"] > 80:
+                    logger.warning(f"Высокая загрузка CPU: {m['system_cpu']:.1f}%")
+                if m["system_memory_percent"] > 85:
+                    logger.warning(f"Высокое использование памяти: {m['system_memory_percent']:.1f}%")
+                if m["process_memory_mb"] > 500:  # 500MB
+                    logger.warning(f"Высокое использование памяти процессом: {m['process_memory_mb']:.1f}MB")
                 
             except Exception as e:
                 logger.error(f"Ошибка при мониторинге системы: {e}")
-                time.sleep(interval)
     
     def get_system_metrics_summary(self) -> Dict:
         """Получить сводку по системным метрикам"""
-        if not self.system_metrics:
+        ring = self.system_metrics
+        if not len(ring):
             return {"message": "Нет данных о системных метриках"}
         
-        recent_metrics = self.system_metrics[-10:]  # Последние 10 измерений
-        
-        avg_cpu = sum(m["system_cpu"] for m in recent_metrics) / len(recent_metrics)
-        avg_memory = sum(m["system_memory_percent"] for m in recent_metrics) / len(recent_metrics)
-        avg_process_memory = sum(m["process_memory_mb"] for m in recent_metrics) / len(recent_metrics)
+        def avg(column):
+            values = ring.column(column, 10)  # Последние 10 измерений
+            return sum(values) / len(values)
         
         return {
-            "avg_system_cpu": avg_cpu,
-            "avg_system_memory_percent": avg_memory,
-            "avg_process_memory_mb": avg_process_memory,
-            "total_measurements": len(self.system_metrics),
-            "monitoring_active": self.monitoring
+            "avg_system_cpu": avg("system_cpu"),
+            "avg_system_memory_percent": avg("system_memory_percent"),
+            "avg_process_memory_mb": avg("process_memory_mb"),
+            "total_measurements": ring.total,
+            "monitoring_active": self.monitoring,
+            "current_interval_sec": self.next_interval(time.time()) if self.monitoring else None,
         }
     
+    def metrics_data(self) -> Dict:
+        """Все метрики одним словарём (для файла метрик и диагностического пакета)"""
+        return {
+            "performance_metrics": [
+                {
+                    "name": m.name,
+                    "duration": m.duration,
+                    "memory_usage": m.memory_usage,
+                    "cpu_usage": m.cpu_usage,
+                    "details": m.details
+                }
+                for m in list(self.recent_metrics)
+            ],
+            "system_metrics": self.system_metrics.last(100),  # Последние 100 измерений
+            "summary": self.get_metrics_summary(),
+            "system_summary": self.get_system_metrics_summary(),
+            "frame_timing": self.frame_probe.to_dict() if self.frame_probe else None,
+            "budgets": self.budgets.to_dict() if self.budgets else None,
+            "export_timestamp": datetime.now().isoformat()
+        }
+
     def export_metrics(self, filepath: str):
         """Экспорт метрик в файл"""
         try:
             import json
             
-            data = {
-                "performance_metrics": [
-                    {
-                        "name": m.name,
-                        "duration": m.duration,
-                        "memory_usage": m.memory_usage,
-                        "cpu_usage": m.cpu_usage,
-                        "details": m.details
-                    }
-                    for m in self.metrics
-                ],
-                "system_metrics": self.system_metrics[-100:],  # Последние 100 измерений
-                "summary": self.get_metrics_summary(),
-                "system_summary": self.get_system_metrics_summary(),
-                "export_timestamp": datetime.now().isoformat()
-            }
-            
             with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+                json.dump(self.metrics_data(), f, ensure_ascii=False, indent=2)
             
             logger.info(f"Метрики экспортированы в {filepath}")
             
@@ -214,14 +474,12 @@ performance_monitor = PerformanceMonitor()
 def monitor_performance(name: str, details: Dict = None):
     """Декоратор для мониторинга производительности функций"""
     def decorator(func):
+        @functools.wraps(func)
         def wrapper(*args, **kwargs):
             metric_id = performance_monitor.start_metric(name, details)
             try:
-                result = func(*args, **kwargs)
-                performance_monitor.end_metric(metric_id)
-                return result
-            except Exception as e:
+                return func(*args, **kwargs)
+            finally:
                 performance_monitor.end_metric(metric_id)
-                raise
         return wrapper
     return decorator
@@ -1,10 +1,12 @@
 import json, hashlib, time, os, logging
 from typing import Any, Dict, Optional
-from kivy.app import App
+from .performance_monitor import performance_monitor
+from .storage_accounting import storage
 
 logger = logging.getLogger(__name__)
 
 def _p(path:str)->str:
+    from kivy.app import App
     app = App.get_running_app()
     os.makedirs(app.user_data_dir, exist_ok=True)
     return os.path.join(app.user_data_dir, path)
@@ -12,31 +14,49 @@ def _p(path:str)->str:
 def sha(text:str)->str:
     return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
+def read_json(path:str, default:Any)->Any:
+    """Чтение JSON по абсолютному пути (без зависимости от Kivy)"""
+    if not os.path.exists(path):
+        logger.debug("Файл %s не найден, возвращаем значение по умолчанию", path)
+        return default
+    try:
+        with open(path,"r",encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        logger.error("Ошибка при загрузке файла %s: %s", path, e)
+        return default
+
+def write_json(path:str, data:Any)->None:
+    """Атомарная запись JSON по абсолютному пути (без зависимости от Kivy)"""
+    tmp = path+".tmp"
+    with open(tmp,"w",encoding="utf-8") as f:
+        json.dump(data,f,ensure_ascii=False,indent=2)
+    os.replace(tmp,path)
+    storage.record_write(path)
+
 def load_json(name:str, default:Any)->Any:
     p = _p(name)
-    logger.debug(f"Попытка загрузить JSON файл: {name}")
+    logger.debug("Попытка загрузить JSON файл: %s", name)
     if not os.path.exists(p): 
-        logger.debug(f"Файл {name} не найден, возвращаем значение по умолчанию")
+        logger.debug("Файл %s не найден, возвращаем значение по умолчанию", name)
         return default
     try:
         with open(p,"r",encoding="utf-8") as f: 
             data = json.load(f)
-            logger.debug(f"Файл {name} успешно загружен")
+            logger.debug("Файл %s успешно загружен", name)
             return data
     except Exception as e: 
-        logger.error(f"Ошибка при загрузке файла {name}: {e}")
+        logger.error("Ошибка при загрузке файла %s: %s", name, e)
         return default
 
 def save_json(name:str, data:Any)->None:
-    logger.debug(f"Сохранение JSON файла: {name}")
+    logger.debug("Сохранение JSON файла: %s", name)
     try:
-        tmp = _p(name+".tmp")
-        with open(tmp,"w",encoding="utf-8") as f: 
-            json.dump(data,f,ensure_ascii=False,indent=2)
-        os.replace(tmp,_p(name))
-        logger.debug(f"Файл {name} успешно сохранен")
+        with performance_monitor.activity(f"save_json:{name}"):
+            write_json(_p(name), data)
+        logger.debug("Файл %s успешно сохранен", name)
     except Exception as e:
-        logger.error(f"Ошибка при сохранении файла {name}: {e}")
+        logger.error("Ошибка при сохранении файла %s: %s", name, e)
         raise
 
 def now_ts()->float: return time.time()
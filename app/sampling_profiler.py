@@ -0,0 +1,153 @@
+"""
+Сэмплирующий профилировщик: периодический снимок стеков всех потоков через sys._current_frames()
+"""
+import sys
+import json
+import time
+import logging
+import threading
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_INTERVAL_SEC = 0.01
+MAX_STACK_DEPTH = 64
+
+class SamplingProfiler:
+    """Профилировщик для работы «в поле».
+
+    Раз в interval секунд фоновый поток снимает стеки всех остальных
+    потоков и считает свёрнутые стеки (формат collapsed для flamegraph.pl,
+    speedscope, inferno). Подписи функций кэшируются по code-объекту,
+    поэтому один снимок стоит десятки микросекунд; фактическая доля
+    времени на сэмплирование сохраняется в overhead_pct.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL_SEC, max_depth: int = MAX_STACK_DEPTH):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks: Counter = Counter()
+        self.self_counts: Counter = Counter()
+        self.total_counts: Counter = Counter()
+        self.samples = 0
+        self.started_at: Optional[float] = None
+        self.wall_sec = 0.0
+        self.sampling_sec = 0.0
+        self._labels: Dict[object, str] = {}
+        self._thread_names: Dict[int, str] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            module = code.co_filename.rsplit("/", 1)[-1].rsplit("\\", 1)[-1]
+            label = self._labels[code] = f"{code.co_name} ({module}:{code.co_firstlineno})"
+        return label
+
+    def _thread_name(self, ident: int) -> str:
+        name = self._thread_names.get(ident)
+        if name is None:
+            self._thread_names = {t.ident: t.name for t in threading.enumerate()}
+            name = self._thread_names.setdefault(ident, f"thread-{ident}")
+        return name
+
+    def sample(self):
+        """Один снимок стеков всех потоков, кроме собственного"""
+        own = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            labels = []
+            while frame is not None and len(labels) < self.max_depth:
+                labels.append(self._label(frame.f_code))
+                frame = frame.f_back
+            if not labels:
+                continue
+            labels.reverse()
+            self.stacks[self._thread_name(ident) + ";" + ";".join(labels)] += 1
+            self.self_counts[labels[-1]] += 1
+            for label in set(labels):
+                self.total_counts[label] += 1
+        self.samples += 1
+
+    def _run(self, duration: float):
+        self.started_at = time.time()
+        t_start = time.perf_counter()
+        deadline = t_start + duration
+        while not self._stop.is_set():
+            t0 = time.perf_counter()
+            if t0 >= deadline:
+                break
+            self.sample()
+            t1 = time.perf_counter()
+            self.sampling_sec += t1 - t0
+            self._stop.wait(max(0.0, self.interval - (t1 - t0)))
+        self.wall_sec = time.perf_counter() - t_start
+
+    def run(self, duration: float) -> "SamplingProfiler":
+        """Сэмплировать duration секунд в текущем потоке"""
+        self._run(duration)
+        return self
+
+    def start(self, duration: float, on_done: Optional[Callable[["SamplingProfiler"], None]] = None):
+        """Запустить сэмплирование в фоновом потоке; on_done вызывается из него же"""
+        if self._thread is not None and self._thread.is_alive():
+            raise RuntimeError("Профилирование уже запущено")
+
+        def target():
+            try:
+                self._run(duration)
+            finally:
+                logger.info("Профилирование завершено: %d снимков за %.1f с, накладные расходы %.2f%%",
+                            self.samples, self.wall_sec, self.overhead_pct)
+                if on_done:
+                    on_done(self)
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=target, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        logger.info(f"Профилирование запущено на {duration:.0f} с (интервал {self.interval * 1000:.0f} мс)")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    @property
+    def overhead_pct(self) -> float:
+        return 100.0 * self.sampling_sec / self.wall_sec if self.wall_sec else 0.0
+
+    def top_functions(self, limit: int = 30) -> List[Dict]:
+        """Функции с наибольшим собственным временем (доля снимков)"""
+        n = sum(self.self_counts.values()) or 1
+        return [{
+            "function": label,
+            "self_samples": count,
+            "self_pct": round(100.0 * count / n, 2),
+            "total_samples": self.total_counts[label],
+            "total_pct": round(100.0 * self.total_counts[label] / n, 2),
+        } for label, count in self.self_counts.most_common(limit)]
+
+    def summary(self, limit: int = 30) -> Dict:
+        return {
+            "started_at": self.started_at,
+            "duration_sec": round(self.wall_sec, 3),
+            "interval_ms": self.interval * 1000,
+            "samples": self.samples,
+            "overhead_pct": round(self.overhead_pct, 3),
+            "top_functions": self.top_functions(limit),
+        }
+
+    def write_collapsed(self, filepath: str) -> str:
+        """Свёрнутые стеки: «поток;внешняя;...;внутренняя N» — по строке на стек"""
+        with open(filepath, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return filepath
+
+    def write_summary(self, filepath: str, limit: int = 30) -> str:
+        with open(filepath, "w", encoding="utf-8") as f:
+            json.dump(self.summary(limit), f, ensure_ascii=False, indent=2)
+        return filepath
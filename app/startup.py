@@ -0,0 +1,228 @@
+"""
+Измерение времени холодного старта и профилирование импорта приложения CNC Checklist
+"""
+import os
+import sys
+import json
+import time
+import logging
+import importlib
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class StartupTimer:
+    """Разбивка времени запуска по фазам"""
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self._last = self.t0
+        self.phases: List[Tuple[str, float]] = []
+        self.reported = False
+
+    def mark(self, name: str):
+        """Закрыть фазу, начавшуюся с предыдущей отметки"""
+        now = time.perf_counter()
+        self.phases.append((name, now - self._last))
+        self._last = now
+
+    @contextmanager
+    def phase(self, name: str):
+        """Фаза как контекстный менеджер (время до входа уходит в отдельную фазу 'other')"""
+        start = time.perf_counter()
+        if start - self._last > 0.0005:
+            self.phases.append(("other", start - self._last))
+        try:
+            yield
+        finally:
+            self._last = time.perf_counter()
+            self.phases.append((name, self._last - start))
+
+    def total(self) -> float:
+        return self._last - self.t0
+
+    def summary(self) -> dict:
+        return {
+            "total_ms": round(self.total() * 1000, 1),
+            "phases_ms": [(name, round(dt * 1000, 1)) for name, dt in self.phases],
+        }
+
+    def log_summary(self):
+        if self.reported:
+            return
+        self.reported = True
+        logger.info(f"Холодный старт: {self.total() * 1000:.0f} мс")
+        for name, dt in self.phases:
+            logger.info(f"  {name}: {dt * 1000:.1f} мс")
+
+# Создаётся при первом импорте — как можно раньше при старте
+startup_timer = StartupTimer()
+
+class _TimedLoader:
+    """Обёртка загрузчика, замеряющая exec_module"""
+
+    def __init__(self, loader, profiler: "ImportProfiler"):
+        self._loader = loader
+        self._profiler = profiler
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._profiler._enter(module.__name__)
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._profiler._leave()
+
+class _ProfilingFinder:
+    """Meta-path finder: делегирует поиск остальным и подменяет загрузчик"""
+
+    def __init__(self, profiler: "ImportProfiler"):
+        self._profiler = profiler
+
+    def find_spec(self, name, path, target=None):
+        if threading.get_ident() != self._profiler.thread_id:
+            return None
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = _TimedLoader(spec.loader, self._profiler)
+        return spec
+
+class ImportProfiler:
+    """Профилировщик импорта (аналог -X importtime), агрегирующий по модулям приложения.
+
+    Время импорта сторонних пакетов относится к ближайшему модулю
+    приложения, который их потянул (app.main -> app.pdf_report -> reportlab).
+    Замеряется только главный поток.
+
+    Профилировщик ставится из уже выполняющегося app.main, поэтому его
+    собственный импорт не перехватывается: для него открывается кадр
+    begin_entry() и закрывается end_entry() после блока импортов, иначе
+    kivy и прочее, что app.main импортирует напрямую, ушло бы в <external>.
+    """
+
+    def __init__(self, app_package: str):
+        self.app_package = app_package
+        self.thread_id = threading.get_ident()
+        self._finder = _ProfilingFinder(self)
+        self._stack: List[list] = []  # [name, start, child_time]
+        self.records: List[Tuple[str, Optional[str], float, float]] = []  # name, owner, self, cum
+        self._entry_open = False
+
+    def install(self):
+        if self._finder not in sys.meta_path:
+            sys.meta_path.insert(0, self._finder)
+
+    def uninstall(self):
+        if self._finder in sys.meta_path:
+            sys.meta_path.remove(self._finder)
+
+    def begin_entry(self, name: str):
+        """Кадр для модуля, из которого установлен профилировщик"""
+        if not self._entry_open and not self._stack:
+            self._enter(name)
+            self._entry_open = True
+
+    def end_entry(self):
+        if self._entry_open and len(self._stack) == 1:
+            self._leave()
+            self._entry_open = False
+
+    def _is_app(self, name: str) -> bool:
+        return name == self.app_package or name.startswith(self.app_package + ".")
+
+    def _enter(self, name: str):
+        self._stack.append([name, time.perf_counter(), 0.0])
+
+    def _leave(self):
+        name, start, child = self._stack.pop()
+        cum = time.perf_counter() - start
+        if self._stack:
+            self._stack[-1][2] += cum
+        owner = next((n for n in [name] + [f[0] for f in reversed(self._stack)] if self._is_app(n)), None)
+        self.records.append((name, owner, cum - child, cum))
+
+    def report(self) -> Dict:
+        """Сводка: на модуль приложения — собственное и суммарное время, тяжёлые зависимости"""
+        modules: Dict[str, Dict] = {}
+        for name, owner, self_s, cum_s in self.records:
+            m = modules.setdefault(owner or "<external>", {"self_ms": 0.0, "cumulative_ms": 0.0, "modules": 0, "deps_ms": {}})
+            m["self_ms"] += self_s * 1000
+            m["modules"] += 1
+            if name == owner:
+                m["cumulative_ms"] = cum_s * 1000
+            else:
+                top = name.split(".")[0]
+                m["deps_ms"][top] = m["deps_ms"].get(top, 0.0) + self_s * 1000
+        for m in modules.values():
+            m["self_ms"] = round(m["self_ms"], 2)
+            m["cumulative_ms"] = round(m["cumulative_ms"], 2)
+            m["deps_ms"] = dict(sorted(((k, round(v, 2)) for k, v in m["deps_ms"].items()),
+                                       key=lambda kv: kv[1], reverse=True))
+        ordered = dict(sorted(modules.items(), key=lambda kv: kv[1]["self_ms"], reverse=True))
+        return {
+            "total_import_ms": round(sum(r[2] for r in self.records) * 1000, 2),
+            "imported_modules": len(self.records),
+            "by_app_module": ordered,
+        }
+
+IMPORT_PROFILE_ENV = "CNC_IMPORT_PROFILE"
+
+import_profiler: Optional[ImportProfiler] = None
+
+def install_import_profiler(app_package: str, entry_module: Optional[str] = None) -> Optional[ImportProfiler]:
+    """Включить профилирование импорта, если задана переменная CNC_IMPORT_PROFILE=1.
+
+    entry_module — модуль, который вызывает установку; его импорты до
+    end_entry_module() относятся к нему.
+    """
+    global import_profiler
+    if os.environ.get(IMPORT_PROFILE_ENV) != "1":
+        return None
+    if import_profiler is None:
+        import_profiler = ImportProfiler(app_package)
+        import_profiler.install()
+        if entry_module:
+            import_profiler.begin_entry(entry_module)
+    return import_profiler
+
+def end_entry_module():
+    """Закрыть кадр модуля-точки входа (вызывается после его блока импортов)"""
+    if import_profiler is not None:
+        import_profiler.end_entry()
+
+def write_startup_report(path: str):
+    """Записать отчёт о старте (фазы + профиль импорта, если включён)"""
+    data = {"startup": startup_timer.summary()}
+    if import_profiler is not None:
+        import_profiler.end_entry()
+        import_profiler.uninstall()
+        data["imports"] = import_profiler.report()
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    logger.info(f"Отчёт о запуске сохранён в {path}")
+
+def warm_up_imports(module_names: List[str]):
+    """Фоновый импорт тяжёлых модулей после показа первого экрана"""
+    def _run():
+        for name in module_names:
+            t0 = time.perf_counter()
+            try:
+                importlib.import_module(name)
+                logger.debug(f"Прогрев импорта {name}: {(time.perf_counter()-t0)*1000:.0f} мс")
+            except Exception as e:
+                logger.warning(f"Не удалось импортировать {name} в фоне: {e}")
+    threading.Thread(target=_run, name="import-warmup", daemon=True).start()
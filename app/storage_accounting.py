@@ -0,0 +1,218 @@
+"""
+Учёт занятого места в user_data_dir по категориям без полного обхода каталога
+"""
+import os
+import time
+import logging
+import threading
+from typing import Dict, Iterator, Optional, Tuple
+
+from .log_reader import rotated_files
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_SEC = 6 * 3600
+LOG_FILE = "cnc_checklist.log"
+
+STATE_FILES = ("settings.json", "session.json", "history.jsonl", "history.json")
+EXPORT_PREFIXES = ("diagnostics_", "performance_metrics_", "trace_", "profile_", "crash_report_",
+                   "startup_report", "cnc_diagnostics_")
+# Категории, размер которых меняется вне приложения (ротация логов, сегменты аудита):
+# при запросе они пересчитываются по нескольким stat, а не по событиям записи
+LIVE_CATEGORIES = ("logs", "audit")
+
+def classify(relpath: str) -> str:
+    """Категория файла по пути относительно user_data_dir"""
+    top, _, rest = relpath.replace("\\", "/").partition("/")
+    name = relpath.rsplit("/", 1)[-1]
+    if rest:
+        return {"photos": "photos", "sessions": "sessions", "audit": "audit"}.get(top, "other")
+    if name.endswith(".pdf"):
+        return "pdfs"
+    if name.startswith(LOG_FILE):
+        return "logs"
+    if name in STATE_FILES or name.endswith(".tmp"):
+        return "state"
+    if name.startswith(EXPORT_PREFIXES):
+        return "diagnostics"
+    return "other"
+
+def _scan(directory: str) -> Iterator[Tuple[str, int]]:
+    """(путь, размер) всех файлов: os.scandir с размером из DirEntry.stat (без лишних системных вызовов на Windows)"""
+    stack = [directory]
+    while stack:
+        d = stack.pop()
+        try:
+            with os.scandir(d) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            yield entry.path, entry.stat(follow_symlinks=False).st_size
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+
+class StorageAccountant:
+    """Размеры по категориям (photos, pdfs, sessions, state, diagnostics, logs, audit, other).
+
+    Приложение сообщает о записи и удалении файлов (record_write /
+    record_delete), поэтому usage() отвечает сразу. Полный проход
+    os.scandir (reconcile) выполняется при старте в фоне и затем не
+    чаще раза в reconcile_sec; расхождение с учётом пишется в лог.
+    Файлы, удалённые не приложением (очистка вручную, через SAF),
+    исчезают из учёта только при такой сверке. Записи и удаления,
+    сообщённые во время прохода, запоминаются и накладываются на его
+    результат.
+    """
+
+    def __init__(self, base_dir: Optional[str] = None, reconcile_sec: float = RECONCILE_SEC):
+        self.base_dir = base_dir
+        self.reconcile_sec = reconcile_sec
+        self._lock = threading.Lock()
+        self._files: Dict[str, Tuple[str, int]] = {}
+        self._totals: Dict[str, list] = {}
+        self.last_reconciled: Optional[float] = None
+        self.last_drift_bytes = 0
+        self._reconciling = False
+        # rel -> размер (None — удалён) для изменений во время идущей сверки
+        self._changes: Optional[Dict[str, Optional[int]]] = None
+
+    def attach(self, base_dir: str):
+        self.base_dir = base_dir
+
+    def _rel(self, path: str) -> Optional[str]:
+        if not self.base_dir:
+            return None
+        rel = os.path.relpath(os.path.abspath(path), os.path.abspath(self.base_dir))
+        return None if rel.startswith("..") else rel.replace("\\", "/")
+
+    def _set(self, rel: str, size: Optional[int]):
+        old = self._files.pop(rel, None)
+        if old is not None:
+            t = self._totals[old[0]]
+            t[0] -= old[1]; t[1] -= 1
+        if size is not None:
+            category = classify(rel)
+            self._files[rel] = (category, size)
+            t = self._totals.setdefault(category, [0, 0])
+            t[0] += size; t[1] += 1
+        if self._changes is not None:
+            self._changes[rel] = size
+
+    def record_write(self, path: str, size: Optional[int] = None):
+        """Файл создан или перезаписан (размер берётся одним stat, если не передан)"""
+        rel = self._rel(path)
+        if rel is None:
+            return
+        if size is None:
+            try:
+                size = os.stat(path).st_size
+            except OSError:
+                size = None
+        with self._lock:
+            self._set(rel, size)
+
+    def record_delete(self, path: str):
+        """Файл удалён или переименован приложением (файлы, удалённые извне, учтёт только сверка)"""
+        rel = self._rel(path)
+        if rel is not None:
+            with self._lock:
+                self._set(rel, None)
+
+    def reconcile(self) -> int:
+        """Полный проход по каталогу; возвращает расхождение учёта в байтах"""
+        if not self.base_dir:
+            return 0
+        t0 = time.perf_counter()
+        with self._lock:
+            self._changes = {}
+        files = {}
+        try:
+            for path, size in _scan(self.base_dir):
+                rel = os.path.relpath(path, self.base_dir).replace("\\", "/")
+                files[rel] = (classify(rel), size)
+        except BaseException:
+            with self._lock:
+                self._changes = None
+            raise
+        with self._lock:
+            # Проход шёл без блокировки: изменения за это время важнее увиденного им
+            for rel, size in self._changes.items():
+                if size is None:
+                    files.pop(rel, None)
+                else:
+                    files[rel] = (classify(rel), size)
+            self._changes = None
+            totals: Dict[str, list] = {}
+            for category, size in files.values():
+                t = totals.setdefault(category, [0, 0])
+                t[0] += size; t[1] += 1
+            before = sum(t[0] for c, t in self._totals.items() if c not in LIVE_CATEGORIES)
+            after = sum(t[0] for c, t in totals.items() if c not in LIVE_CATEGORIES)
+            drift = after - before if self.last_reconciled is not None else 0
+            self._files, self._totals = files, totals
+            self.last_reconciled = time.time()
+            self.last_drift_bytes = drift
+        logger.info("Учёт места сверен: %d файлов, %.1f МБ, расхождение %d байт, %.0f мс",
+                    len(files), after / 1024 / 1024, drift, (time.perf_counter() - t0) * 1000)
+        return drift
+
+    def reconcile_async(self):
+        """Сверка в фоновом потоке (если не идёт уже)"""
+        if self._reconciling:
+            return
+
+        def target():
+            try:
+                self.reconcile()
+            except Exception as e:
+                logger.error(f"Ошибка сверки учёта места: {e}")
+            finally:
+                self._reconciling = False
+
+        self._reconciling = True
+        threading.Thread(target=target, name="storage-reconcile", daemon=True).start()
+
+    def _live(self) -> Dict[str, list]:
+        """Логи и сегменты аудита: несколько stat вместо учёта каждой записи"""
+        live = {"logs": [0, 0], "audit": [0, 0]}
+        base = self.base_dir
+        for path in rotated_files(os.path.join(base, LOG_FILE)):
+            try:
+                live["logs"][0] += os.stat(path).st_size
+                live["logs"][1] += 1
+            except OSError:
+                pass
+        for _, size in _scan(os.path.join(base, "audit")):
+            live["audit"][0] += size
+            live["audit"][1] += 1
+        return live
+
+    def usage(self) -> Dict:
+        """Текущие размеры по категориям; запускает фоновую сверку, если она устарела"""
+        if not self.base_dir:
+            return {"error": "Каталог данных не задан"}
+        if self.last_reconciled is None or time.time() - self.last_reconciled > self.reconcile_sec:
+            self.reconcile_async()
+        with self._lock:
+            totals = {c: list(t) for c, t in self._totals.items() if c not in LIVE_CATEGORIES}
+        totals.update(self._live())
+        return {
+            "categories": {c: {"bytes": t[0], "files": t[1]} for c, t in sorted(totals.items())},
+            "total_bytes": sum(t[0] for t in totals.values()),
+            "total_files": sum(t[1] for t in totals.values()),
+            "last_reconciled": self.last_reconciled,
+            "last_drift_bytes": self.last_drift_bytes,
+        }
+
+    def category_bytes(self, category: str) -> int:
+        if category in LIVE_CATEGORIES:
+            return self._live()[category][0]
+        with self._lock:
+            return self._totals.get(category, [0, 0])[0]
+
+# Глобальный экземпляр; каталог задаётся в build()
+storage = StorageAccountant()
@@ -0,0 +1,216 @@
+"""
+Аналитика времени выполнения пунктов чек-листа по архивам сессий и журналу аудита.
+
+Источники (в каждом каталоге данных — копии user_data_dir с планшетов):
+  sessions/*.json — архивы завершённых сессий (duration_sec, status, обход мастером);
+  audit/          — события ITEM_COMPLETED/MASTER_BYPASS для заказов без архива.
+
+Использование:
+  python -m app.timing_report DATA_DIR [DATA_DIR ...] [--since 2025-01-01] [--format csv|json] [--out DIR]
+
+Требуется numpy (make install-deps).
+"""
+import os
+import sys
+import csv
+import json
+import logging
+import argparse
+from array import array
+from typing import Dict, Iterator, List, Optional
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - зависит от окружения
+    np = None
+
+from .audit_log import AuditLog
+from .analytics_store import Row, report_rows, block_of, to_float
+
+logger = logging.getLogger(__name__)
+
+PERCENTILES = (50, 90, 95)
+
+def iter_session_rows(data_dir: str) -> Iterator[Row]:
+    """Строки по пунктам из архивов сессий (по одному файлу за раз)"""
+    sessions_dir = os.path.join(data_dir, "sessions")
+    if not os.path.isdir(sessions_dir):
+        return
+    with os.scandir(sessions_dir) as it:
+        for entry in it:
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                with open(entry.path, "r", encoding="utf-8") as f:
+                    report = json.load(f)
+            except Exception as e:
+                logger.warning(f"Пропущен архив {entry.path}: {e}")
+                continue
+            yield from report_rows(report)
+
+def iter_audit_rows(data_dir: str, skip_orders: set) -> Iterator[Row]:
+    """Строки из журнала аудита для заказов, у которых нет архива сессии"""
+    audit_dir = os.path.join(data_dir, "audit")
+    if not os.path.isdir(audit_dir):
+        return
+    log = AuditLog(audit_dir, read_only=True)
+    bypassed = {(r["order"], r["data"].get("item_id")) for r in log.query(event_type="MASTER_BYPASS")}
+    for r in log.query(event_type="ITEM_COMPLETED"):
+        order = r.get("order") or ""
+        if order in skip_orders:
+            continue
+        d = r["data"]
+        item_id = d.get("item_id", "")
+        yield (r["ts"][:10], order, block_of(item_id), item_id, to_float(d.get("duration_sec")),
+               d.get("status") is False, bool(d.get("critical")), (order, item_id) in bypassed)
+
+class Columns:
+    """Колонки в компактных массивах; строковые ключи кодируются целыми"""
+
+    def __init__(self):
+        self.duration = array("d")
+        self.failed = array("b")
+        self.bypassed = array("b")
+        self.codes: Dict[str, array] = {"day": array("i"), "block": array("i"), "item": array("i")}
+        self.labels: Dict[str, Dict[str, int]] = {"day": {}, "block": {}, "item": {}}
+        self.critical: Dict[str, bool] = {}
+
+    def _code(self, kind: str, label: str) -> int:
+        table = self.labels[kind]
+        code = table.get(label)
+        if code is None:
+            code = table[label] = len(table)
+        return code
+
+    def add(self, row: Row):
+        day, _order, block, item, duration, failed, critical, bypassed = row
+        self.codes["day"].append(self._code("day", day))
+        self.codes["block"].append(self._code("block", block))
+        self.codes["item"].append(self._code("item", item))
+        self.duration.append(duration)
+        self.failed.append(failed)
+        self.bypassed.append(bypassed)
+        self.critical[item] = self.critical.get(item, False) or critical
+
+    def __len__(self):
+        return len(self.duration)
+
+def grouped_percentiles(codes, values, n_groups: int, qs=PERCENTILES):
+    """Перцентили values внутри каждой группы (линейная интерполяция), без цикла по строкам"""
+    valid = ~np.isnan(values)
+    codes, values = codes[valid], values[valid]
+    order = np.lexsort((values, codes))
+    v = values[order]
+    counts = np.bincount(codes, minlength=n_groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    result = {}
+    has = counts > 0
+    for q in qs:
+        pos = starts + (q / 100.0) * np.maximum(counts - 1, 0)
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.ceil(pos).astype(np.int64)
+        frac = pos - lo
+        out = np.full(n_groups, np.nan)
+        if v.size:
+            lo_c, hi_c = np.minimum(lo, v.size - 1), np.minimum(hi, v.size - 1)
+            out[has] = (v[lo_c] + (v[hi_c] - v[lo_c]) * frac)[has]
+        result[f"p{q}"] = out
+    return result, counts
+
+def group_stats(cols: Columns, kind: str) -> List[Dict]:
+    """Статистика по группам kind ('item', 'block', 'day')"""
+    codes = np.frombuffer(cols.codes[kind], dtype=np.int32).astype(np.int64)
+    duration = np.frombuffer(cols.duration, dtype=np.float64)
+    failed = np.frombuffer(cols.failed, dtype=np.int8).astype(bool)
+    bypassed = np.frombuffer(cols.bypassed, dtype=np.int8).astype(bool)
+    n = len(cols.labels[kind])
+
+    total = np.bincount(codes, minlength=n)
+    fails = np.bincount(codes, weights=failed, minlength=n)
+    bypasses = np.bincount(codes, weights=bypassed, minlength=n)
+    valid = ~np.isnan(duration)
+    dur_sum = np.bincount(codes[valid], weights=duration[valid], minlength=n)
+    timed = np.bincount(codes[valid], minlength=n)
+    pct, _ = grouped_percentiles(codes, duration, n)
+
+    def _r(x):
+        return None if np.isnan(x) else round(float(x), 2)
+
+    rows = []
+    for label, code in cols.labels[kind].items():
+        row = {kind: label, "count": int(total[code])}
+        if kind == "item":
+            row["critical"] = cols.critical.get(label, False)
+        row["mean_sec"] = _r(dur_sum[code] / timed[code]) if timed[code] else None
+        for key, values in pct.items():
+            row[f"{key}_sec"] = _r(values[code])
+        row["fail_rate"] = round(float(fails[code] / total[code]), 4) if total[code] else None
+        row["bypass_rate"] = round(float(bypasses[code] / total[code]), 4) if total[code] else None
+        rows.append(row)
+    rows.sort(key=lambda r: r[kind] if kind != "item" else [int(p) if p.isdigit() else p for p in r[kind].split(".")])
+    return rows
+
+def collect(data_dirs: List[str], since: Optional[str] = None, until: Optional[str] = None) -> Columns:
+    cols = Columns()
+    for data_dir in data_dirs:
+        archived = set()
+        for row in iter_session_rows(data_dir):
+            archived.add(row[1])
+            if (since and row[0] < since) or (until and row[0] > until):
+                continue
+            cols.add(row)
+        for row in iter_audit_rows(data_dir, archived):
+            if (since and row[0] < since) or (until and row[0] > until):
+                continue
+            cols.add(row)
+    return cols
+
+def build_report(cols: Columns) -> Dict[str, List[Dict]]:
+    return {kind + "s": group_stats(cols, kind) for kind in ("item", "block", "day")}
+
+def write_csv(rows: List[Dict], path: str):
+    if not rows:
+        open(path, "w").close()
+        return
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Статистика времени выполнения пунктов CNC Checklist")
+    parser.add_argument("data_dirs", nargs="+", help="Каталоги данных планшетов (копии user_data_dir)")
+    parser.add_argument("--since", help="С даты (YYYY-MM-DD)")
+    parser.add_argument("--until", help="По дату включительно (YYYY-MM-DD)")
+    parser.add_argument("--format", choices=("json", "csv"), default="json")
+    parser.add_argument("--out", help="Каталог для результатов (по умолчанию JSON в stdout)")
+    args = parser.parse_args(argv)
+
+    if np is None:
+        print("Для аналитики нужен numpy: pip install numpy", file=sys.stderr)
+        return 2
+
+    cols = collect(args.data_dirs, args.since, args.until)
+    report = build_report(cols)
+    if not args.out:
+        if args.format == "csv":
+            writer = csv.DictWriter(sys.stdout, fieldnames=list(report["items"][0].keys()) if report["items"] else [])
+            writer.writeheader()
+            writer.writerows(report["items"])
+        else:
+            json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+            print()
+        return 0
+
+    os.makedirs(args.out, exist_ok=True)
+    if args.format == "csv":
+        for key, rows in report.items():
+            write_csv(rows, os.path.join(args.out, f"timing_{key}.csv"))
+    else:
+        with open(os.path.join(args.out, "timing_report.json"), "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Обработано строк: {len(cols)}; результаты в {args.out}", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,173 @@
+"""
+Вложенные интервалы (span) с экспортом в формат Chrome trace (chrome://tracing, Perfetto)
+"""
+import os
+import json
+import time
+import logging
+import itertools
+import threading
+import functools
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class Span:
+    """Интервал выполнения; время — time.perf_counter_ns()"""
+
+    __slots__ = ("id", "parent_id", "name", "tid", "thread_name", "start_ns", "end_ns", "args")
+
+    def __init__(self, span_id: int, parent_id: Optional[int], name: str, args: Dict[str, Any]):
+        thread = threading.current_thread()
+        self.id = span_id
+        self.parent_id = parent_id
+        self.name = name
+        self.tid = thread.ident
+        self.thread_name = thread.name
+        self.args = args
+        self.start_ns = time.perf_counter_ns()
+        self.end_ns: Optional[int] = None
+
+    @property
+    def duration_ns(self) -> Optional[int]:
+        return None if self.end_ns is None else self.end_ns - self.start_ns
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"id": self.id, "parent_id": self.parent_id, "name": self.name, "tid": self.tid,
+                "thread": self.thread_name, "start_ns": self.start_ns, "end_ns": self.end_ns,
+                "args": self.args}
+
+class Tracer:
+    """Трассировщик с отдельным стеком span-ов на каждый поток.
+
+    Родитель нового span-а — текущий открытый span того же потока (или
+    явно переданный parent). Завершённые span-ы хранятся в кольцевом
+    буфере ограниченного размера.
+    """
+
+    def __init__(self, max_spans: int = 5000):
+        self._ids = itertools.count(1)
+        self._local = threading.local()
+        self._open: Dict[int, Span] = {}
+        self.finished = deque(maxlen=max_spans)
+
+    def _stack(self) -> List[Span]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def current_span(self) -> Optional[Span]:
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    def start_span(self, name: str, parent: Optional[Span] = None, **args) -> Span:
+        stack = self._stack()
+        if parent is None and stack:
+            parent = stack[-1]
+        span = Span(next(self._ids), parent.id if parent else None, name, args)
+        stack.append(span)
+        self._open[span.id] = span
+        return span
+
+    def end_span(self, span: Span):
+        span.end_ns = time.perf_counter_ns()
+        stack = self._stack()
+        # Обычно span закрывается последним открытым; иначе удаляем его из середины
+        if stack and stack[-1] is span:
+            stack.pop()
+        elif span in stack:
+            stack.remove(span)
+        self._open.pop(span.id, None)
+        self.finished.append(span)
+
+    @contextmanager
+    def span(self, name: str, **args) -> Iterator[Span]:
+        s = self.start_span(name, **args)
+        try:
+            yield s
+        finally:
+            self.end_span(s)
+
+    def traced(self, name: Optional[str] = None) -> Callable:
+        """Декоратор: каждый вызов функции — отдельный span"""
+        def decorator(func):
+            span_name = name or func.__qualname__
+            @functools.wraps(func)
+            def wrapper(*a, **kw):
+                with self.span(span_name):
+                    return func(*a, **kw)
+            return wrapper
+        return decorator
+
+    def spans_between(self, t0_ns: int, t1_ns: int) -> List[Span]:
+        """Span-ы (завершённые и открытые), пересекающиеся с [t0_ns, t1_ns]"""
+        result = [s for s in list(self.finished) if s.start_ns <= t1_ns and s.end_ns >= t0_ns]
+        result += [s for s in list(self._open.values()) if s.start_ns <= t1_ns]
+        return result
+
+    def subtree(self, root: Span) -> List[Span]:
+        """Корневой span и все его потомки среди завершённых (в порядке начала).
+
+        Дочерние span-ы завершаются раньше родителя, поэтому в finished
+        внук стоит перед сыном: потомки собираются обходом карты
+        «родитель -> дети» от корня, а не одним проходом по finished.
+        """
+        children: Dict[int, List[Span]] = {}
+        for s in list(self.finished):
+            if s.parent_id is not None and s.start_ns >= root.start_ns:
+                children.setdefault(s.parent_id, []).append(s)
+        spans = [root]
+        todo = [root.id]
+        while todo:
+            kids = children.get(todo.pop(), [])
+            spans.extend(kids)
+            todo.extend(k.id for k in kids)
+        spans[1:] = sorted(spans[1:], key=lambda s: s.start_ns)
+        return spans
+
+    def last_span(self, name: str) -> Optional[Span]:
+        for s in reversed(list(self.finished)):
+            if s.name == name:
+                return s
+        return None
+
+    def chrome_trace(self, spans: Optional[List[Span]] = None) -> Dict[str, Any]:
+        """Данные в формате Chrome trace-event (события 'X', время в микросекундах)"""
+        spans = list(self.finished) if spans is None else spans
+        pid = os.getpid()
+        events = []
+        threads = {}
+        for s in spans:
+            if s.end_ns is None:
+                continue
+            threads[s.tid] = s.thread_name
+            args = dict(s.args)
+            args["span_id"] = s.id
+            if s.parent_id:
+                args["parent_id"] = s.parent_id
+            events.append({"name": s.name, "ph": "X", "pid": pid, "tid": s.tid,
+                           "ts": s.start_ns / 1000, "dur": (s.end_ns - s.start_ns) / 1000,
+                           "args": args})
+        for tid, tname in threads.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+                           "args": {"name": tname}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export_chrome_trace(self, filepath: str, root_name: Optional[str] = None) -> str:
+        """Записать трассу; с root_name — только последний такой span и его потомков"""
+        spans = None
+        if root_name:
+            root = self.last_span(root_name)
+            spans = self.subtree(root) if root else []
+        with open(filepath, "w", encoding="utf-8") as f:
+            json.dump(self.chrome_trace(spans), f, ensure_ascii=False)
+        logger.info(f"Трасса экспортирована в {filepath}")
+        return filepath
+
+# Глобальный трассировщик
+tracer = Tracer()
+span = tracer.span
+traced = tracer.traced
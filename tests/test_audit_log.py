@@ -0,0 +1,86 @@
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+
+from app.audit_log import INDEX_FILE, AuditLog
+
+
+class AuditLogTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def _fill(self, log, count, start=0):
+        for i in range(start, start + count):
+            log.append("ITEM_COMPLETED", order=f"A{i % 3}", item_id=f"item_{i}", note="x" * 40)
+
+    def test_missing_index_keeps_sealed_segments(self):
+        log = AuditLog(self.dir, segment_max_bytes=2000)
+        self._fill(log, 60)
+        log.close()
+        sealed = sorted(n for n in os.listdir(self.dir) if n.endswith(".gz"))
+        self.assertGreater(len(sealed), 2)
+        os.remove(os.path.join(self.dir, INDEX_FILE))
+
+        log = AuditLog(self.dir, segment_max_bytes=2000)
+        self._fill(log, 30, start=60)
+        log.close()
+
+        log = AuditLog(self.dir, segment_max_bytes=2000)
+        records = list(log.query())
+        self.assertEqual([r["seq"] for r in records], list(range(1, 91)))
+        self.assertEqual(log.verify(), (True, None))
+
+    def _snapshot(self):
+        return {n: (os.path.getsize(os.path.join(self.dir, n)), os.path.getmtime(os.path.join(self.dir, n)))
+                for n in os.listdir(self.dir)}
+
+    def test_read_only_leaves_files_untouched(self):
+        log = AuditLog(self.dir, segment_max_bytes=2000)
+        self._fill(log, 30)
+        log.close()
+        os.remove(os.path.join(self.dir, INDEX_FILE))
+        active = max(n for n in os.listdir(self.dir) if n.endswith(".jsonl"))
+        with open(os.path.join(self.dir, active), "ab") as f:
+            f.write(b'{"seq": 31, "torn')
+        before = self._snapshot()
+
+        log = AuditLog(self.dir, read_only=True)
+        self.assertEqual(log.torn_bytes, len(b'{"seq": 31, "torn'))
+        self.assertEqual(log.verify(), (True, None))
+        self.assertEqual(len(list(log.query())), 30)
+        with self.assertRaises(RuntimeError):
+            log.append("ITEM_COMPLETED")
+        self.assertEqual(self._snapshot(), before)
+
+    def test_read_only_missing_directory(self):
+        missing = os.path.join(self.dir, "no-such-audit")
+        with self.assertRaises(FileNotFoundError):
+            AuditLog(missing, read_only=True)
+        self.assertFalse(os.path.exists(missing))
+
+    def test_unsealed_segment_after_crash_is_sealed_on_open(self):
+        log = AuditLog(self.dir, segment_max_bytes=2000)
+        self._fill(log, 20)
+        log.close()
+        # Сбой между закрытием сегмента и его сжатием: .jsonl остался, индекса для него нет
+        first = min(n for n in os.listdir(self.dir) if n.endswith(".gz"))
+        with open(os.path.join(self.dir, first[:-len(".gz")]), "wb") as f:
+            f.write(gzip.decompress(open(os.path.join(self.dir, first), "rb").read()))
+        os.remove(os.path.join(self.dir, first))
+        os.remove(os.path.join(self.dir, INDEX_FILE))
+
+        log = AuditLog(self.dir, segment_max_bytes=2000)
+        self._fill(log, 10, start=20)
+        log.close()
+        self.assertIn(first, os.listdir(self.dir))
+        self.assertNotIn(first[:-len(".gz")], os.listdir(self.dir))
+        log = AuditLog(self.dir, read_only=True)
+        self.assertEqual([r["seq"] for r in log.query()], list(range(1, 31)))
+        self.assertEqual(log.verify(), (True, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from app.history_store import HistoryStore
+from app.lan_sync import SyncError, SyncNode
+
+
+def _populate(base_dir, device, count):
+    """count отчётов устройства: запись истории, PDF и архив сессии"""
+    os.makedirs(os.path.join(base_dir, "sessions"))
+    entries = []
+    for seq in range(1, count + 1):
+        name = f"2026-10-19_1000{seq:02d}_{device}-{seq}_nesting_{seq:04d}"
+        with open(os.path.join(base_dir, name + ".pdf"), "wb") as f:
+            f.write(b"%PDF-1.4 " + os.urandom(2048))
+        report = {"order": f"{device}-{seq}", "seq": seq, "device": device, "blocks": []}
+        with open(os.path.join(base_dir, "sessions", name + ".json"), "w", encoding="utf-8") as f:
+            json.dump(report, f)
+        entries.append({"order": report["order"], "file": os.path.join(base_dir, name + ".pdf"),
+                        "created_at": "2026-10-19 10:00:00", "seq": seq, "bypasses": 0})
+    HistoryStore(base_dir).extend(entries)
+
+
+class LanSyncTest(unittest.TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        self.dir_a, self.dir_b = os.path.join(root, "a"), os.path.join(root, "b")
+        _populate(self.dir_a, "dev-A", 30)
+        _populate(self.dir_b, "dev-B", 5)
+        self.node_a = SyncNode(self.dir_a, "dev-A", token="secret")
+        self.node_b = SyncNode(self.dir_b, "dev-B", token="secret")
+
+    def _sync(self, push=True):
+        """Узел A слушает 127.0.0.1 на свободном порту, B синхронизируется с ним"""
+        async def run():
+            server = await self.node_a.serve("127.0.0.1", 0)
+            try:
+                return await self.node_b.sync_with(f"127.0.0.1:{server.sockets[0].getsockname()[1]}", push=push)
+            finally:
+                server.close()
+                await server.wait_closed()
+        return asyncio.run(run())
+
+    def _pdfs(self, base_dir):
+        return sorted(n for n in os.listdir(base_dir) if n.endswith(".pdf"))
+
+    def test_first_sync_and_noop_resync(self):
+        stats = self._sync()
+        self.assertEqual((stats["pulled"], stats["pushed"], stats["errors"]), (30, 5, []))
+        self.assertEqual(HistoryStore(self.dir_a).count(), 35)
+        self.assertEqual(HistoryStore(self.dir_b).count(), 35)
+        self.assertEqual(self._pdfs(self.dir_a), self._pdfs(self.dir_b))
+        received = [e for e in HistoryStore(self.dir_b).entries() if e.get("origin") == "dev-A"]
+        self.assertEqual(sorted(e["seq"] for e in received), list(range(1, 31)))
+        self.assertTrue(all(os.path.isfile(e["file"]) for e in received))
+
+        stats = self._sync()
+        self.assertEqual((stats["pulled"], stats["pushed"], stats["errors"]), (0, 0, []))
+        self.assertEqual(HistoryStore(self.dir_b).count(), 35)
+
+    def test_wrong_token_is_rejected(self):
+        self.node_b.token = "wrong"
+        with self.assertRaises(SyncError) as cm:
+            self._sync()
+        self.assertIn("403", str(cm.exception))
+        self.assertEqual(HistoryStore(self.dir_b).count(), 5)
+        self.assertEqual(HistoryStore(self.dir_a).count(), 30)
+
+    def test_failed_pdf_transfer_is_retried(self):
+        pdf_path = self.node_a.pdf_path
+        broken = os.path.join(self.dir_a, "missing.pdf")
+        self.node_a.pdf_path = lambda key: broken if key == ("dev-A", 7) else pdf_path(key)
+
+        stats = self._sync(push=False)
+        self.assertEqual(stats["pulled"], 29)
+        self.assertEqual(len(stats["errors"]), 1)
+        seqs = {e["seq"] for e in HistoryStore(self.dir_b).entries() if e.get("origin") == "dev-A"}
+        self.assertNotIn(7, seqs)
+        self.assertFalse([n for n in os.listdir(self.dir_b) if n.endswith(".part")])
+
+        self.node_a.pdf_path = pdf_path
+        stats = self._sync(push=False)
+        self.assertEqual((stats["pulled"], stats["errors"]), (1, []))
+
+
+if __name__ == "__main__":
+    unittest.main()
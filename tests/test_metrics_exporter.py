@@ -0,0 +1,45 @@
+import unittest
+import urllib.error
+import urllib.request
+
+from app.metrics_exporter import CONTENT_TYPE, MetricsExporter
+from app.performance_monitor import SYSTEM_COLUMNS, PerformanceMonitor
+
+
+class MetricsExporterTest(unittest.TestCase):
+    def setUp(self):
+        self.monitor = PerformanceMonitor()
+        for duration in (0.1, 0.2, 0.3, 0.4):
+            self.monitor.record("pdf_render", duration)
+        self.monitor.incr("audit_events", "MASTER_BYPASS")
+        self.monitor.incr("audit_events", "MASTER_BYPASS")
+        self.monitor.system_metrics.append(**{c: 50.0 for c in SYSTEM_COLUMNS})
+        self.exporter = MetricsExporter(self.monitor, host="127.0.0.1", port=0).start()
+        self.addCleanup(self.exporter.stop)
+
+    def test_metrics_over_localhost(self):
+        with urllib.request.urlopen(self.exporter.url, timeout=5) as resp:
+            self.assertEqual(resp.status, 200)
+            self.assertEqual(resp.headers["Content-Type"], CONTENT_TYPE)
+            text = resp.read().decode("utf-8")
+
+        self.assertTrue(text.endswith("# EOF\n"))
+        lines = text.splitlines()
+        self.assertIn("# TYPE cnc_operation_duration_seconds summary", lines)
+        self.assertIn('cnc_operation_duration_seconds_count{name="pdf_render"} 4', lines)
+        self.assertTrue(any(l.startswith('cnc_operation_duration_seconds_sum{name="pdf_render"} 1.0') for l in lines))
+        self.assertTrue(any(l.startswith('cnc_operation_duration_seconds{name="pdf_render",quantile="0.95"} ')
+                            for l in lines))
+        self.assertIn("# TYPE cnc_audit_events counter", lines)
+        self.assertIn('cnc_audit_events_total{type="MASTER_BYPASS"} 2', lines)
+        self.assertIn("# TYPE cnc_system_cpu_ratio gauge", lines)
+        self.assertIn("cnc_system_cpu_ratio 0.5", lines)
+
+    def test_unknown_path_is_404(self):
+        with self.assertRaises(urllib.error.HTTPError) as cm:
+            urllib.request.urlopen(self.exporter.url.replace("/metrics", "/other"), timeout=5)
+        self.assertEqual(cm.exception.code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+
+from app.tracing import Tracer
+
+
+class SubtreeTest(unittest.TestCase):
+    def test_three_levels_of_nesting(self):
+        tracer = Tracer()
+        with tracer.span("other"):
+            pass
+        with tracer.span("finish_and_pdf"):
+            with tracer.span("generate_pdf"):
+                with tracer.span("shrink_image_to_jpeg_bytes"):
+                    pass
+                with tracer.span("shrink_image_to_jpeg_bytes"):
+                    pass
+            with tracer.span("save_json"):
+                pass
+
+        root = tracer.last_span("finish_and_pdf")
+        names = [s.name for s in tracer.subtree(root)]
+        self.assertEqual(names, ["finish_and_pdf", "generate_pdf", "shrink_image_to_jpeg_bytes",
+                                 "shrink_image_to_jpeg_bytes", "save_json"])
+
+    def test_export_with_root_name_keeps_grandchildren(self):
+        tracer = Tracer()
+        with tracer.span("a"):
+            with tracer.span("b"):
+                with tracer.span("c"):
+                    pass
+        spans = tracer.subtree(tracer.last_span("a"))
+        events = [e["name"] for e in tracer.chrome_trace(spans)["traceEvents"] if e["ph"] == "X"]
+        self.assertEqual(sorted(events), ["a", "b", "c"])
+
+
+if __name__ == "__main__":
+    unittest.main()